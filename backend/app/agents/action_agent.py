@@ -1,9 +1,123 @@
 import json
+from functools import lru_cache
 from typing import List, Optional
+from pydantic import TypeAdapter, ValidationError
 from app.models.schemas import AgentResponse, Suggestion, Customer, HistoryEntry
 from app.services.llm_service import llm_service
 from app.core.config import get_settings
 from app.utils.logger import app_logger
+from app.utils.prompt import recent_turns
+from app.utils.llm_parse import extract_llm_json, parse_llm_json
+
+_SETTINGS = get_settings()
+_ACTION_MODEL = _SETTINGS.ACTION_MODEL
+_FAST_PATH = _SETTINGS.ACTION_FAST_PATH
+_FAST_PATH_MIN_CONFIDENCE = _SETTINGS.ACTION_FAST_PATH_MIN_CONFIDENCE
+
+# Built once at import so a well-formed suggestion array is decoded and validated in a single pass by pydantic-core
+_SUGGESTION_LIST = TypeAdapter(List[Suggestion])
+
+# Static instructions sent as the system message; kept byte-identical across calls so the provider can cache the prefix
+_STATIC_ACTION_PREFIX = """
+    Вы - ассистент контакт-центра, помогающий оператору выбрать подходящие действия для общения с клиентом.
+    Ваша задача - предложить ровно 3 конкретных, разнообразных действия или ответа для оператора на основе:
+    1. Намерения клиента
+    2. Эмоционального состояния клиента
+    3. Информации из базы знаний
+    4. Персональных данных клиента (если доступны)
+    5. Истории диалога (если доступна)
+    Убедитесь, что предложения отличаются друг от друга по подходу (например, решение проблемы, предложение скидки, уточнение деталей)
+    и имеют разный уровень приоритета (1 - высокий, 2 - средний, 3 - низкий).
+    Ответ должен быть строго в формате JSON, как в примере ниже. Не добавляйте лишний текст или пояснения.
+    Все предложения должны быть на русском языке.
+    Пример ответа:
+    [
+        {
+            "text": "Предложите клиенту скидку 10% на следующий месяц для успокоения.",
+            "type": "discount_offer",
+            "priority": 2
+        },
+        {
+            "text": "Помогите клиенту решить проблему с подключением интернета, следуя инструкциям из базы знаний.",
+            "type": "problem_resolution",
+            "priority": 1
+        },
+        {
+            "text": "Уточните у клиента дополнительные детали о проблеме для более точного решения.",
+            "type": "clarification_request",
+            "priority": 3
+        }
+    ]
+    """
+
+# Fallback suggestions are fixed texts; Suggestion is frozen, so the same instances are safely shared by every response
+_NEGATIVE_EMOTIONS = frozenset({"angry", "frustrated", "negative"})
+_COMPENSATION_OFFER = Suggestion(
+    text="Предложите клиенту компенсацию или скидку для смягчения негативных эмоций.",
+    type="compensation_offer",
+    priority=1
+)
+_GENERAL_ASSISTANCE = Suggestion(
+    text="Поблагодарите клиента за обращение и предложите помощь в решении вопроса.",
+    type="general_assistance",
+    priority=2
+)
+_INTENT_SUGGESTIONS = {
+    "billing_issue": Suggestion(
+        text="Проверьте состояние счета клиента и предложите варианты оплаты или скидку.",
+        type="billing_resolution",
+        priority=1
+    ),
+    "technical_support": Suggestion(
+        text="Предложите пошаговую инструкцию для устранения технической проблемы.",
+        type="technical_solution",
+        priority=1
+    ),
+    "complaint": Suggestion(
+        text="Извинитесь за неудобства и предложите эскалацию вопроса менеджеру.",
+        type="complaint_handling",
+        priority=1
+    ),
+}
+_CLARIFICATION_REQUEST = Suggestion(
+    text="Уточните детали запроса клиента для более точного решения.",
+    type="clarification_request",
+    priority=3
+)
+_FOLLOW_UP = Suggestion(
+    text="Спросите клиента, есть ли дополнительные вопросы или проблемы, которые нужно решить.",
+    type="follow_up",
+    priority=3
+)
+
+# Display names of the customer services, in the order of the flags passed to _render_customer_block
+_SERVICE_NAMES = ("Мобильная связь", "Домашний интернет", "Домашнее ТВ")
+
+@lru_cache(maxsize=1024)
+def _render_customer_block(
+    is_mts_subscriber: bool,
+    tariff_plan: Optional[str],
+    has_mts_premium: bool,
+    uses_my_mts_app: bool,
+    has_mobile: bool,
+    has_home_internet: bool,
+    has_home_tv: bool
+) -> str:
+    """
+    Render the customer profile section of the suggestion prompt.
+    Memoized on the profile fields it reads, so repeat callers reuse the exact same string instead of re-rendering it.
+    """
+    flags = (has_mobile, has_home_internet, has_home_tv)
+    services = ", ".join(name for flag, name in zip(flags, _SERVICE_NAMES) if flag) or "Не указаны"
+    return f"""
+        Информация о клиенте:
+        - Абонент МТС: {'Да' if is_mts_subscriber else 'Нет'}
+        - Тарифный план: {tariff_plan or 'Не указан'}
+        - Подписка MTS Premium: {'Да' if has_mts_premium else 'Нет'}
+        - Использует приложение Мой МТС: {'Да' if uses_my_mts_app else 'Нет'}
+        - Услуги: {services}
+        Учитывайте эту информацию для персонализированных предложений (например, скидки для абонентов МТС Premium).
+        """
 
 async def suggest_actions(
     intent_response: AgentResponse,
@@ -17,11 +131,22 @@ async def suggest_actions(
     customer profile, and conversation history. Ensures personalized, prioritized suggestions in Russian
     for real-time contact center support. Returns a list of Suggestion objects.
     """
-    settings = get_settings()
     intent = intent_response.result.get("intent", "unknown")
     intent_confidence = intent_response.confidence or 0.0
     emotion = emotion_response.result.get("emotion", "neutral")
     emotion_confidence = emotion_response.confidence or 0.0
+
+    # A confidently classified turn with no knowledge hit and no history gives the LLM nothing beyond what the
+    # deterministic (intent, emotion) fallback mapping already encodes, so skip the round-trip
+    if (
+        _FAST_PATH
+        and intent_confidence >= _FAST_PATH_MIN_CONFIDENCE
+        and emotion_confidence >= _FAST_PATH_MIN_CONFIDENCE
+        and not history
+        and not knowledge_response.result.get("knowledge")
+    ):
+        app_logger.info("Action Agent: Serving rule-based suggestions for confident intent={}, emotion={}", intent, emotion)
+        return fallback_suggestions(intent, emotion)
     
     # Extract knowledge content if available, truncating for prompt brevity
     knowledge_content = ""
@@ -39,18 +164,17 @@ async def suggest_actions(
     app_logger.info(f"Action Agent: Generating suggestions for intent={intent}, emotion={emotion}")
 
     # Build customer context for personalized suggestions
-    customer_context = ""
     if customer_data:
-        app_logger.debug(f"Incorporating customer data for {customer_data.phone_number} into suggestions")
-        customer_context = f"""
-        Информация о клиенте:
-        - Абонент МТС: {'Да' if customer_data.is_mts_subscriber else 'Нет'}
-        - Тарифный план: {customer_data.tariff_plan or 'Не указан'}
-        - Подписка MTS Premium: {'Да' if customer_data.has_mts_premium else 'Нет'}
-        - Использует приложение Мой МТС: {'Да' if customer_data.uses_my_mts_app else 'Нет'}
-        - Услуги: {'Мобильная связь' if customer_data.has_mobile else ''}, {'Домашний интернет' if customer_data.has_home_internet else ''}, {'Домашнее ТВ' if customer_data.has_home_tv else ''}
-        Учитывайте эту информацию для персонализированных предложений (например, скидки для абонентов МТС Premium).
-        """
+        app_logger.debug("Incorporating customer data for {} into suggestions", customer_data.phone_number)
+        customer_context = _render_customer_block(
+            customer_data.is_mts_subscriber,
+            customer_data.tariff_plan,
+            customer_data.has_mts_premium,
+            customer_data.uses_my_mts_app,
+            customer_data.has_mobile,
+            customer_data.has_home_internet,
+            customer_data.has_home_tv
+        )
     else:
         app_logger.debug("No customer data provided, using generic suggestion logic")
         customer_context = "Информация о клиенте отсутствует. Используйте общие рекомендации без персонализации."
@@ -58,12 +182,11 @@ async def suggest_actions(
     # Build history context to avoid repetitive suggestions and enhance relevance
     history_context = ""
     if history and len(history) > 0:
-        app_logger.debug(f"Incorporating conversation history with {len(history)} turns into suggestions")
-        history_texts = []
-        for i, turn in enumerate(history[-3:], 1):  # Limit to last 3 turns for brevity
-            user_text = turn.user_text if turn.user_text else "Не указано"
-            op_response = turn.operator_response if turn.operator_response else "Ответ оператора отсутствует"
-            history_texts.append(f"Сообщение {i}: Клиент: '{user_text}' | Оператор: '{op_response}'")
+        app_logger.debug("Incorporating conversation history with {} turns into suggestions", len(history))
+        history_texts = [
+            f"Сообщение {i}: Клиент: '{user_text}' | Оператор: '{op_response}'"
+            for i, (user_text, op_response) in enumerate(recent_turns(history, max_turns=3), 1)  # Last 3 turns for brevity
+        ]
         history_context = f"""
         История диалога (последние {len(history_texts)} сообщений):
         {'; '.join(history_texts)}
@@ -73,80 +196,55 @@ async def suggest_actions(
         app_logger.debug("No conversation history provided, proceeding without historical context")
         history_context = "История диалога отсутствует. Базируйте предложения только на текущем сообщении."
 
-    # Construct a structured prompt for generating diverse, prioritized suggestions
+    # Only the per-call context goes in the prompt; the static instructions travel as the cached system prefix
+    # The customer block only changes with the profile, so it directly follows the static prefix and extends the reusable prefix for repeat callers
     prompt = f"""
-    Вы - ассистент контакт-центра, помогающий оператору выбрать подходящие действия для общения с клиентом.
-    Ваша задача - предложить ровно 3 конкретных, разнообразных действия или ответа для оператора на основе:
-    1. Намерения клиента
-    2. Эмоционального состояния клиента
-    3. Информации из базы знаний
-    4. Персональных данных клиента (если доступны)
-    5. Истории диалога (если доступна)
-    Убедитесь, что предложения отличаются друг от друга по подходу (например, решение проблемы, предложение скидки, уточнение деталей)
-    и имеют разный уровень приоритета (1 - высокий, 2 - средний, 3 - низкий).
-    Ответ должен быть строго в формате JSON, как в примере ниже. Не добавляйте лишний текст или пояснения.
-    Все предложения должны быть на русском языке.
-    Пример ответа:
-    [
-        {{
-            "text": "Предложите клиенту скидку 10% на следующий месяц для успокоения.",
-            "type": "discount_offer",
-            "priority": 2
-        }},
-        {{
-            "text": "Помогите клиенту решить проблему с подключением интернета, следуя инструкциям из базы знаний.",
-            "type": "problem_resolution",
-            "priority": 1
-        }},
-        {{
-            "text": "Уточните у клиента дополнительные детали о проблеме для более точного решения.",
-            "type": "clarification_request",
-            "priority": 3
-        }}
-    ]
-
+    {customer_context}
     Намерение клиента: {intent} (уверенность: {intent_confidence})
     Эмоциональное состояние клиента: {emotion} (уверенность: {emotion_confidence})
     Информация из базы знаний: {knowledge_content}
-    {customer_context}
     {history_context}
     Предложите ровно 3 действия для оператора в указанном формате:
     """
 
     try:
-        app_logger.debug(f"Action Agent: Sending prompt to LLM for intent={intent}, emotion={emotion}")
+        app_logger.debug("Action Agent: Sending prompt to LLM for intent={}, emotion={}", intent, emotion)
         response = await llm_service.call_llm(
             prompt=prompt,
-            model_name=settings.ACTION_MODEL,
-            temperature=0.6  # Moderate temperature for creative yet structured output
+            model_name=_ACTION_MODEL,
+            temperature=0.6,  # Moderate temperature for creative yet structured output
+            system_prompt=_STATIC_ACTION_PREFIX,
+            stop_at_json=True  # Only the suggestion array is parsed; stop reading once it closes
         )
         
         if not response:
             app_logger.error("Action Agent: No response received from LLM")
             return fallback_suggestions(intent, emotion)
 
-        app_logger.debug(f"Action Agent: Raw LLM response: {response[:200]}...")
+        app_logger.debug("Action Agent: Raw LLM response: {:.200}...", response)
         
-        # Clean and parse JSON response, removing markdown if present
-        response_cleaned = response.strip().replace("```json", "").replace("```", "")
+        # Parse the JSON response, skipping markdown fences if present
         try:
-            suggestions_data = json.loads(response_cleaned)
-            if not isinstance(suggestions_data, list):
-                app_logger.error(f"Action Agent: Expected list of suggestions, got {type(suggestions_data)}")
-                return fallback_suggestions(intent, emotion)
-
-            suggestions = []
-            for item in suggestions_data:
-                try:
-                    suggestion = Suggestion(
-                        text=item.get("text", ""),
-                        type=item.get("type", "general"),
-                        priority=item.get("priority", 1)
-                    )
-                    if suggestion.text:  # Add only if text is non-empty
-                        suggestions.append(suggestion)
-                except Exception as e:
-                    app_logger.warning(f"Action Agent: Invalid suggestion format in response: {item}, error: {str(e)}")
+            suggestions = _validate_suggestions(response)
+            if suggestions is None:
+                suggestions_data = parse_llm_json(response)
+                if not isinstance(suggestions_data, list):
+                    app_logger.error(f"Action Agent: Expected list of suggestions, got {type(suggestions_data)}")
+                    return fallback_suggestions(intent, emotion)
+
+                # Fall back to item-by-item parsing to fill in defaults and keep the valid suggestions
+                suggestions = []
+                for item in suggestions_data:
+                    try:
+                        suggestion = Suggestion(
+                            text=item.get("text", ""),
+                            type=item.get("type", "general"),
+                            priority=item.get("priority", 1)
+                        )
+                        if suggestion.text:  # Add only if text is non-empty
+                            suggestions.append(suggestion)
+                    except Exception as e:
+                        app_logger.warning(f"Action Agent: Invalid suggestion format in response: {item}, error: {str(e)}")
 
             # Ensure exactly 3 suggestions, using fallback if needed
             if len(suggestions) != 3:
@@ -170,60 +268,26 @@ async def suggest_actions(
         app_logger.error(f"Action Agent: Unexpected error during suggestion generation: {str(e)}")
         return fallback_suggestions(intent, emotion)
 
+def _validate_suggestions(response: str) -> Optional[List[Suggestion]]:
+    """
+    Decode and validate a well-formed suggestion array straight from the LLM answer in a single pydantic-core pass.
+    Returns the suggestions with non-empty text, or None when the answer needs the lenient item-by-item parsing.
+    """
+    segment = extract_llm_json(response)
+    if segment is None or segment[0] != "[":
+        return None
+    try:
+        return [suggestion for suggestion in _SUGGESTION_LIST.validate_json(segment) if suggestion.text]
+    except ValidationError:
+        return None
+
 def fallback_suggestions(intent: str, emotion: str) -> List[Suggestion]:
     """
     Generate fallback suggestions based on intent and emotion when LLM fails.
-    Returns up to 3 Suggestion objects tailored to contact center scenarios.
+    Returns 3 Suggestion objects tailored to contact center scenarios, picked from the prebuilt module-level set.
     """
     app_logger.info(f"Action Agent: Using fallback suggestions for intent={intent}, emotion={emotion}")
-    suggestions = []
-    
     # Emotion-based suggestion for handling customer sentiment
-    if emotion in ["angry", "frustrated", "negative"]:
-        suggestions.append(Suggestion(
-            text="Предложите клиенту компенсацию или скидку для смягчения негативных эмоций.",
-            type="compensation_offer",
-            priority=1
-        ))
-    else:
-        suggestions.append(Suggestion(
-            text="Поблагодарите клиента за обращение и предложите помощь в решении вопроса.",
-            type="general_assistance",
-            priority=2
-        ))
-
-    # Intent-based suggestion for targeted problem resolution
-    if intent == "billing_issue":
-        suggestions.append(Suggestion(
-            text="Проверьте состояние счета клиента и предложите варианты оплаты или скидку.",
-            type="billing_resolution",
-            priority=1
-        ))
-    elif intent == "technical_support":
-        suggestions.append(Suggestion(
-            text="Предложите пошаговую инструкцию для устранения технической проблемы.",
-            type="technical_solution",
-            priority=1
-        ))
-    elif intent == "complaint":
-        suggestions.append(Suggestion(
-            text="Извинитесь за неудобства и предложите эскалацию вопроса менеджеру.",
-            type="complaint_handling",
-            priority=1
-        ))
-    else:
-        suggestions.append(Suggestion(
-            text="Уточните детали запроса клиента для более точного решения.",
-            type="clarification_request",
-            priority=3
-        ))
-
-    # Add a generic follow-up if fewer than 3 suggestions
-    if len(suggestions) < 3:
-        suggestions.append(Suggestion(
-            text="Спросите клиента, есть ли дополнительные вопросы или проблемы, которые нужно решить.",
-            type="follow_up",
-            priority=3
-        ))
-
-    return suggestions[:3]
+    emotion_suggestion = _COMPENSATION_OFFER if emotion in _NEGATIVE_EMOTIONS else _GENERAL_ASSISTANCE
+    # Intent-based suggestion for targeted problem resolution, followed by a generic follow-up
+    return [emotion_suggestion, _INTENT_SUGGESTIONS.get(intent, _CLARIFICATION_REQUEST), _FOLLOW_UP]
@@ -0,0 +1,136 @@
+import asyncio
+from typing import List, Optional, Tuple
+from app.models.schemas import AgentResponse, HistoryEntry
+from app.services.llm_service import llm_service
+from app.services.intent_cache import intent_cache, compute_context_hash
+from app.agents import intent_agent, emotion_agent
+from app.core.config import get_settings
+from app.utils.logger import app_logger
+from app.utils.prompt import MAX_TEXT_CHARS, clip, recent_turns
+from app.utils.llm_parse import parse_llm_json
+
+_SETTINGS = get_settings()
+_INTENT_MODEL = _SETTINGS.INTENT_MODEL
+
+# Static instructions sent as the system message; built once so the prompt prefix is byte-identical across calls.
+# Categories come from the standalone agents so fused and standalone results are interchangeable.
+_STATIC_CLASSIFY_PREFIX = f"""
+    Вы - ассистент контакт-центра, специализирующийся на определении намерений и эмоциональной окраски сообщений клиентов.
+    Ваша задача - проанализировать сообщение или набор сообщений клиента на русском языке и определить основное намерение и общий эмоциональный тон.
+    Учитывайте историю диалога, если она доступна, чтобы понять контекст общения (например, нарастающее раздражение).
+    Если предоставлен набор сообщений, определите общее намерение и преобладающую эмоцию, объединяющие их содержание.
+    Ответ должен быть строго в формате JSON, как в примере ниже. Не добавляйте лишний текст или пояснения.
+    Если намерение неясно, используйте категорию "other". Если эмоция неясна, используйте категорию "neutral".
+    Пример ответа:
+    {{
+        "intent": "billing_issue",
+        "intent_confidence": 0.92,
+        "emotion": "angry",
+        "emotion_confidence": 0.85
+    }}
+    Возможные категории намерений: {', '.join(intent_agent.POSSIBLE_INTENTS)}.
+    Возможные категории эмоций: {', '.join(emotion_agent.POSSIBLE_EMOTIONS)}.
+    """
+
+
+async def classify(
+    text: str,
+    history: Optional[List[HistoryEntry]] = None,
+    context_hash: Optional[str] = None,
+    rolling_summary: Optional[str] = None
+) -> Tuple[AgentResponse, AgentResponse]:
+    """
+    Detect both the intent and the emotional tone of a user's message or batch of messages with a single LLM call.
+    Intent and emotion are read from the same text and history, so one fused prompt saves a full round-trip and the duplicated prompt tokens.
+    Returns a tuple of (intent AgentResponse, emotion AgentResponse) shaped exactly like the standalone agents' output.
+    Falls back to the standalone Intent and Emotion Agents when the intent is already cached or settled by a vote of labeled
+    neighbors, or when the fused response cannot be parsed.
+    An optional rolling_summary of turns older than the history window is prepended to the history context.
+    """
+    # A cached intent only leaves the emotion to detect, which the Emotion Agent handles on its own
+    if context_hash is None:
+        context_hash = compute_context_hash(history)
+    cached_intent, embedding = await intent_cache.lookup(text, context_hash)
+    if cached_intent is None:
+        # Similar messages the LLM has already labeled may settle the intent locally
+        cached_intent = await intent_cache.vote(text, context_hash, embedding)
+    if cached_intent is not None:
+        app_logger.info(f"Classify Agent: Intent served from cache, detecting emotion only for text: {text[:50]}")
+        emotion_result = await emotion_agent.detect_emotion(text, history=history)
+        return cached_intent, emotion_result
+
+    # Incorporate conversation history if available for better context
+    history_context = ""
+    if history and len(history) > 0:
+        app_logger.debug("Classify Agent: Incorporating history with {} turns for text: {:.50}", len(history), text)
+        # Latest turns that fit the history token budget, so long turns do not crowd out the message itself
+        history_texts = [f"Клиент: {user_text} | Оператор: {op_response}" for user_text, op_response in recent_turns(history)]
+        history_context = f"""
+        История диалога (последние {len(history_texts)} сообщений):
+        {'; '.join(history_texts)}
+        Учитывайте историю для более точного определения намерения и эмоционального тона.
+        """
+    else:
+        history_context = "История диалога отсутствует. Определяйте намерение и эмоцию только на основе текущего сообщения."
+    if rolling_summary:
+        # Earlier turns that no longer fit the history window still contribute through their summary
+        history_context = f"Краткое резюме более ранней части диалога: {rolling_summary}\n" + history_context
+
+    # Only the per-call context goes in the prompt; the static instructions travel as the cached system prefix
+    prompt = f"""
+    {history_context}
+    Сообщение(я) клиента для анализа: "{clip(text, MAX_TEXT_CHARS)}"
+    """
+    try:
+        app_logger.debug("Classify Agent: Sending fused prompt to LLM for text: {:.50}...", text)
+        response = await llm_service.call_llm(
+            prompt=prompt,
+            model_name=_INTENT_MODEL,
+            temperature=0.2,  # Low temperature for deterministic JSON output
+            system_prompt=_STATIC_CLASSIFY_PREFIX,
+            stop_at_json=True  # Only the JSON answer is parsed; stop reading once it closes
+        )
+        if not response:
+            raise ValueError("No response from LLM")
+
+        app_logger.debug("Classify Agent: Raw LLM response: {:.200}...", response)
+        result = parse_llm_json(response)
+
+        intent = result.get("intent", "other")
+        intent_confidence = result.get("intent_confidence", 0.0)
+        intent_defaulted = intent not in intent_agent.VALID_INTENTS
+        if intent_defaulted:
+            app_logger.warning(f"Classify Agent: Invalid intent '{intent}' detected, defaulting to 'other'")
+            intent = "other"
+            intent_confidence = 0.5  # Moderate confidence for fallback
+
+        emotion = result.get("emotion", "neutral")
+        emotion_confidence = result.get("emotion_confidence", 0.0)
+        if emotion not in emotion_agent.VALID_EMOTIONS:
+            app_logger.warning(f"Classify Agent: Invalid emotion '{emotion}' detected, defaulting to 'neutral'")
+            emotion = "neutral"
+            emotion_confidence = 0.5  # Moderate confidence for fallback
+
+        intent_result = AgentResponse(
+            agent_name="IntentAgent",
+            result={"intent": intent, "confidence": intent_confidence},
+            confidence=intent_confidence
+        )
+        emotion_result = AgentResponse(
+            agent_name="EmotionAgent",
+            result={"emotion": emotion, "confidence": emotion_confidence},
+            confidence=emotion_confidence
+        )
+        app_logger.info(f"Classify Agent: Detected intent '{intent}' ({intent_confidence}) and emotion '{emotion}' ({emotion_confidence}) for text: {text[:50]}")
+        # A defaulted intent is not the model's answer, so it must not be served to later messages from the cache
+        if not intent_defaulted:
+            await intent_cache.store(text, context_hash, intent_result, embedding)
+        return intent_result, emotion_result
+    except Exception as e:
+        # Fall back to the standalone agents, which carry their own parsing fallbacks and error reporting
+        app_logger.warning(f"Classify Agent: Fused classification failed for text '{text[:50]}...': {str(e)}. Falling back to separate agents.")
+        intent_result, emotion_result = await asyncio.gather(
+            intent_agent.detect_intent(text, history=history, context_hash=context_hash, rolling_summary=rolling_summary),
+            emotion_agent.detect_emotion(text, history=history)
+        )
+        return intent_result, emotion_result
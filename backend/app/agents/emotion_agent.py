@@ -1,9 +1,67 @@
+import hashlib
 import json
+import re
 from typing import List, Optional
 from app.models.schemas import AgentResponse, HistoryEntry
 from app.services.llm_service import llm_service
 from app.core.config import get_settings
+from app.utils.cache import LRUCache
 from app.utils.logger import app_logger
+from app.utils.prompt import MAX_TEXT_CHARS, clip, recent_turns
+from app.utils.llm_parse import parse_llm_json
+
+_SETTINGS = get_settings()
+_EMOTION_MODEL = _SETTINGS.EMOTION_MODEL
+
+# Short replies ("да", "спасибо", "не работает интернет") repeat heavily across dialogues; parsed (emotion, confidence)
+# pairs are cached under a digest of the exact prompt, which already covers the message text and the history tail it uses
+_RESPONSE_CACHE = LRUCache(maxsize=_SETTINGS.EMOTION_CACHE_SIZE, ttl=_SETTINGS.EMOTION_CACHE_TTL)
+
+# Predefined emotion categories for classification and fallback
+POSSIBLE_EMOTIONS = [
+    "neutral", "positive", "negative", "angry", "frustrated", "happy", "sad", "confused"
+]
+VALID_EMOTIONS = frozenset(POSSIBLE_EMOTIONS)  # Hash lookup for validating LLM answers; the list keeps the prompt order
+
+# Fallback scanning of non-JSON responses: one case-insensitive pass over whole-word emotion names, no lowercased copy
+_EMOTION_RE = re.compile(r"\b(" + "|".join(POSSIBLE_EMOTIONS) + r")\b", re.IGNORECASE)
+
+# Instructions, example and categories never change, so they are rendered once at import and sent as the system message
+_STATIC_EMOTION_PREFIX = f"""
+    Вы - ассистент контакт-центра, специализирующийся на анализе эмоциональной окраски сообщений клиентов.
+    Ваша задача - проанализировать сообщение или набор сообщений клиента на русском языке и определить их общий эмоциональный тон.
+    Учитывайте историю диалога, если она доступна, чтобы понять контекст общения (например, нарастающее раздражение).
+    Если предоставлен набор сообщений, определите преобладающую эмоцию, объединяющую их содержание.
+    Ответ должен быть строго в формате JSON, как в примере ниже. Не добавляйте лишний текст или пояснения.
+    Если эмоция неясна, используйте категорию "neutral".
+    Пример ответа:
+    {{
+        "emotion": "angry",
+        "confidence": 0.85
+    }}
+    Возможные категории эмоций: {', '.join(POSSIBLE_EMOTIONS)}.
+    """
+
+# Stock replies whose tone does not depend on the conversation, classified locally without an LLM round-trip.
+# Matched against the whole message after lowercasing and dropping punctuation, so only exact short replies qualify.
+_LEXICON_EMOTIONS = {
+    **dict.fromkeys(
+        ("спасибо", "спасибо большое", "большое спасибо", "благодарю", "спасибо за помощь", "отлично", "отлично спасибо", "супер"),
+        "positive"
+    ),
+    **dict.fromkeys(
+        ("здравствуйте", "добрый день", "добрый вечер", "доброе утро", "привет", "алло", "до свидания"),
+        "neutral"
+    ),
+}
+_LEXICON_CONFIDENCE = 0.9
+_PUNCTUATION_RE = re.compile(r"[^\w\s]+")
+
+def _lexicon_emotion(text: str) -> Optional[str]:
+    """Return the emotion of a stock reply from the local lexicon, or None when the message needs the LLM."""
+    if len(text) > 40:  # Longer than any lexicon phrase with punctuation; skip normalizing real messages
+        return None
+    return _LEXICON_EMOTIONS.get(" ".join(_PUNCTUATION_RE.sub(" ", text.lower()).split()))
 
 async def detect_emotion(text: str, history: Optional[List[HistoryEntry]] = None) -> AgentResponse:
     """
@@ -12,21 +70,21 @@ async def detect_emotion(text: str, history: Optional[List[HistoryEntry]] = None
     Returns an AgentResponse with the detected emotion and confidence score to aid operator response.
     Handles LLM response parsing failures with fallback logic.
     """
-    settings = get_settings()
-    # Predefined emotion categories for classification and fallback
-    possible_emotions = [
-        "neutral", "positive", "negative", "angry", "frustrated", "happy", "sad", "confused"
-    ]
-    
+    lexicon_emotion = _lexicon_emotion(text)
+    if lexicon_emotion is not None:
+        app_logger.info(f"Emotion Agent: Classified stock reply as '{lexicon_emotion}' locally for text: {text[:50]}")
+        return AgentResponse(
+            agent_name="EmotionAgent",
+            result={"emotion": lexicon_emotion, "confidence": _LEXICON_CONFIDENCE},
+            confidence=_LEXICON_CONFIDENCE
+        )
+
     # Incorporate conversation history if available for better emotional context
     history_context = ""
     if history and len(history) > 0:
-        app_logger.debug(f"Emotion Agent: Incorporating history with {len(history)} turns for text: {text[:50]}")
-        history_texts = []
-        for turn in history[-5:]:  # Limit to last 5 turns to manage token usage
-            user_text = turn.user_text if turn.user_text else "Не указано"
-            op_response = turn.operator_response if turn.operator_response else "Ответ оператора отсутствует"
-            history_texts.append(f"Клиент: {user_text} | Оператор: {op_response}")
+        app_logger.debug("Emotion Agent: Incorporating history with {} turns for text: {:.50}", len(history), text)
+        # Latest turns that fit the history token budget, so long turns do not crowd out the message itself
+        history_texts = [f"Клиент: {user_text} | Оператор: {op_response}" for user_text, op_response in recent_turns(history)]
         history_context = f"""
         История диалога (последние {len(history_texts)} сообщений):
         {'; '.join(history_texts)}
@@ -35,29 +93,30 @@ async def detect_emotion(text: str, history: Optional[List[HistoryEntry]] = None
     else:
         history_context = "История диалога отсутствует. Определяйте эмоцию только на основе текущего сообщения."
 
-    # Construct a structured prompt for precise emotion detection in Russian, supporting batch analysis
+    # Only the per-call context goes in the prompt; the static instructions travel as the cached system prefix
     prompt = f"""
-    Вы - ассистент контакт-центра, специализирующийся на анализе эмоциональной окраски сообщений клиентов.
-    Ваша задача - проанализировать сообщение или набор сообщений клиента на русском языке и определить их общий эмоциональный тон.
-    Учитывайте историю диалога, если она доступна, чтобы понять контекст общения (например, нарастающее раздражение).
-    Если предоставлен набор сообщений, определите преобладающую эмоцию, объединяющую их содержание.
-    Ответ должен быть строго в формате JSON, как в примере ниже. Не добавляйте лишний текст или пояснения.
-    Если эмоция неясна, используйте категорию "neutral".
-    Пример ответа:
-    {{
-        "emotion": "angry",
-        "confidence": 0.85
-    }}
-    Возможные категории эмоций: {', '.join(possible_emotions)}.
     {history_context}
-    Сообщение(я) клиента для анализа: "{text}"
+    Сообщение(я) клиента для анализа: "{clip(text, MAX_TEXT_CHARS)}"
     """
+    cache_key = hashlib.blake2b(prompt.encode("utf-8"), digest_size=16).digest()
+    cached = _RESPONSE_CACHE.get(cache_key)
+    if cached is not None:
+        emotion, confidence = cached
+        app_logger.info(f"Emotion Agent: Served emotion '{emotion}' from cache for text: {text[:50]}")
+        return AgentResponse(
+            agent_name="EmotionAgent",
+            result={"emotion": emotion, "confidence": confidence},
+            confidence=confidence
+        )
+
     try:
-        app_logger.debug(f"Emotion Agent: Sending prompt to LLM for text: {text[:50]}...")
+        app_logger.debug("Emotion Agent: Sending prompt to LLM for text: {:.50}...", text)
         response = await llm_service.call_llm(
             prompt=prompt,
-            model_name=settings.EMOTION_MODEL,
-            temperature=0.2  # Low temperature for deterministic JSON output
+            model_name=_EMOTION_MODEL,
+            temperature=0.2,  # Low temperature for deterministic JSON output
+            system_prompt=_STATIC_EMOTION_PREFIX,
+            stop_at_json=True  # Only the JSON answer is parsed; stop reading once it closes
         )
         
         if not response:
@@ -68,21 +127,22 @@ async def detect_emotion(text: str, history: Optional[List[HistoryEntry]] = None
                 error="No response from LLM"
             )
 
-        app_logger.debug(f"Emotion Agent: Raw LLM response: {response[:200]}...")
+        app_logger.debug("Emotion Agent: Raw LLM response: {:.200}...", response)
         
         # Parse JSON response, handling potential markdown formatting
         try:
-            response_cleaned = response.strip().replace("```json", "").replace("```", "")
-            result = json.loads(response_cleaned)
+            result = parse_llm_json(response)
             
             emotion = result.get("emotion", "neutral")
             confidence = result.get("confidence", 0.0)
             
             # Validate detected emotion against predefined categories
-            if emotion not in possible_emotions:
+            if emotion not in VALID_EMOTIONS:
                 app_logger.warning(f"Emotion Agent: Invalid emotion '{emotion}' detected, defaulting to 'neutral'")
                 emotion = "neutral"
                 confidence = 0.5  # Moderate confidence for fallback
+            else:
+                _RESPONSE_CACHE.set(cache_key, (emotion, confidence))  # Only well-formed answers are reused
             
             app_logger.info(f"Emotion Agent: Detected emotion '{emotion}' with confidence {confidence} for text: {text[:50]}")
             return AgentResponse(
@@ -93,15 +153,13 @@ async def detect_emotion(text: str, history: Optional[List[HistoryEntry]] = None
         except json.JSONDecodeError as jde:
             app_logger.warning(f"Emotion Agent: Failed to parse JSON from LLM response: {response[:100]}... Error: {str(jde)}")
             # Fallback to keyword search in response for emotion estimation
-            response_lower = response.lower()
-            fallback_emotion = "neutral"
-            fallback_confidence = 0.3  # Low confidence for fallback
-            
-            for emotion in possible_emotions:
-                if emotion in response_lower:
-                    fallback_emotion = emotion
-                    fallback_confidence = 0.6  # Higher confidence on keyword match
-                    break
+            match = _EMOTION_RE.search(response)
+            if match:
+                fallback_emotion = match.group(1).lower()
+                fallback_confidence = 0.6  # Higher confidence on keyword match
+            else:
+                fallback_emotion = "neutral"
+                fallback_confidence = 0.3  # Low confidence for fallback
             
             app_logger.info(f"Emotion Agent: Fallback emotion '{fallback_emotion}' with confidence {fallback_confidence} for text: {text[:50]}")
             return AgentResponse(
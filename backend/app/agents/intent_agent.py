@@ -1,32 +1,79 @@
 import json
+import re
 from typing import Dict, Any, List, Optional
 from app.models.schemas import AgentResponse, HistoryEntry
 from app.services.llm_service import llm_service
+from app.services.intent_cache import intent_cache, compute_context_hash
 from app.core.config import get_settings
 from app.utils.logger import app_logger
+from app.utils.prompt import MAX_TEXT_CHARS, clip, recent_turns
+from app.utils.llm_parse import first_unit_score, iter_json_scalars, parse_llm_json
 
-async def detect_intent(text: str, history: Optional[List[HistoryEntry]] = None) -> AgentResponse:
+_SETTINGS = get_settings()
+_INTENT_MODEL = _SETTINGS.INTENT_MODEL
+
+# Predefined intent categories for classification and fallback
+POSSIBLE_INTENTS = [
+    "billing_issue", "technical_support", "complaint", "product_info", "other"
+]
+VALID_INTENTS = frozenset(POSSIBLE_INTENTS)  # Hash lookup for validating LLM answers; the list keeps the prompt order
+
+# Fallback scanning of non-JSON responses: one compiled alternation over the human-readable intent names
+_INTENT_MAP = {intent.replace("_", " "): intent for intent in POSSIBLE_INTENTS}
+_INTENT_RE = re.compile("|".join(re.escape(name) for name in _INTENT_MAP))
+
+# Structured prompt for precise intent detection in Russian, supporting batch analysis.
+# Built once at import time and sent as the system message; per call only the history context and the message text form the prompt.
+_PROMPT_PREFIX = f"""
+    Вы - ассистент контакт-центра, специализирующийся на определении намерений клиента.
+    Ваша задача - проанализировать сообщение или набор сообщений клиента на русском языке и определить основное намерение.
+    Учитывайте историю диалога, если она доступна, чтобы понять контекст общения.
+    Если предоставлен набор сообщений, определите общее намерение, объединяющее их содержание.
+    Ответ должен быть строго в формате JSON, как в примере ниже. Не добавляйте лишний текст или пояснения.
+    Если намерение неясно, используйте категорию "other".
+    Пример ответа:
+    {{
+        "intent": "billing_issue",
+        "confidence": 0.92
+    }}
+    Возможные категории намерений: {', '.join(POSSIBLE_INTENTS)}.
+    """
+_PROMPT_TEXT_PREFIX = '\n    Сообщение(я) клиента для анализа: "'
+_PROMPT_SUFFIX = '"\n    '
+
+async def detect_intent(
+    text: str,
+    history: Optional[List[HistoryEntry]] = None,
+    context_hash: Optional[str] = None,
+    rolling_summary: Optional[str] = None
+) -> AgentResponse:
     """
     Detect the intent of a user's message or batch of messages using the MWS GPT API, leveraging conversation history for context.
     Accepts concatenated text from multiple messages for batch processing.
+    The context_hash scopes cached intents to the preceding turns; it is derived from history when not supplied.
+    An optional rolling_summary of turns older than the history window is prepended to the history context.
     Returns an AgentResponse with the detected intent and confidence score for operator guidance.
     Includes fallback logic to handle LLM response parsing failures.
     """
-    settings = get_settings()
-    # Predefined intent categories for classification and fallback
-    possible_intents = [
-        "billing_issue", "technical_support", "complaint", "product_info", "other"
-    ]
-    
+    # Serve repeated or near-duplicate messages from the intent cache to skip the LLM round-trip
+    if context_hash is None:
+        context_hash = compute_context_hash(history)
+    cached_response, embedding = await intent_cache.lookup(text, context_hash)
+    if cached_response is not None:
+        app_logger.info(f"Intent Agent: Served intent '{cached_response.result['intent']}' from cache for text: {text[:50]}")
+        return cached_response
+    # A confident vote of similar messages the LLM has already labeled classifies the text without an LLM call
+    voted_response = await intent_cache.vote(text, context_hash, embedding)
+    if voted_response is not None:
+        app_logger.info(f"Intent Agent: Intent '{voted_response.result['intent']}' settled by labeled neighbors for text: {text[:50]}")
+        return voted_response
+
     # Incorporate conversation history if available to improve intent accuracy
     history_context = ""
     if history and len(history) > 0:
-        app_logger.debug(f"Intent Agent: Incorporating history with {len(history)} turns for text: {text[:50]}")
-        history_texts = []
-        for turn in history[-5:]:  # Limit to last 5 turns to manage token usage
-            user_text = turn.user_text if turn.user_text else "Не указано"
-            op_response = turn.operator_response if turn.operator_response else "Ответ оператора отсутствует"
-            history_texts.append(f"Клиент: {user_text} | Оператор: {op_response}")
+        app_logger.debug("Intent Agent: Incorporating history with {} turns for text: {:.50}", len(history), text)
+        # Latest turns that fit the history token budget, so long turns do not crowd out the message itself
+        history_texts = [f"Клиент: {user_text} | Оператор: {op_response}" for user_text, op_response in recent_turns(history)]
         history_context = f"""
         История диалога (последние {len(history_texts)} сообщений):
         {'; '.join(history_texts)}
@@ -34,30 +81,20 @@ async def detect_intent(text: str, history: Optional[List[HistoryEntry]] = None)
         """
     else:
         history_context = "История диалога отсутствует. Определяйте намерение только на основе текущего сообщения."
+    if rolling_summary:
+        # Earlier turns that no longer fit the history window still contribute through their summary
+        history_context = f"Краткое резюме более ранней части диалога: {rolling_summary}\n" + history_context
 
-    # Construct a structured prompt for precise intent detection in Russian, supporting batch analysis
-    prompt = f"""
-    Вы - ассистент контакт-центра, специализирующийся на определении намерений клиента.
-    Ваша задача - проанализировать сообщение или набор сообщений клиента на русском языке и определить основное намерение.
-    Учитывайте историю диалога, если она доступна, чтобы понять контекст общения.
-    Если предоставлен набор сообщений, определите общее намерение, объединяющее их содержание.
-    Ответ должен быть строго в формате JSON, как в примере ниже. Не добавляйте лишний текст или пояснения.
-    Если намерение неясно, используйте категорию "other".
-    Пример ответа:
-    {{
-        "intent": "billing_issue",
-        "confidence": 0.92
-    }}
-    Возможные категории намерений: {', '.join(possible_intents)}.
-    {history_context}
-    Сообщение(я) клиента для анализа: "{text}"
-    """
+    # Only the history and the message vary per call; the prebuilt instructions travel as the system prefix
+    prompt = history_context + _PROMPT_TEXT_PREFIX + clip(text, MAX_TEXT_CHARS) + _PROMPT_SUFFIX
     try:
-        app_logger.debug(f"Intent Agent: Sending prompt to LLM for text: {text[:50]}...")
+        app_logger.debug("Intent Agent: Sending prompt to LLM for text: {:.50}...", text)
         response = await llm_service.call_llm(
             prompt=prompt,
-            model_name=settings.INTENT_MODEL,
-            temperature=0.2  # Low temperature for deterministic JSON output
+            model_name=_INTENT_MODEL,
+            temperature=0.2,  # Low temperature for deterministic JSON output
+            system_prompt=_PROMPT_PREFIX,
+            stop_at_json=True  # Only the JSON answer is parsed; stop reading once it closes
         )
         
         if not response:
@@ -68,40 +105,55 @@ async def detect_intent(text: str, history: Optional[List[HistoryEntry]] = None)
                 error="No response from LLM"
             )
 
-        app_logger.debug(f"Intent Agent: Raw LLM response: {response[:200]}...")
+        app_logger.debug("Intent Agent: Raw LLM response: {:.200}...", response)
         
         # Parse JSON response, handling potential markdown formatting
         try:
-            response_cleaned = response.strip().replace("```json", "").replace("```", "")
-            result = json.loads(response_cleaned)
+            result = parse_llm_json(response)
             
-            intent = result.get("intent", "unknown")
-            confidence = result.get("confidence", 0.0)
+            if isinstance(result, dict):
+                intent = result.get("intent", "unknown")
+                confidence = result.get("confidence", 0.0)
+            else:
+                intent, confidence = "unknown", 0.0
             
             # Validate detected intent against predefined categories
-            if intent not in possible_intents:
-                app_logger.warning(f"Intent Agent: Invalid intent '{intent}' detected, defaulting to 'other'")
-                intent = "other"
-                confidence = 0.5  # Moderate confidence for fallback
+            defaulted = False
+            if intent not in VALID_INTENTS:
+                # The model may have used other key names or nesting; take the first known label and score by value type
+                recovered = next(
+                    (value for value in iter_json_scalars(result) if isinstance(value, str) and value in VALID_INTENTS), None
+                )
+                if recovered is not None:
+                    app_logger.debug("Intent Agent: Recovered intent '{}' from unexpected JSON shape", recovered)
+                    intent = recovered
+                    confidence = first_unit_score(result, 0.5)
+                else:
+                    app_logger.warning(f"Intent Agent: Invalid intent '{intent}' detected, defaulting to 'other'")
+                    intent = "other"
+                    confidence = 0.5  # Moderate confidence for fallback
+                    defaulted = True
             
             app_logger.info(f"Intent Agent: Detected intent '{intent}' with confidence {confidence} for text: {text[:50]}")
-            return AgentResponse(
+            intent_response = AgentResponse(
                 agent_name="IntentAgent",
                 result={"intent": intent, "confidence": confidence},
                 confidence=confidence
             )
+            # Only intents the model actually produced are cached; fallbacks and errors are always recomputed
+            if not defaulted:
+                await intent_cache.store(text, context_hash, intent_response, embedding)
+            return intent_response
         except json.JSONDecodeError as jde:
             app_logger.warning(f"Intent Agent: Failed to parse JSON from LLM response: {response[:100]}... Error: {str(jde)}")
             # Fallback to keyword search in response for intent estimation
-            response_lower = response.lower()
-            fallback_intent = "other"
-            fallback_confidence = 0.3  # Low confidence for fallback
-            
-            for intent in possible_intents:
-                if intent.replace("_", " ") in response_lower:
-                    fallback_intent = intent
-                    fallback_confidence = 0.6  # Higher confidence on keyword match
-                    break
+            match = _INTENT_RE.search(response.lower())
+            if match:
+                fallback_intent = _INTENT_MAP[match.group(0)]
+                fallback_confidence = 0.6  # Higher confidence on keyword match
+            else:
+                fallback_intent = "other"
+                fallback_confidence = 0.3  # Low confidence for fallback
             
             app_logger.info(f"Intent Agent: Fallback intent '{fallback_intent}' with confidence {fallback_confidence} for text: {text[:50]}")
             return AgentResponse(
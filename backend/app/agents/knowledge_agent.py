@@ -1,12 +1,48 @@
 import json
-from typing import List, Dict
+import re
+from collections import Counter, defaultdict
+from typing import List, Dict, Set
 from app.models.schemas import AgentResponse, KnowledgeResult
 from app.services.vector_db import vector_db_service
 from app.services.llm_service import llm_service
 from app.core.config import get_settings
-from app.utils.logger import app_logger
+from app.utils.logger import DEBUG_ENABLED, app_logger
+from app.utils.semantic_cache import SemanticCache
 from app.data.knowledge_base import KNOWLEDGE_BASE
 
+_TOKEN_RE = re.compile(r"\w+")
+_STEM_CHARS = 5  # Words are indexed by their first characters, so inflected forms ("интернета", "интернет") still match
+_MIN_TOKEN_CHARS = 3  # Shorter words (prepositions, particles) would match nearly every entry and are not indexed
+
+_SETTINGS = get_settings()
+_KNOWLEDGE_MODEL = _SETTINGS.KNOWLEDGE_MODEL
+_TOP_K = _SETTINGS.KNOWLEDGE_TOP_K
+_RELEVANCE_THRESHOLD = _SETTINGS.KNOWLEDGE_RELEVANCE_THRESHOLD
+_CONTEXT_CHARS = _SETTINGS.KNOWLEDGE_CONTEXT_CHARS
+_DIRECT_ANSWER_THRESHOLD = _SETTINGS.KNOWLEDGE_DIRECT_ANSWER_THRESHOLD
+_DIRECT_ANSWER_MAX_CHARS = _SETTINGS.KNOWLEDGE_DIRECT_ANSWER_MAX_CHARS
+
+# Generated answers keyed by the query embedding, so repeated and near-duplicate questions skip retrieval and the LLM call
+_ANSWER_CACHE = SemanticCache(
+    maxsize=_SETTINGS.KNOWLEDGE_CACHE_SIZE,
+    threshold=_SETTINGS.KNOWLEDGE_CACHE_SIMILARITY_THRESHOLD
+)
+# Cleared by the vector DB service whenever the knowledge base is recreated or reindexed
+vector_db_service.knowledge_dependent_caches.append(_ANSWER_CACHE)
+
+# Payload keys read from knowledge base hits; the rest of the payload (e.g. content_hash) stays on the Qdrant side
+_PAYLOAD_FIELDS = ["query", "text", "sources"]
+
+# Answering rules never change, so they are defined once and sent as the system message
+_STATIC_KNOWLEDGE_PREFIX = """
+        Вы - ассистент контакт-центра, помогающий оператору ответить на запрос клиента.
+        Ваша задача - сформулировать точный, полезный и естественный ответ на основе предоставленной информации из базы знаний.
+        Учитывайте, что запрос может представлять собой набор сообщений клиента, поэтому ответ должен учитывать общий контекст.
+        Используйте только релевантные данные из контекста. Если информация недостаточна, укажите это.
+        Ответ должен быть на русском языке, кратким (не более 200 слов) и ориентированным на помощь клиенту.
+        Если контекст был сокращен, добавьте предупреждение, что информация может быть неполной.
+        """
+
 async def find_knowledge(text: str) -> AgentResponse:
     """
     Retrieve relevant information from the vector database using similarity search based on a batch of user messages.
@@ -15,65 +51,92 @@ async def find_knowledge(text: str) -> AgentResponse:
     Returns an AgentResponse with knowledge content and confidence score for operator support.
     Prioritizes relevant content over arbitrary truncation to avoid losing critical information.
     Falls back to static knowledge base if vector search fails.
+    Returns a short, near-exact top document verbatim without the LLM rewrite.
     """
-    settings = get_settings()
     try:
         app_logger.info(f"Knowledge Agent: Searching for relevant info for query: {text[:50]}...")
+        # The embedding is cached by the vector DB service, so the search below reuses it without another API call
+        query_vector = await vector_db_service.get_embedding(text)
+        if query_vector is not None:
+            cached = _ANSWER_CACHE.get(query_vector)
+            if cached is not None:
+                app_logger.debug("Knowledge Agent: Serving cached answer for query: {:.50}", text)
+                return cached
+
         # Query the vector DB service to get the top relevant documents
-        results = await vector_db_service.query_vector_db(text, top_k=5)  # Increased to 5 for debugging
+        results = await vector_db_service.query_vector_db(text, top_k=_TOP_K, payload_fields=_PAYLOAD_FIELDS)
         
         if not results:
             app_logger.warning(f"No relevant knowledge found for query: {text}")
             # Fallback to static knowledge base search
             return fallback_to_static_knowledge(text)
 
-        # Log retrieved documents for debugging
-        app_logger.debug(f"Knowledge Agent: Retrieved {len(results)} documents for query: {text[:50]}")
-        for i, result in enumerate(results):
-            app_logger.debug(f"Document {i+1}: Query='{result.get('query', 'unknown')}', Score={result.get('score', 0.0)}")
-
-        # Extract content and scores from top results with sufficient relevance
-        knowledge_chunks = []
-        sources = []
-        avg_relevance_score = 0.0
-        for result in results:
-            relevance_score = result.get("score", 0.0)
-            content = result.get("text", "")
-            query = result.get("query", "unknown")
-            source = result.get("sources", "")
-            
-            if relevance_score >= 0.7:
-                knowledge_chunks.append(f"Документ: {query}\nСодержание: {content}")
-                if source and source not in sources:
-                    sources.append(source)
-                avg_relevance_score += relevance_score
-        
-        if not knowledge_chunks:
-            app_logger.warning(f"No documents met relevance threshold (0.7) for query: {text}")
+        # Log retrieved documents for debugging; the per-document loop is skipped entirely unless debug records are kept
+        app_logger.debug("Knowledge Agent: Retrieved {} documents for query: {:.50}", len(results), text)
+        if DEBUG_ENABLED:
+            for i, result in enumerate(results):
+                app_logger.debug("Document {}: Query='{}', Score={}", i+1, result.get('query', 'unknown'), result.get('score', 0.0))
+
+        # Keep only results with sufficient relevance; Qdrant returns them best-first
+        relevant = [result for result in results if result.get("score", 0.0) >= _RELEVANCE_THRESHOLD]
+        if not relevant:
+            app_logger.warning(f"No documents met relevance threshold ({_RELEVANCE_THRESHOLD}) for query: {text}")
             # Fallback to static knowledge base search
             return fallback_to_static_knowledge(text)
 
-        avg_relevance_score /= len(knowledge_chunks)
-        context = "\n\n".join(knowledge_chunks)
-        # Increase truncation limit to retain more information, warn if truncated
-        truncation_limit = 2000  # Increased from 800 to balance token limits and information retention
+        # A short document matching the query almost exactly already is the answer; rewriting it would only cost an LLM round-trip
+        top_hit = relevant[0]
+        top_score = top_hit.get("score", 0.0)
+        top_text = top_hit.get("text", "")
+        if top_score >= _DIRECT_ANSWER_THRESHOLD and top_text and len(top_text) < _DIRECT_ANSWER_MAX_CHARS:
+            app_logger.info(f"Knowledge Agent: Direct answer from top document (score {top_score}, direct_hit=True) for query: {text[:50]}")
+            knowledge_result = KnowledgeResult(
+                document_id="direct_top_hit",
+                content=top_text,
+                relevance_score=top_score
+            )
+            knowledge_response = AgentResponse(
+                agent_name="KnowledgeAgent",
+                result={
+                    "knowledge": [knowledge_result.dict()],
+                    "sources": top_hit.get("sources") or "No sources available."
+                },
+                confidence=top_score
+            )
+            if query_vector is not None:
+                _ANSWER_CACHE.set(query_vector, knowledge_response)
+            return knowledge_response
+
+        avg_relevance_score = sum(result.get("score", 0.0) for result in relevant) / len(relevant)
+        # Several documents often cite the same article; dict keys dedupe the sources while keeping their order
+        sources = list(dict.fromkeys(result.get("sources", "") for result in relevant if result.get("sources")))
+
+        # Build the context chunk by chunk within the character budget instead of joining every document and slicing the result,
+        # so the budget goes to the best-ranked documents and text past it is never copied
+        truncation_limit = _CONTEXT_CHARS
         truncation_occurred = False
-        if len(context) > truncation_limit:
-            context = context[:truncation_limit] + "... (сокращено для обработки, часть информации может быть утеряна)"
-            truncation_occurred = True
+        parts = []
+        used = 0
+        for result in relevant:
+            chunk = f"Документ: {result.get('query', 'unknown')}\nСодержание: {result.get('text', '')}"
+            separator = 2 if parts else 0  # Length of the "\n\n" joining this chunk to the previous one
+            if used + separator + len(chunk) > truncation_limit:
+                remaining = truncation_limit - used - separator
+                if remaining > 0:
+                    parts.append(chunk[:remaining])
+                truncation_occurred = True
+                break
+            parts.append(chunk)
+            used += separator + len(chunk)
+        context = "\n\n".join(parts)
+        if truncation_occurred:
+            context += "... (сокращено для обработки, часть информации может быть утеряна)"
             app_logger.warning(f"Knowledge Agent: Context truncated to {truncation_limit} characters for query: {text[:50]}")
         else:
-            app_logger.debug(f"Knowledge Agent: Context length within limit ({len(context)} characters) for query: {text[:50]}")
+            app_logger.debug("Knowledge Agent: Context length within limit ({} characters) for query: {:.50}", len(context), text)
         
-        # Generate a concise response using LLM based on retrieved context, considering batch input
+        # Only the query and retrieved context vary per call; the answering rules travel as the cached system prefix
         prompt = f"""
-        Вы - ассистент контакт-центра, помогающий оператору ответить на запрос клиента.
-        Ваша задача - сформулировать точный, полезный и естественный ответ на основе предоставленной информации из базы знаний.
-        Учитывайте, что запрос может представлять собой набор сообщений клиента, поэтому ответ должен учитывать общий контекст.
-        Используйте только релевантные данные из контекста. Если информация недостаточна, укажите это.
-        Ответ должен быть на русском языке, кратким (не более 200 слов) и ориентированным на помощь клиенту.
-        Если контекст был сокращен, добавьте предупреждение, что информация может быть неполной.
-        
         Запрос клиента (или набор сообщений): {text}
         Контекст из базы знаний:
         {context}
@@ -81,11 +144,12 @@ async def find_knowledge(text: str) -> AgentResponse:
         Ответ для клиента:
         """
         
-        app_logger.debug(f"Knowledge Agent: Generating response for query: {text[:50]} with context length: {len(context)}")
+        app_logger.debug("Knowledge Agent: Generating response for query: {:.50} with context length: {}", text, len(context))
         generated_response = await llm_service.call_llm(
             prompt=prompt,
-            model_name=settings.KNOWLEDGE_MODEL,
-            temperature=0.5  # Moderate temperature for balanced output
+            model_name=_KNOWLEDGE_MODEL,
+            temperature=0.5,  # Moderate temperature for balanced output
+            system_prompt=_STATIC_KNOWLEDGE_PREFIX
         )
         
         if not generated_response:
@@ -116,7 +180,7 @@ async def find_knowledge(text: str) -> AgentResponse:
             app_logger.warning(f"Knowledge Agent: Generated response truncated to {truncation_limit} characters for query: {text[:50]}")
             truncation_occurred = True
         else:
-            app_logger.debug(f"Knowledge Agent: Generated response length within limit ({len(generated_response)} characters) for query: {text[:50]}")
+            app_logger.debug("Knowledge Agent: Generated response length within limit ({} characters) for query: {:.50}", len(generated_response), text)
 
         # Append a truncation warning to the response if truncation occurred at any stage
         if truncation_occurred:
@@ -129,7 +193,7 @@ async def find_knowledge(text: str) -> AgentResponse:
         )
 
         app_logger.info(f"Knowledge Agent: Generated response for query: {text[:50]} with avg score {avg_relevance_score}")
-        return AgentResponse(
+        knowledge_response = AgentResponse(
             agent_name="KnowledgeAgent",
             result={
                 "knowledge": [knowledge_result.dict()],
@@ -137,37 +201,58 @@ async def find_knowledge(text: str) -> AgentResponse:
             },
             confidence=avg_relevance_score
         )
+        # Only LLM-generated answers are cached; fallbacks are retried on the next request
+        if query_vector is not None:
+            _ANSWER_CACHE.set(query_vector, knowledge_response)
+        return knowledge_response
 
     except Exception as e:
         app_logger.error(f"Knowledge Agent failed for query {text}: {str(e)}")
         # Fallback to static knowledge base on exception
         return fallback_to_static_knowledge(text)
 
+def _stems(text: str) -> Set[str]:
+    """Return the distinct word stems of text used to match it against static knowledge base queries."""
+    return {token[:_STEM_CHARS] for token in _TOKEN_RE.findall(text.lower()) if len(token) >= _MIN_TOKEN_CHARS}
+
+def _build_static_index() -> Dict[str, List[int]]:
+    """Build an inverted index from query stems to the positions of the static knowledge base entries containing them."""
+    index: Dict[str, List[int]] = defaultdict(list)
+    for position, entry in enumerate(KNOWLEDGE_BASE):
+        for stem in _stems(entry.get("query", "")):
+            index[stem].append(position)
+    return dict(index)
+
+# Built once at import, so a fallback lookup costs one posting list per query word instead of a scan over every entry
+_STATIC_INDEX = _build_static_index()
+
 def fallback_to_static_knowledge(text: str) -> AgentResponse:
     """
     Fallback mechanism to search static KNOWLEDGE_BASE if vector search fails or returns no relevant results.
-    Searches for partial matches in query field and returns the first matching entry.
+    Looks up the query words in the prebuilt stem index and returns the entry sharing the most of them with the query,
+    preferring earlier entries on ties.
     """
     app_logger.info(f"Knowledge Agent: Falling back to static knowledge base for query: {text[:50]}")
-    text_lower = text.lower()
-    for entry in KNOWLEDGE_BASE:
-        query = entry.get("query", "").lower()
-        if text_lower in query or any(word in query for word in text_lower.split()):
-            app_logger.info(f"Knowledge Agent: Found matching static entry for query: {text[:50]} - {entry['query']}")
-            knowledge_result = KnowledgeResult(
-                document_id="static_fallback",
-                content=entry.get("correct_answer", "No content available."),
-                relevance_score=0.75  # Arbitrary confidence for fallback
-            )
-            return AgentResponse(
-                agent_name="KnowledgeAgent",
-                result={
-                    "knowledge": [knowledge_result.dict()],
-                    "sources": entry.get("correct_sources", "No sources available.")
-                },
-                confidence=0.75,
-                error="Vector search failed, using static knowledge base fallback."
-            )
+    overlap = Counter()
+    for stem in _stems(text):
+        overlap.update(_STATIC_INDEX.get(stem, ()))
+    if overlap:
+        entry = KNOWLEDGE_BASE[min(overlap, key=lambda position: (-overlap[position], position))]
+        app_logger.info(f"Knowledge Agent: Found matching static entry for query: {text[:50]} - {entry['query']}")
+        knowledge_result = KnowledgeResult(
+            document_id="static_fallback",
+            content=entry.get("correct_answer", "No content available."),
+            relevance_score=0.75  # Arbitrary confidence for fallback
+        )
+        return AgentResponse(
+            agent_name="KnowledgeAgent",
+            result={
+                "knowledge": [knowledge_result.dict()],
+                "sources": entry.get("correct_sources", "No sources available.")
+            },
+            confidence=0.75,
+            error="Vector search failed, using static knowledge base fallback."
+        )
     
     app_logger.warning(f"Knowledge Agent: No matching entry found in static knowledge base for query: {text[:50]}")
     return AgentResponse(
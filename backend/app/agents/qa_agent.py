@@ -1,21 +1,21 @@
+import hashlib
 import json
 from app.models.schemas import AgentResponse
 from app.services.llm_service import llm_service
 from app.core.config import get_settings
 from app.utils.logger import app_logger
+from app.utils.prompt import MAX_TEXT_CHARS, clip
+from app.utils.llm_parse import first_unit_score, iter_json_scalars, parse_llm_json
+from app.utils.cache import LRUCache
 
-async def check_quality(user_text: str, operator_response: str) -> AgentResponse:
-    """
-    Evaluates the quality of the operator's response based on predefined communication standards.
-    Uses an LLM to analyze tone, clarity, empathy, and adherence to guidelines in the context
-    of the user's message. Returns feedback and a confidence score to guide operator improvement.
-    Includes fallback logic for handling LLM failures. Only triggered after operator response.
-    """
-    settings = get_settings()
-    app_logger.info(f"QA Agent: Evaluating operator response for user text: {user_text[:50]}...")
+_SETTINGS = get_settings()
+_QA_MODEL = _SETTINGS.QA_MODEL
 
-    # Construct a structured prompt for quality assurance evaluation in Russian
-    prompt = f"""
+# Evaluations keyed by a digest of the exact message/response prompt, so a repeated exchange is graded once without an extra API call
+_EVALUATION_CACHE = LRUCache(maxsize=_SETTINGS.QA_CACHE_SIZE)
+
+# Evaluation criteria and example never change, so they are defined once and sent as the system message
+_STATIC_QA_PREFIX = """
     Вы - ассистент контакт-центра, специализирующийся на проверке качества ответов операторов.
     Ваша задача - проанализировать ответ оператора на сообщение клиента и оценить его по следующим критериям:
     1. Профессионализм (формальность, корректность тона)
@@ -25,21 +25,42 @@ async def check_quality(user_text: str, operator_response: str) -> AgentResponse
     Ответ должен быть строго в формате JSON, как в примере ниже. Не добавляйте лишний текст или пояснения.
     Включите конкретные замечания или рекомендации, если есть проблемы, либо подтверждение соответствия стандартам.
     Пример ответа:
-    {{
+    {
         "feedback": "Ответ оператора соответствует стандартам общения. Тон профессиональный, ответ полный и учитывает запрос клиента.",
         "confidence": 0.85
-    }}
-    Сообщение клиента: "{user_text}"
-    Ответ оператора: "{operator_response if operator_response else 'Ответ оператора отсутствует.'}"
+    }
+    """
+
+async def check_quality(user_text: str, operator_response: str) -> AgentResponse:
+    """
+    Evaluates the quality of the operator's response based on predefined communication standards.
+    Uses an LLM to analyze tone, clarity, empathy, and adherence to guidelines in the context
+    of the user's message. Returns feedback and a confidence score to guide operator improvement.
+    Includes fallback logic for handling LLM failures. Only triggered after operator response.
+    """
+    app_logger.info(f"QA Agent: Evaluating operator response for user text: {user_text[:50]}...")
+
+    # Only the two messages vary per call; the static evaluation criteria travel as the cached system prefix
+    prompt = f"""
+    Сообщение клиента: "{clip(user_text, MAX_TEXT_CHARS)}"
+    Ответ оператора: "{clip(operator_response, MAX_TEXT_CHARS) if operator_response else 'Ответ оператора отсутствует.'}"
     Оцените качество ответа оператора:
     """
+    cache_key = hashlib.blake2b(prompt.encode("utf-8"), digest_size=16).digest() if operator_response else None
+    if cache_key is not None:
+        cached = _EVALUATION_CACHE.get(cache_key)
+        if cached is not None:
+            app_logger.debug("QA Agent: Serving cached evaluation for user text: {:.50}", user_text)
+            return cached
 
     try:
-        app_logger.debug(f"QA Agent: Sending prompt to LLM for quality check.")
+        app_logger.debug("QA Agent: Sending prompt to LLM for quality check.")
         response = await llm_service.call_llm(
             prompt=prompt,
-            model_name=settings.QA_MODEL,
-            temperature=0.3  # Low temperature for factual and structured feedback
+            model_name=_QA_MODEL,
+            temperature=0.3,  # Low temperature for factual and structured feedback
+            system_prompt=_STATIC_QA_PREFIX,
+            stop_at_json=True  # Only the JSON answer is parsed; stop reading once it closes
         )
         
         if not response:
@@ -51,22 +72,32 @@ async def check_quality(user_text: str, operator_response: str) -> AgentResponse
                 error="No response from LLM"
             )
 
-        app_logger.debug(f"QA Agent: Raw LLM response: {response[:200]}...")
+        app_logger.debug("QA Agent: Raw LLM response: {:.200}...", response)
         
         # Parse JSON response, handling potential markdown formatting
         try:
-            response_cleaned = response.strip().replace("```json", "").replace("```", "")
-            result = json.loads(response_cleaned)
+            result = parse_llm_json(response)
             
-            feedback = result.get("feedback", "Не удалось оценить качество ответа.")
-            confidence = result.get("confidence", 0.5)
+            if isinstance(result, dict) and "feedback" in result:
+                feedback = result["feedback"]
+                confidence = result.get("confidence", 0.5)
+            else:
+                # Unexpected key names or nesting: the feedback is the first text value and the score the first number in [0, 1]
+                feedback = next(
+                    (value for value in iter_json_scalars(result) if isinstance(value, str) and value.strip()),
+                    "Не удалось оценить качество ответа."
+                )
+                confidence = first_unit_score(result, 0.5)
             
             app_logger.info(f"QA Agent: Generated feedback with confidence {confidence}")
-            return AgentResponse(
+            qa_response = AgentResponse(
                 agent_name="QAAgent",
                 result={"feedback": feedback, "confidence": confidence},
                 confidence=confidence
             )
+            if cache_key is not None:
+                _EVALUATION_CACHE.set(cache_key, qa_response)
+            return qa_response
         except json.JSONDecodeError as jde:
             app_logger.warning(f"QA Agent: Failed to parse JSON from LLM response: {response[:100]}... Error: {str(jde)}")
             return AgentResponse(
@@ -1,9 +1,44 @@
+import asyncio
 import json
-from typing import List, Optional
+from typing import Dict, List, Optional
 from app.models.schemas import AgentResponse, HistoryEntry
 from app.services.llm_service import llm_service
+from app.services.vector_db import vector_db_service
 from app.core.config import get_settings
+from app.utils.cache import LRUCache
 from app.utils.logger import app_logger
+from app.utils.prompt import MAX_TEXT_CHARS, MAX_TURN_CHARS, clip, recent_turns
+from app.utils.llm_parse import parse_llm_json
+
+_SETTINGS = get_settings()
+_SUMMARY_MODEL = _SETTINGS.SUMMARY_MODEL
+
+MAX_ROLLING_SUMMARY_CHARS = 1000  # Upper bound on a rolling summary kept and inlined into prompts (~200 tokens of Russian text)
+
+# Per-customer summaries of the turns that have left the prompt history window: (highest turn_seq folded in, summary)
+_ROLLING_SUMMARIES = LRUCache(maxsize=_SETTINGS.ROLLING_SUMMARY_CACHE_SIZE)
+# Background summary updates in flight per customer, so overlapping analyses do not fold the same turns twice
+_ROLLING_UPDATES: Dict[str, asyncio.Task] = {}
+
+# Instructions and example never change, so they are defined once and sent as the system message
+_STATIC_SUMMARY_PREFIX = """
+    Вы - ассистент контакт-центра, специализирующийся на создании кратких резюме диалогов.
+    Ваша задача - проанализировать историю диалога и/или последнее сообщение клиента и создать краткое резюме на русском языке.
+    Резюме должно содержать ключевые моменты беседы (например, основные проблемы, запросы клиента, решения).
+    Ответ должен быть строго в формате JSON, как в примере ниже. Не добавляйте лишний текст или пояснения.
+    Пример ответа:
+    {
+        "summary": "Клиент пожаловался на проблему с интернетом, оператор предложил перезагрузить роутер.",
+        "confidence": 0.9
+    }
+    """
+
+_STATIC_ROLLING_PREFIX = """
+    Вы - ассистент контакт-центра, который ведет краткое резюме длинного диалога с клиентом.
+    Обновите текущее резюме, добавив в него ключевые моменты новых сообщений (проблемы, запросы клиента, принятые решения).
+    Резюме должно быть на русском языке и не длиннее 3-4 предложений.
+    Ответьте только текстом обновленного резюме, без пояснений и форматирования.
+    """
 
 async def summarize_conversation(history: List[HistoryEntry], latest_user_text: Optional[str] = None) -> AgentResponse:
     """
@@ -11,17 +46,16 @@ async def summarize_conversation(history: List[HistoryEntry], latest_user_text:
     Uses history context and optionally the latest user message to generate a summary in Russian.
     Handles LLM response parsing failures with fallback logic.
     """
-    settings = get_settings()
-    app_logger.info(f"Summary Agent: Summarizing conversation with {len(history)} turns")
+    app_logger.info("Summary Agent: Summarizing conversation with {} turns", len(history))
     
     # Build conversation context from history
     history_context = ""
     if history and len(history) > 0:
-        history_texts = []
-        for i, turn in enumerate(history[-5:], 1):  # Limit to last 5 turns for brevity
-            user_text = turn.user_text if turn.user_text else "Не указано"
-            op_response = turn.operator_response if turn.operator_response else "Ответ оператора отсутствует"
-            history_texts.append(f"Сообщение {i}: Клиент: '{user_text}' | Оператор: '{op_response}'")
+        # Latest turns that fit the history token budget, so long turns do not crowd out the rest of the prompt
+        history_texts = [
+            f"Сообщение {i}: Клиент: '{user_text}' | Оператор: '{op_response}'"
+            for i, (user_text, op_response) in enumerate(recent_turns(history), 1)
+        ]
         history_context = f"""
         История диалога (последние {len(history_texts)} сообщений):
         {'; '.join(history_texts)}
@@ -33,31 +67,24 @@ async def summarize_conversation(history: List[HistoryEntry], latest_user_text:
     # Include latest user text if provided
     latest_text_context = ""
     if latest_user_text:
-        latest_text_context = f"Последнее сообщение клиента: '{latest_user_text}'"
-        app_logger.debug(f"Summary Agent: Including latest user text: {latest_user_text[:50]}...")
+        latest_text_context = f"Последнее сообщение клиента: '{clip(latest_user_text, MAX_TEXT_CHARS)}'"
+        app_logger.debug("Summary Agent: Including latest user text: {:.50}...", latest_user_text)
     else:
         app_logger.debug("Summary Agent: No latest user text provided, summarizing based on history only.")
 
-    # Construct prompt for summarizing conversation history
+    # Only the conversation varies per call; the instructions and example travel as the cached system prefix
     prompt = f"""
-    Вы - ассистент контакт-центра, специализирующийся на создании кратких резюме диалогов.
-    Ваша задача - проанализировать историю диалога и/или последнее сообщение клиента и создать краткое резюме на русском языке.
-    Резюме должно содержать ключевые моменты беседы (например, основные проблемы, запросы клиента, решения).
-    Ответ должен быть строго в формате JSON, как в примере ниже. Не добавляйте лишний текст или пояснения.
-    Пример ответа:
-    {{
-        "summary": "Клиент пожаловался на проблему с интернетом, оператор предложил перезагрузить роутер.",
-        "confidence": 0.9
-    }}
     {history_context}
     {latest_text_context if latest_text_context else 'Последнее сообщение клиента отсутствует.'}
     """
     try:
-        app_logger.debug(f"Summary Agent: Sending prompt to LLM for conversation summary.")
+        app_logger.debug("Summary Agent: Sending prompt to LLM for conversation summary.")
         response = await llm_service.call_llm(
             prompt=prompt,
-            model_name=settings.SUMMARY_MODEL,
-            temperature=0.3  # Low temperature for factual summaries
+            model_name=_SUMMARY_MODEL,
+            temperature=0.3,  # Low temperature for factual summaries
+            system_prompt=_STATIC_SUMMARY_PREFIX,
+            stop_at_json=True  # Only the JSON answer is parsed; stop reading once it closes
         )
         
         if not response:
@@ -68,17 +95,16 @@ async def summarize_conversation(history: List[HistoryEntry], latest_user_text:
                 error="No response from LLM"
             )
 
-        app_logger.debug(f"Summary Agent: Raw LLM response: {response[:200]}...")
+        app_logger.debug("Summary Agent: Raw LLM response: {:.200}...", response)
         
         # Parse JSON response, handling potential markdown formatting
         try:
-            response_cleaned = response.strip().replace("```json", "").replace("```", "")
-            result = json.loads(response_cleaned)
+            result = parse_llm_json(response)
             
             summary = result.get("summary", "Не удалось сгенерировать резюме.")
             confidence = result.get("confidence", 0.0)
             
-            app_logger.info(f"Summary Agent: Generated summary with confidence {confidence}")
+            app_logger.info("Summary Agent: Generated summary with confidence {}", confidence)
             return AgentResponse(
                 agent_name="SummaryAgent",
                 result={"summary": summary, "confidence": confidence},
@@ -100,3 +126,65 @@ async def summarize_conversation(history: List[HistoryEntry], latest_user_text:
             confidence=0.0,
             error=f"Unexpected error: {str(e)}"
         )
+
+def rolling_summary(phone_number: str, older_turns: List[HistoryEntry]) -> Optional[str]:
+    """
+    Return the rolling summary of a customer's turns that no longer fit the prompt history window, or None if there is none yet.
+    Turns in older_turns that the summary does not cover yet are folded into it by a background LLM call, one batch of new
+    turns at a time, so the analysis never waits for it; the next analysis of the conversation picks up the updated summary.
+    Coverage is tracked by the storage turn_seq rather than timestamps, which may be empty or repeat across entries.
+    """
+    cached = _ROLLING_SUMMARIES.get(phone_number)
+    covered_seq, summary = cached if cached is not None else (-1, None)
+    new_turns = [turn for turn in older_turns if turn.turn_seq > covered_seq]
+    if new_turns and phone_number not in _ROLLING_UPDATES:
+        task = asyncio.create_task(_fold_into_summary(phone_number, summary, new_turns))
+        _ROLLING_UPDATES[phone_number] = task
+        task.add_done_callback(lambda done: _finish_rolling_update(phone_number, done))
+    return summary
+
+def _finish_rolling_update(phone_number: str, task: asyncio.Task) -> None:
+    """Release a finished summary update, unless a reset already replaced it with a newer one."""
+    if _ROLLING_UPDATES.get(phone_number) is task:
+        del _ROLLING_UPDATES[phone_number]
+
+def forget_rolling_summary(phone_number: str) -> None:
+    """
+    Drop a customer's rolling summary and cancel its in-flight update once their conversation history is deleted,
+    so a reassigned number's new owner is never classified with the previous owner's conversation.
+    """
+    _ROLLING_SUMMARIES.pop(phone_number)
+    task = _ROLLING_UPDATES.pop(phone_number, None)
+    if task is not None:
+        task.cancel()
+
+vector_db_service.customer_reset_hooks.append(forget_rolling_summary)
+
+async def _fold_into_summary(phone_number: str, summary: Optional[str], turns: List[HistoryEntry]) -> None:
+    """Fold turns into a customer's rolling summary with one LLM call; the stored summary is kept unchanged if the call fails."""
+    turn_texts = "; ".join(
+        f"Клиент: {clip(turn.user_text, MAX_TURN_CHARS) if turn.user_text else 'Не указано'} | "
+        f"Оператор: {clip(turn.operator_response, MAX_TURN_CHARS) if turn.operator_response else 'Ответ оператора отсутствует'}"
+        for turn in turns
+    )
+    prompt = f"""
+    Текущее резюме: {summary if summary else 'Резюме пока отсутствует.'}
+    Новые сообщения: {turn_texts}
+    Обновленное резюме:
+    """
+    try:
+        response = await llm_service.call_llm(
+            prompt=prompt,
+            model_name=_SUMMARY_MODEL,
+            temperature=0.3,  # Low temperature for factual summaries
+            system_prompt=_STATIC_ROLLING_PREFIX
+        )
+    except Exception as e:
+        app_logger.warning(f"Summary Agent: Rolling summary update failed for customer {phone_number}: {str(e)}")
+        return
+    if not response or not response.strip():
+        app_logger.warning(f"Summary Agent: No rolling summary received from LLM for customer {phone_number}")
+        return
+    covered_seq = max(turn.turn_seq for turn in turns)
+    _ROLLING_SUMMARIES.set(phone_number, (covered_seq, clip(response.strip(), MAX_ROLLING_SUMMARY_CHARS)))
+    app_logger.debug("Summary Agent: Folded {} turns into rolling summary for customer {}", len(turns), phone_number)
@@ -1,12 +1,17 @@
+from operator import attrgetter
 from fastapi import APIRouter, HTTPException, status, Body, Query
 from app.models.schemas import CustomerCreateRequest, CustomerCreateResponse, CustomerRetrieveResponse, Customer
 from app.services.vector_db import vector_db_service
 from app.utils.logger import app_logger, log_customer_creation, log_customer_retrieval
-import asyncio
+from app.utils.phone import PHONE_NUMBER_ERROR, normalize_phone_number
 from typing import List, Optional
 
 router = APIRouter()
 
+# Profile fields whose change on an existing number hints at a reassigned or conflicting profile
+_CRITICAL_FIELDS = ("is_mts_subscriber", "tariff_plan", "has_mts_premium", "has_mobile", "has_home_internet", "has_home_tv")
+_get_critical_fields = attrgetter(*_CRITICAL_FIELDS)
+
 @router.post(
     "/create",
     response_model=CustomerCreateResponse,
@@ -37,27 +42,27 @@ async def create_customer(
         # Check for existing customer profile
         existing_customer = await vector_db_service.retrieve_customer(customer_data.phone_number)
         operation_type = "Updating" if existing_customer else "Creating"
-        app_logger.info(f"{operation_type} customer profile for {customer_data.phone_number}")
+        app_logger.info("{} customer profile for {}", operation_type, customer_data.phone_number)
 
         # If customer exists, log differences for critical fields to detect potential conflicts
         if existing_customer:
-            differences = []
-            critical_fields = ["is_mts_subscriber", "tariff_plan", "has_mts_premium", "has_mobile", "has_home_internet", "has_home_tv"]
-            for field in critical_fields:
-                existing_value = getattr(existing_customer, field)
-                new_value = getattr(customer_data, field)
-                if existing_value != new_value:
-                    differences.append(f"{field}: old={existing_value}, new={new_value}")
-            if differences:
+            existing_values = _get_critical_fields(existing_customer)
+            new_values = _get_critical_fields(customer_data)
+            if existing_values != new_values:
+                differences = [
+                    f"{field}: old={existing_value}, new={new_value}"
+                    for field, existing_value, new_value in zip(_CRITICAL_FIELDS, existing_values, new_values)
+                    if existing_value != new_value
+                ]
                 app_logger.warning(f"Data consistency warning for {customer_data.phone_number}: Differences detected - {'; '.join(differences)}")
             else:
-                app_logger.debug(f"No significant differences detected for existing customer {customer_data.phone_number}")
-            # Delete old history to prevent data leakage for reassigned numbers
-            app_logger.info(f"Deleting old history for {customer_data.phone_number} before updating profile to handle potential reassignment.")
-            await vector_db_service.delete_customer_and_history(customer_data.phone_number)
-
-        # Upsert customer data to Qdrant
-        success = await vector_db_service.upsert_customer(customer_data)
+                app_logger.debug("No significant differences detected for existing customer {}", customer_data.phone_number)
+            # Delete old history to prevent data leakage for reassigned numbers, overwriting the profile in the same round-trip
+            app_logger.info("Deleting old history for {} before updating profile to handle potential reassignment.", customer_data.phone_number)
+            success = await vector_db_service.replace_customer(customer_data)
+        else:
+            # Upsert customer data to Qdrant
+            success = await vector_db_service.upsert_customer(customer_data)
         if not success:
             log_customer_creation(customer_data.phone_number, False, "Failed to store customer profile.")
             raise HTTPException(
@@ -107,12 +112,12 @@ async def retrieve_customer(phone_number: str):
     """
     try:
         # Normalize and validate phone number using the same logic as Pydantic validator
-        cleaned_phone = ''.join(filter(str.isdigit, phone_number))
-        if len(cleaned_phone) != 11 or not cleaned_phone.startswith('89'):
+        cleaned_phone = normalize_phone_number(phone_number)
+        if cleaned_phone is None:
             log_customer_retrieval(phone_number, False)
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Phone number must be 11 digits starting with '89' (format: 89XXXXXXXXX)."
+                detail=PHONE_NUMBER_ERROR
             )
 
         customer = await vector_db_service.retrieve_customer(cleaned_phone)
@@ -165,15 +170,15 @@ async def delete_customer(phone_number: str):
     """
     try:
         # Normalize and validate phone number
-        cleaned_phone = ''.join(filter(str.isdigit, phone_number))
-        if len(cleaned_phone) != 11 or not cleaned_phone.startswith('89'):
+        cleaned_phone = normalize_phone_number(phone_number)
+        if cleaned_phone is None:
             app_logger.error(f"Invalid phone number format for deletion: {phone_number}")
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Phone number must be 11 digits starting with '89' (format: 89XXXXXXXXX)."
+                detail=PHONE_NUMBER_ERROR
             )
 
-        app_logger.info(f"Deleting customer profile and history for {cleaned_phone}")
+        app_logger.info("Deleting customer profile and history for {}", cleaned_phone)
         success = await vector_db_service.delete_customer_and_history(cleaned_phone)
         if not success:
             app_logger.error(f"Failed to delete customer profile and history for {cleaned_phone}")
@@ -181,7 +186,7 @@ async def delete_customer(phone_number: str):
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"No customer found with phone number {cleaned_phone} or deletion failed."
             )
-        app_logger.info(f"Successfully deleted customer profile and history for {cleaned_phone}")
+        app_logger.info("Successfully deleted customer profile and history for {}", cleaned_phone)
         return {"status": "success", "message": f"Customer profile and associated history deleted for {cleaned_phone}."}
     except HTTPException as he:
         app_logger.error(f"Error deleting customer profile for {phone_number}: {str(he.detail)}")
@@ -222,8 +227,7 @@ async def list_customers(
     try:
         app_logger.info(f"Listing customers with limit={limit}, offset={offset}, include_history={include_history}")
         # Use Qdrant scroll API to paginate through customers
-        search_result = await asyncio.to_thread(
-            vector_db_service.client.scroll,
+        search_result = await vector_db_service.client.scroll(
             collection_name=vector_db_service.customers_collection_name,
             limit=limit,
             offset=offset,
@@ -235,8 +239,7 @@ async def list_customers(
         next_offset = search_result[1]  # Next offset for pagination
         
         customers = []
-        total_count = (await asyncio.to_thread(
-            vector_db_service.client.get_collection,
+        total_count = (await vector_db_service.client.get_collection(
             collection_name=vector_db_service.customers_collection_name
         )).points_count
         
@@ -4,6 +4,7 @@ from app.models.schemas import UserMessageInput, ProcessingResultOutput, Operato
 from app.core.orchestrator import analyze_conversation, process_automated_agents
 from app.services.vector_db import vector_db_service
 from app.utils.logger import app_logger, log_message_processing, log_history_storage
+from app.utils.phone import PHONE_NUMBER_ERROR, normalize_phone_number
 from app.core.state import customer_queue, active_conversation, queue_lock
 from datetime import datetime, timezone
 
@@ -48,8 +49,8 @@ async def handle_process_message(
                 detail=f"Ошибка: Профиль клиента с номером телефона {payload.phone_number} не найден. Пожалуйста, создайте профиль перед обработкой сообщений."
             )
         
-        # Store the message in history without operator response
-        from datetime import datetime, timezone
+        # Store the message in history without operator response. The write is awaited so that /analyze,
+        # /submit_operator_response and the unanswered-turn scans read it back, and a failed write is reported to the caller
         timestamp = datetime.now(timezone.utc).isoformat()
         stored_timestamp = await vector_db_service.store_conversation_turn(
             phone_number=payload.phone_number,
@@ -342,8 +343,8 @@ async def submit_operator_response(
 
         # Check for remaining unanswered messages and update queue if none exist
         async with queue_lock:
-            history_data = await vector_db_service.retrieve_conversation_history(payload.phone_number, limit=50)
-            has_unanswered = any(entry["user_text"].strip() and not any(e["timestamp"] == entry["timestamp"] and e["role"] == "assistant" for e in history_data) for entry in history_data if entry["role"] == "user")
+            history_columns = await vector_db_service.retrieve_conversation_columns(payload.phone_number, limit=50)
+            has_unanswered = vector_db_service.latest_unanswered_index(history_columns) is not None
             if not has_unanswered and payload.phone_number in customer_queue:
                 customer_queue.remove(payload.phone_number)
                 app_logger.info(f"Removed customer {payload.phone_number} from queue as no unanswered messages remain. Queue length: {len(customer_queue)}")
@@ -411,12 +412,12 @@ async def trigger_automated_agents(phone_number: str, timestamp: Optional[str] =
     """
     try:
         # Normalize and validate phone number
-        cleaned_phone = ''.join(filter(str.isdigit, phone_number))
-        if len(cleaned_phone) != 11 or not cleaned_phone.startswith('89'):
+        cleaned_phone = normalize_phone_number(phone_number)
+        if cleaned_phone is None:
             log_message_processing(phone_number, "FAILED", "Invalid phone number format.")
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Phone number must be 11 digits starting with '89' (format: 89XXXXXXXXX)."
+                detail=PHONE_NUMBER_ERROR
             )
 
         log_message_processing(cleaned_phone, "STARTED", f"Manually triggering automated agents for {'timestamp ' + timestamp if timestamp else 'the most recent turn'}.")
@@ -618,8 +619,8 @@ async def cleanup_queue():
             initial_length = len(customer_queue)
             customers_to_remove = []
             for phone_number in customer_queue:
-                history = await vector_db_service.retrieve_conversation_history(phone_number, limit=50)
-                has_unanswered = any(entry["user_text"].strip() and not any(e["timestamp"] == entry["timestamp"] and e["role"] == "assistant" for e in history) for entry in history if entry["role"] == "user")
+                history_columns = await vector_db_service.retrieve_conversation_columns(phone_number, limit=50)
+                has_unanswered = vector_db_service.latest_unanswered_index(history_columns) is not None
                 if not has_unanswered:
                     customers_to_remove.append(phone_number)
             for phone_number in customers_to_remove:
@@ -665,12 +666,12 @@ async def retrieve_history(phone_number: str, limit: int = 50):
     """
     try:
         # Normalize and validate phone number
-        cleaned_phone = ''.join(filter(str.isdigit, phone_number))
-        if len(cleaned_phone) != 11 or not cleaned_phone.startswith('89'):
+        cleaned_phone = normalize_phone_number(phone_number)
+        if cleaned_phone is None:
             log_message_processing(phone_number, "FAILED", "Invalid phone number format.")
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Phone number must be 11 digits starting with '89' (format: 89XXXXXXXXX)."
+                detail=PHONE_NUMBER_ERROR
             )
 
         log_message_processing(cleaned_phone, "STARTED", f"Retrieving conversation history with limit {limit}.")
@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from functools import lru_cache
-from typing import Optional
+from typing import Dict, Optional
 
 class Settings(BaseSettings):
     """
@@ -20,6 +20,9 @@ class Settings(BaseSettings):
 
     QDRANT_URL: str
     QDRANT_API_KEY: Optional[str] = None
+    QDRANT_PREFER_GRPC: bool = True  # Use the gRPC API for bulk uploads and queries instead of REST
+    QDRANT_GRPC_PORT: int = 6334
+    KNOWLEDGE_QUANTIZATION: str = "scalar"  # Knowledge base vector quantization: "scalar" (int8) or "binary" (1 bit per dimension)
     KNOWLEDGE_COLLECTION_NAME: str
     EMBEDDING_MODEL: str
 
@@ -29,10 +32,50 @@ class Settings(BaseSettings):
     ACTION_MODEL: str
     SUMMARY_MODEL: str
     QA_MODEL: str
+    # Chat completion URLs of OpenAI-compatible servers hosting individual models instead of MWS, keyed by model name,
+    # e.g. a quantized model for the short intent/QA classifications: {"qwen2.5-3b-instruct-q4_k_m": "http://ollama:11434/v1/chat/completions"}
+    MODEL_ENDPOINTS: Dict[str, str] = {}
+    MODEL_ENDPOINTS_API_KEY: Optional[str] = None  # Bearer token for the MODEL_ENDPOINTS servers; the MWS key is never sent to them
 
     LOG_LEVEL: str = "DEBUG"
     MAX_RETRIES: int = 3
     REQUEST_TIMEOUT: float = 60.0  # Increased from 30.0 to 60.0 to handle rate limiting and retries
+    MWS_MAX_INFLIGHT: int = 32  # Max concurrent chat completion requests to the MWS API across all agents
+    RETRY_BACKOFF_BASE: float = 0.1  # Seconds before the first retry of a failed MWS API call; doubles per attempt
+    RETRY_BACKOFF_MAX: float = 5.0  # Upper bound in seconds on a single retry backoff, before jitter
+
+    INTENT_CACHE_SIZE: int = 10000  # Max entries in the in-process exact-match intent cache
+    INTENT_CACHE_SIMILARITY_THRESHOLD: float = 0.95  # Min cosine similarity for a semantic intent cache hit
+    INTENT_CACHE_TTL: float = 604800.0  # Seconds a labeled message stays in the Qdrant intent cache before it is purged
+    INTENT_CACHE_PURGE_INTERVAL: float = 3600.0  # Seconds between purges of expired Qdrant intent cache entries
+    INTENT_KNN_NEIGHBORS: int = 7  # Labeled messages consulted for a local intent vote before asking the LLM; 0 disables the vote
+    INTENT_KNN_MIN_SIMILARITY: float = 0.85  # Min cosine similarity of a labeled message to take part in the intent vote
+    INTENT_KNN_MIN_VOTES: int = 3  # Min number of close labeled messages required for a local intent vote
+    INTENT_KNN_MIN_CONFIDENCE: float = 0.75  # Min share of the vote weight the winning intent needs to skip the LLM
+    INTENT_KNN_MIN_LABEL_CONFIDENCE: float = 0.7  # Min LLM confidence of a labeled message to take part in the intent vote
+    EMOTION_CACHE_SIZE: int = 4096  # Max emotion detections kept per exact message and history context
+    EMOTION_CACHE_TTL: float = 600.0  # Seconds before a cached emotion detection is asked of the LLM again
+    ACTION_FAST_PATH: bool = True  # Serve rule-based suggestions without an LLM call for confident, context-free turns
+    ACTION_FAST_PATH_MIN_CONFIDENCE: float = 0.9  # Min intent and emotion confidence for the rule-based suggestion shortcut
+    EMBEDDING_CACHE_SIZE: int = 2048  # Max texts kept in the in-process embedding cache
+    EMBEDDING_CACHE_TTL: float = 3600.0  # Seconds before a cached embedding is fetched again
+    EMBEDDING_BATCH_WINDOW_MS: float = 5.0  # Time to collect concurrent embedding requests into one API call; 0 disables batching
+    EMBEDDING_BATCH_SIZE: int = 32  # Max texts per micro-batched embedding request
+    QUERY_CACHE_SIZE: int = 1024  # Max knowledge search results kept in the in-process semantic cache
+    QUERY_CACHE_SIMILARITY_THRESHOLD: float = 0.95  # Min cosine similarity for reusing a cached knowledge search
+    KNOWLEDGE_TOP_K: int = 5  # Knowledge base documents retrieved per query
+    KNOWLEDGE_RELEVANCE_THRESHOLD: float = 0.7  # Min similarity score for a retrieved document to be used as answer context
+    KNOWLEDGE_CONTEXT_CHARS: int = 2000  # Upper bound on retrieved context and on the generated answer, in characters
+    KNOWLEDGE_DIRECT_ANSWER_THRESHOLD: float = 0.9  # Min top document score for returning it verbatim instead of an LLM-written answer
+    KNOWLEDGE_DIRECT_ANSWER_MAX_CHARS: int = 500  # Top documents at least this long are still condensed by the LLM
+    KNOWLEDGE_CACHE_SIZE: int = 1024  # Max generated knowledge answers kept in the in-process semantic cache
+    KNOWLEDGE_CACHE_SIMILARITY_THRESHOLD: float = 0.97  # Min cosine similarity for reusing a generated knowledge answer
+    QA_CACHE_SIZE: int = 1024  # Max operator quality evaluations kept per exact message/response pair
+    HISTORY_TOKEN_BUDGET: int = 800  # Estimated tokens of conversation history inlined into an agent prompt
+    HISTORY_MAX_TURNS: int = 10  # Upper bound on history turns inlined into an agent prompt, however short they are
+    ROLLING_SUMMARY_CACHE_SIZE: int = 2048  # Max conversations whose older turns are kept as a rolling summary in process
+    CUSTOMER_CACHE_SIZE: int = 10000  # Max customer profiles kept in process to skip Qdrant lookups
+    CUSTOMER_CACHE_TTL: float = 30.0  # Seconds before a cached customer profile is read from Qdrant again
 
     model_config = SettingsConfigDict(env_file='.env', extra='ignore', env_file_encoding='utf-8')
 
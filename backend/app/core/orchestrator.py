@@ -1,16 +1,26 @@
 import asyncio
 import time
 from datetime import datetime, timezone
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Awaitable
+from pydantic import TypeAdapter
 from app.models.schemas import UserMessageInput, ProcessingResultOutput, AgentResponse, Suggestion, HistoryEntry, AnalysisRequest
 from app.agents import (
-    intent_agent, emotion_agent, knowledge_agent,
+    classify_agent, knowledge_agent,
     action_agent, summary_agent, qa_agent
 )
 from app.utils.logger import app_logger, log_history_storage, log_history_retrieval
+from app.utils.prompt import older_turns
 from app.services.vector_db import vector_db_service
+from app.services.intent_cache import compute_context_hash
 from app.core.config import get_settings
 
+_SETTINGS = get_settings()
+_REQUEST_TIMEOUT = _SETTINGS.REQUEST_TIMEOUT
+_HISTORY_MAX_TURNS = _SETTINGS.HISTORY_MAX_TURNS
+
+# Validates a whole retrieved history list in one pydantic-core call instead of one model constructor call per entry
+_HISTORY_ENTRIES = TypeAdapter(List[HistoryEntry])
+
 async def process_automated_agents(phone_number: str, timestamp: str, user_text: str, operator_response: str = "") -> Dict[str, Any]:
     """
     Run automated agents (Summary only) after an operator submits a response or manually triggered.
@@ -19,27 +29,27 @@ async def process_automated_agents(phone_number: str, timestamp: str, user_text:
     QA Agent is now part of analyze_conversation and not triggered here.
     """
     app_logger.info(f"Orchestrator: Running automated agents for customer {phone_number}, timestamp {timestamp}")
-    settings = get_settings()
-    timeout_seconds = settings.REQUEST_TIMEOUT
+    timeout_seconds = _REQUEST_TIMEOUT
 
     try:
         async with asyncio.timeout(timeout_seconds):
-            # Retrieve customer data and history for context
-            customer_data = await vector_db_service.retrieve_customer(phone_number)
+            # Retrieve customer data and history for context; the two lookups are independent, so they overlap
+            customer_data, history_data = await asyncio.gather(
+                vector_db_service.retrieve_customer(phone_number),
+                vector_db_service.retrieve_conversation_history(phone_number, limit=_HISTORY_MAX_TURNS)
+            )
             if not customer_data:
                 app_logger.error(f"No customer data found for {phone_number}. Skipping automated agents.")
                 return {
                     "summary": {"agent_name": "SummaryAgent", "result": {"summary": "Customer profile not found."}, "confidence": 0.0, "error": f"Customer profile not found for {phone_number}."}
                 }
 
-            history_data = await vector_db_service.retrieve_conversation_history(phone_number, limit=10)
-            history = [HistoryEntry(**entry) for entry in history_data] if history_data else []
-            app_logger.debug(f"Retrieved history for automated agents for customer {phone_number}: {len(history)} turns")
+            history = _HISTORY_ENTRIES.validate_python(history_data) if history_data else []
+            app_logger.debug("Retrieved history for automated agents for customer {}: {} turns", phone_number, len(history))
             log_history_retrieval(phone_number, len(history))
 
             # Run only Summary Agent
-            summary_task = asyncio.create_task(summary_agent.summarize_conversation(history, user_text))
-            summary_result = await summary_task
+            summary_result = await _guarded(summary_agent.summarize_conversation(history, user_text))
 
             if isinstance(summary_result, Exception):
                 app_logger.error(f"Summary Agent failed for customer {phone_number} at timestamp {timestamp}: {str(summary_result)}")
@@ -69,6 +79,43 @@ async def process_automated_agents(phone_number: str, timestamp: str, user_text:
             "qa_feedback": {"agent_name": "QAAgent", "result": {"feedback": "QA feedback available only during analysis via /analyze."}, "confidence": 0.0}
         }
 
+async def _guarded(coro: Awaitable[Any]) -> Any:
+    """
+    Await an agent coroutine and return its exception instead of raising it.
+    Keeps one failing agent from cancelling its siblings in a TaskGroup, so each agent can fall back independently.
+    """
+    try:
+        return await coro
+    except Exception as e:
+        return e
+
+async def _check_latest_operator_response(history: List[HistoryEntry], phone_number: str) -> AgentResponse:
+    """
+    Run the QA Agent on the latest history entry that carries an operator response.
+    Returns a placeholder QA response when no operator response exists in the history.
+    """
+    qa_result = AgentResponse(
+        agent_name="QAAgent",
+        result={"feedback": "QA feedback not generated. No operator response found in history."},
+        confidence=0.0
+    )
+    # Check history for operator responses (prioritize the latest turn)
+    latest_turn_with_response = None
+    for entry in reversed(history):
+        if entry.operator_response.strip():
+            latest_turn_with_response = entry
+            break
+
+    if latest_turn_with_response:
+        app_logger.info(f"Running QA Agent for customer {phone_number} on latest turn with operator response at timestamp {latest_turn_with_response.timestamp}")
+        qa_result = await qa_agent.check_quality(
+            latest_turn_with_response.user_text, 
+            latest_turn_with_response.operator_response
+        )
+    else:
+        app_logger.debug("No operator response found in history for customer {}. Skipping QA Agent.", phone_number)
+    return qa_result
+
 async def analyze_conversation(payload: AnalysisRequest) -> ProcessingResultOutput:
     """
     Analyze conversation history for a customer based on specific timestamps or recent history.
@@ -81,12 +128,15 @@ async def analyze_conversation(payload: AnalysisRequest) -> ProcessingResultOutp
     history_limit = payload.history_limit
     app_logger.info(f"Orchestrator: Analyzing conversation for customer {phone_number}")
     
-    settings = get_settings()
-    timeout_seconds = settings.REQUEST_TIMEOUT
+    timeout_seconds = _REQUEST_TIMEOUT
 
     try:
         async with asyncio.timeout(timeout_seconds):
-            customer_data = await vector_db_service.retrieve_customer(phone_number)
+            # Fetch the profile and the history concurrently; a missing profile rejects the analysis either way
+            customer_data, history_data = await asyncio.gather(
+                vector_db_service.retrieve_customer(phone_number),
+                vector_db_service.retrieve_conversation_history(phone_number, limit=history_limit)
+            )
             if not customer_data:
                 app_logger.error(f"No customer data found for {phone_number}. Rejecting analysis.")
                 return ProcessingResultOutput(
@@ -95,10 +145,9 @@ async def analyze_conversation(payload: AnalysisRequest) -> ProcessingResultOutp
                     customer_data=None
                 )
 
-            # Retrieve conversation history based on timestamps or limit
-            history_data = await vector_db_service.retrieve_conversation_history(phone_number, limit=history_limit)
-            history = [HistoryEntry(**entry) for entry in history_data] if history_data else []
-            app_logger.debug(f"Retrieved history for customer {phone_number}: {len(history)} turns")
+            # Conversation history is filtered by timestamps below, if provided
+            history = _HISTORY_ENTRIES.validate_python(history_data) if history_data else []
+            app_logger.debug("Retrieved history for customer {}: {} turns", phone_number, len(history))
             log_history_retrieval(phone_number, len(history))
 
             # Check if history exists; if not, return an error
@@ -123,43 +172,63 @@ async def analyze_conversation(payload: AnalysisRequest) -> ProcessingResultOutp
                         customer_data=customer_data,
                         conversation_history=[]
                     )
-                app_logger.debug(f"Filtered history to {len(history)} turns based on timestamps for customer {phone_number}")
+                app_logger.debug("Filtered history to {} turns based on timestamps for customer {}", len(history), phone_number)
+
+            user_messages = [entry.user_text for entry in history if entry.user_text.strip()]
+
+            # Without any customer text there is nothing to classify, search or act on; only QA of the operator's replies applies
+            if not user_messages:
+                app_logger.info(f"No customer messages in analyzed history for {phone_number}. Skipping intent, emotion, knowledge and action agents.")
+                qa_result = await _check_latest_operator_response(history, phone_number)
+                return ProcessingResultOutput(
+                    phone_number=phone_number,
+                    qa_feedback=qa_result,
+                    consolidated_output="Нет сообщений клиента для анализа.",
+                    conversation_history=history,
+                    history_storage_status=True,
+                    customer_data=customer_data,
+                    current_timestamp=history[-1].timestamp
+                )
 
             # Prepare batch user text for analysis (concatenate multiple messages)
-            batch_user_text = ""
-            if history:
-                user_messages = [entry.user_text for entry in history if entry.user_text.strip()]
-                batch_user_text = "\n".join(user_messages) if user_messages else "Анализ проводится на основе истории без нового сообщения."
-            else:
-                batch_user_text = "Анализ проводится на основе истории без нового сообщения."
-            app_logger.debug(f"Batch user text for analysis: {batch_user_text[:100]}...")
+            batch_user_text = "\n".join(user_messages)
+            app_logger.debug("Batch user text for analysis: {:.100}...", batch_user_text)
+
+            # Scope cached intents to the turns preceding the analyzed message
+            context_hash = compute_context_hash(history)
+
+            # Turns that do not fit the prompt history window reach the classifier through a rolling summary instead of being dropped.
+            # Timestamp-filtered analyses skip it, since the summary may describe turns after the selected ones.
+            rolling_summary = None if timestamps else summary_agent.rolling_summary(phone_number, older_turns(history))
 
             # Execute independent prerequisite agents concurrently for batch processing
-            intent_task = asyncio.create_task(intent_agent.detect_intent(batch_user_text, history=history))
-            emotion_task = asyncio.create_task(emotion_agent.detect_emotion(batch_user_text, history=history))
-            knowledge_task = asyncio.create_task(knowledge_agent.find_knowledge(batch_user_text))
-            
-            intent_result, emotion_result, knowledge_result = await asyncio.gather(
-                intent_task, emotion_task, knowledge_task, return_exceptions=True
-            )
-            
+            # Intent and emotion come from one fused LLM call that runs alongside the knowledge search
+            # QA of the latest operator response does not depend on them either, so it joins the same task group
+            async with asyncio.TaskGroup() as tg:
+                classify_task = tg.create_task(_guarded(classify_agent.classify(
+                    batch_user_text, history=history, context_hash=context_hash, rolling_summary=rolling_summary
+                )))
+                knowledge_task = tg.create_task(_guarded(knowledge_agent.find_knowledge(batch_user_text)))
+                qa_task = tg.create_task(_guarded(_check_latest_operator_response(history, phone_number)))
+            classify_result, knowledge_result, qa_result = classify_task.result(), knowledge_task.result(), qa_task.result()
+
             # Handle potential exceptions or timeouts per agent
-            if isinstance(intent_result, Exception):
-                app_logger.error(f"Intent Agent failed for customer {phone_number}: {str(intent_result)}")
+            if isinstance(classify_result, Exception):
+                app_logger.error(f"Classify Agent failed for customer {phone_number}: {str(classify_result)}")
                 intent_result = AgentResponse(
                     agent_name="IntentAgent",
                     result={"intent": "unknown", "confidence": 0.0},
                     confidence=0.0,
-                    error=f"Agent failed for customer {phone_number}: {str(intent_result)}"
+                    error=f"Agent failed for customer {phone_number}: {str(classify_result)}"
                 )
-            if isinstance(emotion_result, Exception):
-                app_logger.error(f"Emotion Agent failed for customer {phone_number}: {str(emotion_result)}")
                 emotion_result = AgentResponse(
                     agent_name="EmotionAgent",
                     result={"emotion": "neutral", "confidence": 0.0},
                     confidence=0.0,
-                    error=f"Agent failed for customer {phone_number}: {str(emotion_result)}"
+                    error=f"Agent failed for customer {phone_number}: {str(classify_result)}"
                 )
+            else:
+                intent_result, emotion_result = classify_result
             if isinstance(knowledge_result, Exception):
                 app_logger.error(f"Knowledge Agent failed for customer {phone_number}: {str(knowledge_result)}")
                 knowledge_result = AgentResponse(
@@ -169,47 +238,23 @@ async def analyze_conversation(payload: AnalysisRequest) -> ProcessingResultOutp
                     error=f"Agent failed for customer {phone_number}: {str(knowledge_result)}"
                 )
             
-            app_logger.debug(f"Completed Independent Agents for analysis of customer {phone_number}")
+            app_logger.debug("Completed Independent Agents for analysis of customer {}", phone_number)
             consolidated_output = f"Обработано: Намерение='{intent_result.result.get('intent', 'N/A')}', Эмоция='{emotion_result.result.get('emotion', 'N/A')}'"
 
+            if isinstance(qa_result, Exception):
+                app_logger.error(f"QA Agent failed for customer {phone_number}: {str(qa_result)}")
+                qa_result = AgentResponse(
+                    agent_name="QAAgent",
+                    result={"feedback": "Failed to generate QA feedback."},
+                    confidence=0.0,
+                    error=f"Agent failed for customer {phone_number}: {str(qa_result)}"
+                )
+
             # Run dependent agent (Action Suggestion) using results from prerequisites
-            suggestions_task = asyncio.create_task(action_agent.suggest_actions(
+            suggestions = await _guarded(action_agent.suggest_actions(
                 intent_result, emotion_result, knowledge_result, 
                 customer_data=customer_data, history=history
             ))
-
-            # Run QA Agent if there is an operator response in the history
-            qa_result = AgentResponse(
-                agent_name="QAAgent",
-                result={"feedback": "QA feedback not generated. No operator response found in history."},
-                confidence=0.0
-            )
-            # Check history for operator responses (prioritize the latest turn)
-            latest_turn_with_response = None
-            for entry in reversed(history):
-                if entry.operator_response.strip():
-                    latest_turn_with_response = entry
-                    break
-            
-            if latest_turn_with_response:
-                app_logger.info(f"Running QA Agent for customer {phone_number} on latest turn with operator response at timestamp {latest_turn_with_response.timestamp}")
-                qa_task = asyncio.create_task(qa_agent.check_quality(
-                    latest_turn_with_response.user_text, 
-                    latest_turn_with_response.operator_response
-                ))
-                qa_result = await qa_task
-                if isinstance(qa_result, Exception):
-                    app_logger.error(f"QA Agent failed for customer {phone_number}: {str(qa_result)}")
-                    qa_result = AgentResponse(
-                        agent_name="QAAgent",
-                        result={"feedback": "Failed to generate QA feedback."},
-                        confidence=0.0,
-                        error=f"Agent failed for customer {phone_number}: {str(qa_result)}"
-                    )
-            else:
-                app_logger.debug(f"No operator response found in history for customer {phone_number}. Skipping QA Agent.")
-
-            suggestions = await suggestions_task
             if isinstance(suggestions, Exception):
                 app_logger.error(f"Action Agent failed for customer {phone_number}: {str(suggestions)}")
                 suggestions = []
@@ -1,19 +1,51 @@
+from contextlib import asynccontextmanager
+import aiohttp
 from fastapi import FastAPI
 from app.api.routers import process as process_router
 from app.api.routers import customers as customers_router
 from app.core.config import get_settings
 from app.services.vector_db import vector_db_service
+from app.services.llm_service import llm_service
+from app.services.intent_cache import intent_cache
 from app.utils.logger import app_logger
+from app.utils.http import json_dumps
 from app.data.knowledge_base import KNOWLEDGE_BASE
-from qdrant_client.http.models import PointStruct, VectorParams, Distance
+from qdrant_client.http.models import VectorParams, Distance
 import asyncio
 import hashlib
+import numpy as np
 from typing import List, Dict, Tuple, Optional
 from app.core.state import customer_queue, active_conversation, queue_lock
 
 settings = get_settings()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Manage application-wide resources for the lifetime of the API process.
+    Opens one pooled HTTP session shared by the LLM and embedding clients so calls reuse keep-alive connections
+    instead of paying TCP and TLS setup per request, then runs the startup and shutdown routines around it.
+    """
+    app.state.http = aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=settings.REQUEST_TIMEOUT),
+        json_serialize=json_dumps,
+        # Cache DNS lookups and keep idle sockets open long enough to span the gaps between operator requests
+        connector=aiohttp.TCPConnector(limit=200, limit_per_host=100, ttl_dns_cache=300, keepalive_timeout=60)
+    )
+    llm_service.session = app.state.http
+    vector_db_service.session = app.state.http
+    await startup_event()
+    intent_cache_purge = asyncio.create_task(purge_intent_cache_periodically())
+    try:
+        yield
+    finally:
+        intent_cache_purge.cancel()
+        await shutdown_event()
+        await vector_db_service.client.close()
+        await app.state.http.close()
+
 app = FastAPI(
+    lifespan=lifespan,
     title="Smart Assistant Backend API",
     description="""
     # Smart Assistant Backend API Documentation
@@ -71,11 +103,12 @@ async def health_check():
 def compute_content_hash(entry: Dict) -> str:
     """Compute a unique hash of a knowledge base entry's content for versioning and comparison purposes."""
     content = f"{entry.get('query', '')}{entry.get('correct_answer', '')}{entry.get('correct_sources', '')}"
-    return hashlib.md5(content.encode('utf-8')).hexdigest()
+    return hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest()
 
-async def generate_embeddings_batch(entries: List[Dict], batch_size: int = 50, max_concurrent_batches: int = 5) -> List[Tuple[Dict, List[float]]]:
+async def generate_embeddings_batch(entries: List[Dict], batch_size: int = 128, max_concurrent_batches: int = 5) -> List[Tuple[Dict, np.ndarray]]:
     """
     Generate embeddings for knowledge base entries in parallel batches to optimize performance.
+    Each batch is embedded with a single request carrying all of its queries, so indexing costs one round-trip per batch.
     Uses a semaphore to limit concurrent batches and avoid rate limiting issues.
     """
     results = []
@@ -84,14 +117,11 @@ async def generate_embeddings_batch(entries: List[Dict], batch_size: int = 50, m
     async def process_batch(batch: List[Dict], batch_num: int):
         async with semaphore:
             app_logger.info(f"Generating embeddings for batch {batch_num} ({len(batch)} entries)...")
-            tasks = [vector_db_service.get_embedding(entry["query"]) for entry in batch]
-            embeddings = await asyncio.gather(*tasks)
-            batch_results = []
-            for entry, embedding in zip(batch, embeddings):
-                if embedding:
-                    batch_results.append((entry, embedding))
-                else:
-                    app_logger.warning(f"Failed to generate embedding for query: {entry.get('query', 'Unknown')[:30]}...")
+            embeddings = await vector_db_service.get_embeddings_batch([entry["query"] for entry in batch])
+            if embeddings is None:
+                app_logger.warning(f"Failed to generate embeddings for batch {batch_num} ({len(batch)} entries), skipping batch")
+                return []
+            batch_results = list(zip(batch, embeddings))
             app_logger.info(f"Completed batch {batch_num}: {len(batch_results)} embeddings added, total so far: {len(results) + len(batch_results)}")
             return batch_results
     
@@ -106,21 +136,27 @@ async def generate_embeddings_batch(entries: List[Dict], batch_size: int = 50, m
     
     return results
 
-async def upsert_batch_to_qdrant(points: List[PointStruct], batch_size: int = 200) -> bool:
+async def upload_to_qdrant(ids: List[str], vectors: np.ndarray, payloads: List[Dict], batch_size: int = 256, parallel: int = 4) -> bool:
     """
-    Upsert points to Qdrant vector database in batches for efficient storage.
-    Uses a larger batch size to reduce network overhead during indexing.
+    Upload knowledge base vectors to Qdrant in a single call for efficient storage.
+    Vectors are passed as one contiguous float32 matrix alongside parallel id and payload lists;
+    the client slices them into batches and streams them over parallel workers.
+    Waits for the upload to be applied so that post-indexing checks see the new points.
     Returns True if successful, False otherwise.
     """
     try:
-        for i in range(0, len(points), batch_size):
-            batch = points[i:i + batch_size]
-            await asyncio.to_thread(
-                vector_db_service.client.upsert,
-                collection_name=vector_db_service.collection_name,
-                points=batch
-            )
-            app_logger.info(f"Upserted batch {i // batch_size + 1} with {len(batch)} points to Qdrant.")
+        # upload_collection stays synchronous on the async client (it drives its own upload workers), so keep it off the event loop
+        await asyncio.to_thread(
+            vector_db_service.client.upload_collection,
+            collection_name=vector_db_service.collection_name,
+            vectors=vectors,
+            payload=payloads,
+            ids=ids,
+            batch_size=batch_size,
+            parallel=parallel,
+            wait=True
+        )
+        app_logger.info(f"Uploaded {len(ids)} points to Qdrant in batches of {batch_size} using {parallel} parallel workers.")
         return True
     except Exception as e:
         app_logger.error(f"Failed to upsert batch to Qdrant: {str(e)}")
@@ -140,27 +176,20 @@ async def initialize_vector_db(recreate_knowledge_collection: bool = True) -> bo
         if recreate_knowledge_collection:
             app_logger.info(f"Recreating knowledge base collection {vector_db_service.collection_name} for clean slate...")
             try:
-                await asyncio.to_thread(
-                    vector_db_service.client.delete_collection,
+                await vector_db_service.client.delete_collection(
                     collection_name=vector_db_service.collection_name
                 )
                 app_logger.info(f"Deleted existing collection {vector_db_service.collection_name}.")
             except Exception as e:
                 app_logger.warning(f"Could not delete existing collection {vector_db_service.collection_name}: {str(e)}. Proceeding to recreate.")
             
-            # Recreate the collection with the correct vector size
-            vector_size = vector_db_service.vector_size if vector_db_service.vector_size else 1024
-            await asyncio.to_thread(
-                vector_db_service.client.create_collection,
-                collection_name=vector_db_service.collection_name,
-                vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE)
-            )
-            app_logger.info(f"Recreated collection {vector_db_service.collection_name} with vector size {vector_size}.")
+            # Recreate the collection with the correct vector size and quantization settings
+            await vector_db_service.create_knowledge_collection()
+            app_logger.info(f"Recreated collection {vector_db_service.collection_name}.")
 
         # Log status of collections for diagnostic purposes with error handling
         try:
-            collection_info_knowledge = await asyncio.to_thread(
-                vector_db_service.client.get_collection,
+            collection_info_knowledge = await vector_db_service.client.get_collection(
                 collection_name=vector_db_service.collection_name
             )
             app_logger.info(f"Collection {vector_db_service.collection_name} status: {collection_info_knowledge.points_count} points")
@@ -168,8 +197,7 @@ async def initialize_vector_db(recreate_knowledge_collection: bool = True) -> bo
             app_logger.error(f"Failed to retrieve status for collection {vector_db_service.collection_name}: {str(e)}")
             
         try:
-            collection_info_history = await asyncio.to_thread(
-                vector_db_service.client.get_collection,
+            collection_info_history = await vector_db_service.client.get_collection(
                 collection_name=vector_db_service.history_collection_name
             )
             app_logger.info(f"Collection {vector_db_service.history_collection_name} status: {collection_info_history.points_count} points")
@@ -177,8 +205,7 @@ async def initialize_vector_db(recreate_knowledge_collection: bool = True) -> bo
             app_logger.error(f"Failed to retrieve status for collection {vector_db_service.history_collection_name}: {str(e)}")
             
         try:
-            collection_info_customers = await asyncio.to_thread(
-                vector_db_service.client.get_collection,
+            collection_info_customers = await vector_db_service.client.get_collection(
                 collection_name=vector_db_service.customers_collection_name
             )
             app_logger.info(f"Collection {vector_db_service.customers_collection_name} status: {collection_info_customers.points_count} points")
@@ -186,8 +213,7 @@ async def initialize_vector_db(recreate_knowledge_collection: bool = True) -> bo
             app_logger.error(f"Failed to retrieve status for collection {vector_db_service.customers_collection_name}: {str(e)}")
             
         try:
-            collection_info_queue = await asyncio.to_thread(
-                vector_db_service.client.get_collection,
+            collection_info_queue = await vector_db_service.client.get_collection(
                 collection_name=vector_db_service.queue_collection_name
             )
             app_logger.info(f"Collection {vector_db_service.queue_collection_name} status: {collection_info_queue.points_count} points")
@@ -195,10 +221,9 @@ async def initialize_vector_db(recreate_knowledge_collection: bool = True) -> bo
             app_logger.error(f"Failed to retrieve status for collection {vector_db_service.queue_collection_name}: {str(e)}")
             # Ensure the collection is created if it doesn't exist
             app_logger.info(f"Creating {vector_db_service.queue_collection_name} collection as it may not exist")
-            await asyncio.to_thread(
-                vector_db_service.client.create_collection,
+            await vector_db_service.client.create_collection(
                 collection_name=vector_db_service.queue_collection_name,
-                vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE)
+                vectors_config=VectorParams(size=vector_db_service.vector_size if vector_db_service.vector_size else 1024, distance=Distance.COSINE)
             )
             app_logger.info(f"Created collection {vector_db_service.queue_collection_name} after retrieval failure")
         
@@ -215,8 +240,7 @@ async def check_critical_entries(collection_name: str, critical_keyword: str = "
     Returns True if any entry partially matches the keyword (case-insensitive).
     """
     try:
-        search_result = await asyncio.to_thread(
-            vector_db_service.client.scroll,
+        search_result = await vector_db_service.client.scroll(
             collection_name=collection_name,
             limit=200,  # Increased limit to ensure broader search
             with_payload=True,
@@ -231,7 +255,7 @@ async def check_critical_entries(collection_name: str, critical_keyword: str = "
                 kion_found = True
                 found_entries.append(point.payload.get('query', 'Unknown'))
             else:
-                app_logger.debug(f"Non-matching entry in Qdrant: {point.payload.get('query', 'Unknown')[:50]}...")
+                app_logger.debug("Non-matching entry in Qdrant: {:.50}...", point.payload.get('query', 'Unknown'))
         if kion_found:
             app_logger.info(f"Total '{critical_keyword}' related entries found: {len(found_entries)} - {found_entries}")
         else:
@@ -249,8 +273,7 @@ async def index_knowledge_base() -> bool:
     """
     try:
         app_logger.info("Starting knowledge base indexing...")
-        collection_info = await asyncio.to_thread(
-            vector_db_service.client.get_collection,
+        collection_info = await vector_db_service.client.get_collection(
             collection_name=vector_db_service.collection_name
         )
         app_logger.info(f"Collection {vector_db_service.collection_name} status: {collection_info.points_count} points")
@@ -264,53 +287,55 @@ async def index_knowledge_base() -> bool:
             app_logger.info(f"Kion Entry {i+1}: Query='{entry['query']}', Content Preview='{entry['correct_answer'][:100]}...'")
 
         # Since collection is recreated, index all entries
-        to_index = KNOWLEDGE_BASE
-        app_logger.info(f"Full indexing: {len(to_index)} items to index (collection recreated at startup).")
+        # Entries resolving to the same point id would overwrite each other in Qdrant, so keep only the first of each
+        to_index = {}
+        for entry in KNOWLEDGE_BASE:
+            point_id = vector_db_service.generate_point_id(entry.get("query", "Unknown Query"), entry.get("correct_answer", "No content available."))
+            to_index.setdefault(point_id, entry)
+        app_logger.info(f"Full indexing: {len(to_index)} items to index (collection recreated at startup), {len(KNOWLEDGE_BASE) - len(to_index)} duplicate entries dropped.")
 
         # Generate embeddings for all entries
         if to_index:
             successful_indices = 0
             failed_indices = 0
-            app_logger.info(f"Generating embeddings for {len(to_index)} entries in parallel batches...")
-            results = await generate_embeddings_batch(to_index, batch_size=50, max_concurrent_batches=5)
+            # Entries with the same query but different answers share one embedding, as only the query is embedded
+            query_entries = {}
+            for entry in to_index.values():
+                query_entries.setdefault(entry["query"], entry)
+            app_logger.info(f"Generating embeddings for {len(query_entries)} unique queries ({len(to_index)} entries) in parallel batches...")
+            embedded = await generate_embeddings_batch(list(query_entries.values()), batch_size=128, max_concurrent_batches=5)
+            embeddings_by_query = {entry["query"]: embedding for entry, embedding in embedded}
+            results = [(point_id, entry, embeddings_by_query[entry["query"]]) for point_id, entry in to_index.items() if entry["query"] in embeddings_by_query]
             successful_indices = len(results)
             failed_indices = len(to_index) - successful_indices
             app_logger.info(f"Embeddings generated: {successful_indices} successful, {failed_indices} failed.")
 
-            # Prepare points for upserting with content hash for future comparison (if incremental indexing is re-enabled)
-            points = []
-            kion_points = []
-            for entry, embedding in results:
-                try:
-                    query_text = entry.get("query", "Unknown Query")
-                    correct_answer = entry.get("correct_answer", "No content available.")
-                    correct_sources = entry.get("correct_sources", "")
-                    point_id = vector_db_service.generate_point_id(query_text, correct_answer)
-                    content_hash = compute_content_hash(entry)
-                    point = PointStruct(
-                        id=point_id,
-                        vector=embedding,
-                        payload={
-                            "query": query_text,
-                            "text": correct_answer,
-                            "sources": correct_sources,
-                            "content_hash": content_hash  # Store hash for future comparisons if needed
-                        }
-                    )
-                    points.append(point)
-                    if critical_keyword in query_text.lower() or "kion" in query_text.lower():
-                        kion_points.append(point)
-                        app_logger.info(f"Prepared critical '{critical_keyword}' entry for upsert: {query_text}")
-                except Exception as e:
-                    app_logger.error(f"Error preparing point for query {entry.get('query', 'Unknown')[:30]}...: {str(e)}")
-                    failed_indices += 1
-                    successful_indices -= 1
-
-            # Upsert all points to Qdrant in batches
-            if points:
-                app_logger.info(f"Upserting {len(points)} points to Qdrant in batches, including {len(kion_points)} critical '{critical_keyword}' entries...")
-                if await upsert_batch_to_qdrant(points, batch_size=200):
+            # Prepare columnar ids, payloads and vectors with content hash for future comparison (if incremental indexing is re-enabled)
+            ids = []
+            payloads = []
+            kion_count = 0
+            for point_id, entry, _ in results:
+                query_text = entry.get("query", "Unknown Query")
+                correct_answer = entry.get("correct_answer", "No content available.")
+                ids.append(point_id)
+                payloads.append({
+                    "query": query_text,
+                    "text": correct_answer,
+                    "sources": entry.get("correct_sources", ""),
+                    "content_hash": compute_content_hash(entry)  # Store hash for future comparisons if needed
+                })
+                if critical_keyword in query_text.lower() or "kion" in query_text.lower():
+                    kion_count += 1
+                    app_logger.info(f"Prepared critical '{critical_keyword}' entry for upsert: {query_text}")
+
+            # Upload all points to Qdrant in parallel batches
+            if ids:
+                vectors = np.stack([embedding for _, _, embedding in results])
+                app_logger.info(f"Uploading {len(ids)} points to Qdrant in batches, including {kion_count} critical '{critical_keyword}' entries...")
+                if await upload_to_qdrant(ids, vectors, payloads, batch_size=256, parallel=4):
                     app_logger.info(f"Full indexing completed: {successful_indices} entries indexed, {failed_indices} entries skipped due to errors.")
+                    # Search results and answers cached before or during indexing predate the new documents
+                    vector_db_service.clear_knowledge_caches()
                 else:
                     app_logger.error("Failed to upsert points to Qdrant. Indexing incomplete.")
                     return False
@@ -347,6 +372,15 @@ async def cleanup_orphaned_history() -> bool:
         app_logger.error(f"Error during strict cleanup of orphaned history entries: {str(e)}")
         return False
 
+async def purge_intent_cache_periodically() -> None:
+    """
+    Purge expired entries from the Qdrant intent cache every INTENT_CACHE_PURGE_INTERVAL seconds while the API runs,
+    so labeled messages do not accumulate without bound. The first purge runs right after startup.
+    """
+    while True:
+        await intent_cache.purge_expired()
+        await asyncio.sleep(settings.INTENT_CACHE_PURGE_INTERVAL)
+
 async def load_queue_state() -> bool:
     """
     Load the persisted queue state and active conversation from the vector database on startup.
@@ -397,7 +431,6 @@ async def save_queue_state() -> bool:
         app_logger.error(f"Failed to save queue state to database: {str(e)}")
         return False
 
-@app.on_event("startup")
 async def startup_event():
     """
     Initialize essential application services on startup with modularized operations.
@@ -435,7 +468,6 @@ async def startup_event():
     else:
         app_logger.warning("Startup completed with partial failures. Check logs for details.")
 
-@app.on_event("shutdown")
 async def shutdown_event():
     """Clean up resources, save queue state, and log the shutdown process for the Smart Assistant Backend."""
     app_logger.info("Shutting down Smart Assistant Backend...")
@@ -1,9 +1,22 @@
-from pydantic import BaseModel, Field, validator
-from typing import List, Optional, Dict, Any
+from pydantic import AfterValidator, BaseModel, ConfigDict, Field
+from typing import Annotated, List, Optional, Dict, Any
+from app.utils.phone import PHONE_NUMBER_ERROR, normalize_phone_number
+
+
+def _validate_phone_number(value: str) -> str:
+    """Validate and normalize phone number to format 89XXXXXXXXX."""
+    cleaned = normalize_phone_number(value)
+    if cleaned is None:
+        raise ValueError(PHONE_NUMBER_ERROR)
+    return cleaned
+
+
+# Phone number field type shared by every model keyed by customer; pydantic-core checks the str type before the normalizer runs
+PhoneNumber = Annotated[str, AfterValidator(_validate_phone_number)]
 
 class Customer(BaseModel):
     """Represents a customer profile with attributes for personalized operator assistance in contact centers."""
-    phone_number: str = Field(..., description="Unique identifier for the customer (phone number in format 89XXXXXXXXX).")
+    phone_number: PhoneNumber = Field(..., description="Unique identifier for the customer (phone number in format 89XXXXXXXXX).")
     is_mts_subscriber: bool = Field(default=False, description="Whether the customer is an MTS subscriber.")
     tariff_plan: Optional[str] = Field(default=None, description="Tariff plan of the customer (e.g., convergent plan).")
     has_mobile: bool = Field(default=False, description="Whether the customer has mobile services.")
@@ -30,32 +43,16 @@ class Customer(BaseModel):
     has_mts_money_credit_card: bool = Field(default=False, description="Whether the customer has an MTS Money credit card.")
     has_mts_money_virtual_card: bool = Field(default=False, description="Whether the customer has an MTS Money virtual card.")
 
-    @validator('phone_number')
-    def validate_and_normalize_phone_number(cls, v):
-        """Validate and normalize phone number to format 89XXXXXXXXX."""
-        cleaned = ''.join(filter(str.isdigit, v))
-        if len(cleaned) != 11 or not cleaned.startswith('89'):
-            raise ValueError("Phone number must be 11 digits starting with '89' (format: 89XXXXXXXXX).")
-        return cleaned
-
 class CustomerCreateRequest(Customer):
     """Request model for creating or updating a customer profile in the vector database."""
     pass
 
 class OperatorResponseInput(BaseModel):
     """Input model for submitting an operator's response to update conversation history."""
-    phone_number: str = Field(..., description="Unique identifier for the customer (phone number in format 89XXXXXXXXX).")
+    phone_number: PhoneNumber = Field(..., description="Unique identifier for the customer (phone number in format 89XXXXXXXXX).")
     operator_response: str = Field(..., description="The response from the operator for the current turn.")
     timestamp: Optional[str] = Field(default=None, description="Optional timestamp of the specific conversation turn to update (ISO 8601 format, UTC). If not provided, the most recent unanswered turn is selected or a new turn is created.")
 
-    @validator('phone_number')
-    def validate_and_normalize_phone_number(cls, v):
-        """Validate and normalize phone number to format 89XXXXXXXXX."""
-        cleaned = ''.join(filter(str.isdigit, v))
-        if len(cleaned) != 11 or not cleaned.startswith('89'):
-            raise ValueError("Phone number must be 11 digits starting with '89' (format: 89XXXXXXXXX).")
-        return cleaned
-
 class CustomerCreateResponse(BaseModel):
     """Response model for customer profile creation or update operations."""
     status: str = Field(..., description="Status of the customer creation operation (e.g., 'success', 'error').")
@@ -76,26 +73,19 @@ class HistoryEntry(BaseModel):
     timestamp: str = Field(default="", description="Timestamp of the conversation turn in ISO 8601 format (UTC).")
     role: str = Field(default="unknown", description="Role of the speaker (user/assistant/unknown).")
     sequence_number: int = Field(default=0, description="Sequential number for ordering conversation history.")
+    turn_seq: int = Field(default=0, description="Storage ordering key of the stored turn; the user and assistant entries split from one turn share it.")
 
 class UserMessageInput(BaseModel):
     """Input model for processing a user's message in the contact center system."""
-    phone_number: str = Field(..., description="Unique identifier for the customer (phone number in format 89XXXXXXXXX).")
+    phone_number: PhoneNumber = Field(..., description="Unique identifier for the customer (phone number in format 89XXXXXXXXX).")
     user_text: str = Field(..., description="The latest message from the user in Russian.")
     operator_response: Optional[str] = Field(
         default="", description="Latest response from the operator, if available (not used in initial storage)."
     )
 
-    @validator('phone_number')
-    def validate_and_normalize_phone_number(cls, v):
-        """Validate and normalize phone number to format 89XXXXXXXXX."""
-        cleaned = ''.join(filter(str.isdigit, v))
-        if len(cleaned) != 11 or not cleaned.startswith('89'):
-            raise ValueError("Phone number must be 11 digits starting with '89' (format: 89XXXXXXXXX).")
-        return cleaned
-
 class AnalysisRequest(BaseModel):
     """Input model for requesting on-demand conversation analysis."""
-    phone_number: str = Field(..., description="Unique identifier for the customer (phone number in format 89XXXXXXXXX).")
+    phone_number: PhoneNumber = Field(..., description="Unique identifier for the customer (phone number in format 89XXXXXXXXX).")
     timestamps: Optional[List[str]] = Field(
         default=None, description="List of specific timestamps (ISO 8601 format) to analyze. If not provided, analyzes recent history."
     )
@@ -103,14 +93,6 @@ class AnalysisRequest(BaseModel):
         default=10, description="Limit on the number of recent history turns to analyze if timestamps are not specified."
     )
 
-    @validator('phone_number')
-    def validate_and_normalize_phone_number(cls, v):
-        """Validate and normalize phone number to format 89XXXXXXXXX."""
-        cleaned = ''.join(filter(str.isdigit, v))
-        if len(cleaned) != 11 or not cleaned.startswith('89'):
-            raise ValueError("Phone number must be 11 digits starting with '89' (format: 89XXXXXXXXX).")
-        return cleaned
-
 class AgentResponse(BaseModel):
     """Represents the output from an agent (e.g., Intent, Emotion) with results and confidence scores."""
     agent_name: str = Field(..., description="Name of the agent providing the response (e.g., IntentAgent).")
@@ -120,6 +102,8 @@ class AgentResponse(BaseModel):
 
 class Suggestion(BaseModel):
     """Represents a suggested action or response for the operator to use with a customer."""
+    model_config = ConfigDict(frozen=True)  # Immutable and hashable, so prebuilt fallback suggestions can be shared across responses
+
     text: str = Field(..., description="Suggested action or response text for the operator in Russian.")
     type: str = Field(..., description="Type of suggestion (e.g., 'discount_offer', 'problem_resolution').")
     priority: Optional[int] = Field(default=1, description="Priority level of the suggestion (1-5, 1 being highest).")
@@ -0,0 +1,184 @@
+import hashlib
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from qdrant_client.http.models import PointStruct, Filter, FieldCondition, MatchValue, Range, IsEmptyCondition, PayloadField
+from app.core.config import get_settings
+from app.models.schemas import AgentResponse, HistoryEntry
+from app.services.vector_db import vector_db_service
+from app.utils.cache import LRUCache
+from app.utils.logger import app_logger
+
+CONTEXT_TURNS = 3  # Number of preceding history entries that define the conversational context of a message
+
+
+def compute_context_hash(history: Optional[List[HistoryEntry]]) -> str:
+    """
+    Hash the conversational context preceding the latest history entry into a short hex digest.
+    Semantically similar follow-ups (e.g. "а по этому же счёту?") only share cache entries when they occur after the same turns,
+    which prevents cached intents from leaking between unrelated conversations.
+    """
+    preceding = history[:-1][-CONTEXT_TURNS:] if history else []
+    joined = b"|".join((turn.user_text or turn.operator_response).encode("utf-8") for turn in preceding)
+    return hashlib.blake2b(joined, digest_size=8).hexdigest()
+
+
+class IntentCache:
+    """
+    Two-tier response cache for the Intent Agent to skip LLM round-trips on repeated or near-duplicate messages.
+    The first tier is an in-process LRU keyed by a BLAKE2b digest of the exact message text.
+    The second tier is a semantic cache stored in the Qdrant 'intent_cache' collection, matched by cosine similarity
+    of the message embedding against previously classified messages.
+    Both tiers are scoped by a context hash of the preceding turns so that identical wording in different conversations does not collide.
+    On a miss, vote() can still classify a message locally from its nearest labeled neighbors across all conversations.
+    """
+    def __init__(self):
+        self.settings = get_settings()
+        self.collection_name = vector_db_service.intent_cache_collection_name
+        self.similarity_threshold = self.settings.INTENT_CACHE_SIMILARITY_THRESHOLD
+        self.ttl = self.settings.INTENT_CACHE_TTL
+        self.exact_cache = LRUCache(maxsize=self.settings.INTENT_CACHE_SIZE)
+        self.knn_neighbors = self.settings.INTENT_KNN_NEIGHBORS
+        self.knn_min_similarity = self.settings.INTENT_KNN_MIN_SIMILARITY
+        self.knn_min_votes = self.settings.INTENT_KNN_MIN_VOTES
+        self.knn_min_confidence = self.settings.INTENT_KNN_MIN_CONFIDENCE
+        self.knn_min_label_confidence = self.settings.INTENT_KNN_MIN_LABEL_CONFIDENCE
+
+    @staticmethod
+    def _exact_key(text: str, context_hash: str) -> bytes:
+        """Build the exact-match cache key from the context hash and the message text."""
+        return hashlib.blake2b(f"{context_hash}|{text}".encode("utf-8")).digest()
+
+    async def lookup(self, text: str, context_hash: str) -> Tuple[Optional[AgentResponse], Optional[np.ndarray]]:
+        """
+        Look up a cached intent for the given text within the given conversational context.
+        Returns a tuple of (cached AgentResponse or None, embedding of the text or None).
+        The embedding is returned on a semantic miss so that the caller can store the fresh result without re-embedding.
+        """
+        key = self._exact_key(text, context_hash)
+        cached = self.exact_cache.get(key)
+        if cached is not None:
+            app_logger.debug("Intent Cache: Exact hit for text: {:.50}", text)
+            return cached, None
+
+        embedding = await vector_db_service.get_embedding(text)
+        if embedding is None:
+            return None, None
+
+        try:
+            hits = await vector_db_service.client.search(
+                collection_name=self.collection_name,
+                query_vector=embedding,
+                query_filter=Filter(must=[FieldCondition(key="ctx", match=MatchValue(value=context_hash))]),
+                limit=1,
+                score_threshold=self.similarity_threshold,
+                with_payload=True
+            )
+        except Exception as e:
+            app_logger.warning(f"Intent Cache: Semantic lookup failed for text '{text[:50]}...': {e}")
+            return None, embedding
+
+        if not hits:
+            return None, embedding
+
+        payload = hits[0].payload
+        cached = AgentResponse(
+            agent_name="IntentAgent",
+            result={"intent": payload["intent"], "confidence": payload["confidence"]},
+            confidence=payload["confidence"]
+        )
+        self.exact_cache.set(key, cached)
+        app_logger.debug("Intent Cache: Semantic hit (score {:.3f}) for text: {:.50}", hits[0].score, text)
+        return cached, embedding
+
+    async def vote(self, text: str, context_hash: str, embedding: Optional[np.ndarray]) -> Optional[AgentResponse]:
+        """
+        Classify text locally by a similarity-weighted vote of the nearest messages the LLM has already labeled, in any conversation.
+        Returns an AgentResponse when at least INTENT_KNN_MIN_VOTES neighbors are close enough and the winning intent carries
+        at least INTENT_KNN_MIN_CONFIDENCE of the vote weight; otherwise returns None so that the caller asks the LLM.
+        Context-dependent follow-ups get mixed labels across conversations and therefore fall through to the LLM.
+        Labels the LLM gave with less than INTENT_KNN_MIN_LABEL_CONFIDENCE are filtered out server-side and never vote.
+        Voted intents go to the exact tier only, so that local guesses never become neighbors for later votes.
+        """
+        if embedding is None or self.knn_neighbors <= 0:
+            return None
+        try:
+            hits = await vector_db_service.client.search(
+                collection_name=self.collection_name,
+                query_vector=embedding,
+                query_filter=Filter(must=[FieldCondition(key="confidence", range=Range(gte=self.knn_min_label_confidence))]),
+                limit=self.knn_neighbors,
+                score_threshold=self.knn_min_similarity,
+                with_payload=["intent"]
+            )
+        except Exception as e:
+            app_logger.warning(f"Intent Cache: Neighbor vote failed for text '{text[:50]}...': {e}")
+            return None
+        if len(hits) < self.knn_min_votes:
+            return None
+
+        votes: Dict[str, float] = {}
+        for hit in hits:
+            intent = hit.payload["intent"]
+            votes[intent] = votes.get(intent, 0.0) + hit.score
+        intent, weight = max(votes.items(), key=lambda item: item[1])
+        confidence = round(weight / sum(votes.values()), 2)
+        if confidence < self.knn_min_confidence:
+            app_logger.debug("Intent Cache: Neighbor vote inconclusive ({} for '{}') for text: {:.50}", confidence, intent, text)
+            return None
+
+        response = AgentResponse(
+            agent_name="IntentAgent",
+            result={"intent": intent, "confidence": confidence},
+            confidence=confidence
+        )
+        self.exact_cache.set(self._exact_key(text, context_hash), response)
+        app_logger.debug("Intent Cache: Neighbor vote of {} hits chose '{}' ({}) for text: {:.50}", len(hits), intent, confidence, text)
+        return response
+
+    async def store(self, text: str, context_hash: str, response: AgentResponse, embedding: Optional[np.ndarray] = None) -> None:
+        """
+        Store a successfully parsed intent in both cache tiers under the given context hash.
+        Only the exact tier is populated when no embedding is available for the text.
+        The Qdrant entry keeps the label and its storage time but not the customer's message, which lookups never read.
+        """
+        self.exact_cache.set(self._exact_key(text, context_hash), response)
+        if embedding is None:
+            return
+
+        point = PointStruct(
+            id=vector_db_service.generate_point_id(text, context_hash),
+            vector=embedding.tolist(),
+            payload={
+                "ctx": context_hash,
+                "intent": response.result["intent"],
+                "confidence": response.result["confidence"],
+                "stored_at": int(time.time())
+            }
+        )
+        try:
+            await vector_db_service.client.upsert(
+                collection_name=self.collection_name,
+                points=[point]
+            )
+        except Exception as e:
+            app_logger.warning(f"Intent Cache: Failed to store semantic entry for text '{text[:50]}...': {e}")
+
+    async def purge_expired(self) -> None:
+        """
+        Delete Qdrant intent cache entries older than INTENT_CACHE_TTL with one server-side delete by filter, so the collection
+        stays bounded. Entries stored before the storage time was recorded are purged as well.
+        """
+        cutoff = int(time.time() - self.ttl)
+        expired = Filter(should=[
+            FieldCondition(key="stored_at", range=Range(lt=cutoff)),
+            IsEmptyCondition(is_empty=PayloadField(key="stored_at"))
+        ])
+        try:
+            await vector_db_service.client.delete(collection_name=self.collection_name, points_selector=expired)
+            app_logger.debug("Intent Cache: Purged entries stored before {}", cutoff)
+        except Exception as e:
+            app_logger.warning(f"Intent Cache: Failed to purge expired entries: {e}")
+
+
+intent_cache = IntentCache()
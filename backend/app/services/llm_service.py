@@ -1,66 +1,186 @@
 import asyncio
+import json
 import aiohttp
 from app.core.config import get_settings
 from app.utils.logger import app_logger
-from typing import Optional, List, Dict
+from app.utils.http import json_dumps, read_json
+from app.utils.backoff import NON_RETRYABLE_STATUSES, backoff_delay
+from app.utils.llm_parse import JsonEndScanner
+from app.utils.single_flight import single_flight
+from typing import Optional, List, Dict, Tuple
+
+_BASE_SYSTEM_PROMPT = "Ты помощник, поддерживающий русский язык."
 
 class LLMService:
     """Service for interacting with the MWS LLM API to support contact center agents with text analysis and generation."""
     def __init__(self):
         self.settings = get_settings()
+        # Hot-path settings bound to plain attributes once instead of read through the settings model per request
         self.max_retries = self.settings.MAX_RETRIES
+        self._url = self.settings.MWS_CHAT_COMPLETION_URL
         self.timeout = aiohttp.ClientTimeout(total=self.settings.REQUEST_TIMEOUT)
+        self.session: Optional[aiohttp.ClientSession] = None  # Shared app-wide session, attached in the app lifespan
+        # Bounds in-flight completions across all concurrent agents so bursts do not trip provider rate limits
+        self.semaphore = asyncio.Semaphore(self.settings.MWS_MAX_INFLIGHT)
+        # Request parts that never change between calls are built once and shared by every payload
+        self._headers = {
+            "Authorization": f"Bearer {self.settings.MWS_API_KEY}",
+            "Content-Type": "application/json",
+        }
+        # Models hosted on their own servers (e.g. quantized intent/QA models) map to their URL and headers; the rest go to MWS
+        endpoint_headers = {"Content-Type": "application/json"}
+        if self.settings.MODEL_ENDPOINTS_API_KEY:
+            endpoint_headers["Authorization"] = f"Bearer {self.settings.MODEL_ENDPOINTS_API_KEY}"
+        self._model_routes: Dict[str, Tuple[str, Dict[str, str]]] = {
+            model: (url, endpoint_headers) for model, url in self.settings.MODEL_ENDPOINTS.items()
+        }
+        self._system_msg = {"role": "system", "content": _BASE_SYSTEM_PROMPT}
+        # Agent-specific system messages keyed by their static prompt; each agent passes one fixed string, so this stays tiny
+        self._system_msgs: Dict[str, Dict[str, str]] = {}
+        # In-flight completions keyed by their full request arguments, so identical concurrent calls share one round-trip
+        self._inflight: Dict[tuple, asyncio.Task] = {}
+
+    def _system_message(self, system_prompt: Optional[str]) -> Dict[str, str]:
+        """Return the system message for an agent's static prompt, built once per distinct prompt."""
+        if system_prompt is None:
+            return self._system_msg
+        message = self._system_msgs.get(system_prompt)
+        if message is None:
+            message = {"role": "system", "content": f"{_BASE_SYSTEM_PROMPT}\n{system_prompt}"}
+            self._system_msgs[system_prompt] = message
+        return message
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Return the shared HTTP session, creating a private one when used outside the application lifespan."""
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(timeout=self.timeout, json_serialize=json_dumps)
+        return self.session
 
-    async def call_llm(self, prompt: str, model_name: str, temperature: float = 0.7) -> Optional[str]:
+    async def call_llm(
+        self,
+        prompt: str,
+        model_name: str,
+        temperature: float = 0.7,
+        system_prompt: Optional[str] = None,
+        stop_at_json: bool = False
+    ) -> Optional[str]:
         """
         Call the MWS GPT API for chat completion with the given prompt for agent tasks like intent detection.
-        Retries on transient errors (e.g., 429 Rate Limit, 5xx Server Errors) but not on unrecoverable errors (other 4xx).
+        An optional system_prompt carries an agent's static instructions ahead of the per-call prompt; keeping it byte-identical
+        across calls gives the provider a stable prefix to serve from its prompt cache.
+        With stop_at_json=True the completion is streamed and reading stops as soon as the first JSON object or array
+        in it is complete, for agents that only parse that value; the returned text then ends with it.
+        Concurrent calls with identical arguments share a single in-flight request.
+        Returns the generated text or None if the call fails after retries.
+        """
+        return await single_flight(
+            self._inflight,
+            (model_name, temperature, system_prompt, prompt, stop_at_json),
+            lambda: self._request_completion(prompt, model_name, temperature, system_prompt, stop_at_json)
+        )
+
+    async def _request_completion(
+        self,
+        prompt: str,
+        model_name: str,
+        temperature: float,
+        system_prompt: Optional[str],
+        stop_at_json: bool
+    ) -> Optional[str]:
+        """
+        Send one chat completion request to the MWS GPT API, or to the model's own server when it is listed in MODEL_ENDPOINTS.
+        Retries transient errors (429, 5xx, timeouts) with capped, jittered exponential backoff; client errors like 400/401/422 fail immediately.
         Returns the generated text or None if the call fails after retries.
         """
+        payload = {
+            "model": model_name,
+            "messages": [self._system_message(system_prompt), {"role": "user", "content": prompt}],
+            "temperature": temperature,
+        }
+        if stop_at_json:
+            payload["stream"] = True
+            # Streamed completions only report token usage in a final chunk when asked to
+            payload["stream_options"] = {"include_usage": True}
+        url, headers = self._model_routes.get(model_name, (self._url, self._headers))
         retries = 0
         while retries < self.max_retries:
+            retry_after = None
             try:
-                app_logger.debug(f"Calling MWS model {model_name} with prompt: {prompt[:50]}... (Attempt {retries+1}/{self.max_retries})")
-                async with aiohttp.ClientSession(timeout=self.timeout) as session:
-                    response = await session.post(
-                        url=self.settings.MWS_CHAT_COMPLETION_URL,
-                        headers={
-                            "Authorization": f"Bearer {self.settings.MWS_API_KEY}",
-                            "Content-Type": "application/json",
-                        },
-                        json={
-                            "model": model_name,
-                            "messages": [
-                                {"role": "system", "content": "Ты помощник, поддерживающий русский язык."},
-                                {"role": "user", "content": prompt}
-                            ],
-                            "temperature": temperature,
-                        }
-                    )
-                    if response.status == 200:
-                        data = await response.json()
-                        app_logger.debug(f"Received successful response from MWS model {model_name}")
-                        return data["choices"][0]["message"]["content"]
-                    elif response.status == 429 or response.status >= 500:
-                        error_text = await response.text()
-                        truncated_text = error_text[:500] + "..." if len(error_text) > 500 else error_text
-                        app_logger.warning(f"MWS API transient error {response.status} (retry {retries+1}/{self.max_retries}): {truncated_text}")
-                        retries += 1
-                        await asyncio.sleep(8 * (2 ** retries))  # Increased base backoff from 5 to 8 seconds for rate limits
-                    else:
+                app_logger.debug("Calling MWS model {} with prompt: {:.50}... (Attempt {}/{})", model_name, prompt, retries+1, self.max_retries)
+                async with self.semaphore:
+                    async with self._get_session().post(
+                        url=url,
+                        headers=headers,
+                        json=payload
+                    ) as response:
+                        if response.status == 200:
+                            # Endpoints that ignore the stream flag answer with a regular JSON body, which is read as usual
+                            if response.content_type == "text/event-stream":
+                                content, usage = await self._read_until_json(response)
+                            else:
+                                data = await read_json(response)
+                                content = data["choices"][0]["message"]["content"]
+                                usage = data.get("usage")
+                            # OpenAI-compatible usage reports how much of the prompt the provider served from its prefix cache
+                            usage = usage or {}
+                            app_logger.debug(
+                                "Received successful response from MWS model {} ({} prompt tokens, {} cached)",
+                                model_name, usage.get("prompt_tokens"), (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+                            )
+                            return content
                         error_text = await response.text()
-                        truncated_text = error_text[:500] + "..." if len(error_text) > 500 else error_text
-                        app_logger.error(f"MWS API unrecoverable error {response.status}: {truncated_text}")
-                        return None  # No retry on other 4xx errors (e.g., 400, 403)
-            except asyncio.TimeoutError as te:
-                app_logger.error(f"MWS API call timeout for model {model_name} after {self.settings.REQUEST_TIMEOUT}s (retry {retries+1}/{self.max_retries})")
-                retries += 1
-                await asyncio.sleep(8 * (2 ** retries))  # Increased backoff for timeouts
+                        if response.status in NON_RETRYABLE_STATUSES:
+                            app_logger.error("MWS API unrecoverable error {}: {:.500}", response.status, error_text)
+                            return None
+                        app_logger.warning("MWS API transient error {} (retry {}/{}): {:.500}", response.status, retries + 1, self.max_retries, error_text)
+                        retry_after = response.headers.get("Retry-After")
+            except asyncio.TimeoutError:
+                app_logger.error("MWS API call timeout for model {} after {}s (retry {}/{})", model_name, self.settings.REQUEST_TIMEOUT, retries + 1, self.max_retries)
             except Exception as e:
-                app_logger.error(f"MWS API call error for model {model_name}: {str(e)} (retry {retries+1}/{self.max_retries})")
-                retries += 1
-                await asyncio.sleep(8 * (2 ** retries))  # Increased backoff for general errors
-        app_logger.error(f"Max retries reached for MWS API call with model {model_name}")
+                app_logger.error("MWS API call error for model {}: {} (retry {}/{})", model_name, e, retries + 1, self.max_retries)
+            retries += 1
+            # Back off outside the semaphore so a throttled call does not hold a slot while it waits
+            if retries < self.max_retries:
+                delay = backoff_delay(retries, retry_after)
+                if delay is None:
+                    app_logger.error("MWS API asked to retry model {} after {}s, longer than the retry backoff allows; giving up", model_name, retry_after)
+                    return None
+                await asyncio.sleep(delay)
+        app_logger.error("Max retries reached for MWS API call with model {}", model_name)
         return None
 
+    @staticmethod
+    async def _read_until_json(response: aiohttp.ClientResponse) -> Tuple[str, Optional[dict]]:
+        """
+        Accumulate the content deltas of a streamed (SSE) chat completion up to the end of the first JSON value in it.
+        Returns the content together with the token usage of the final chunk (requested via stream_options), or None without it.
+        Events without content that follow the JSON (finish reason, usage, [DONE]) are read to the end of the body, so the
+        keep-alive connection goes back to the pool. Only when the model keeps generating content past the JSON is reading
+        abandoned: aiohttp then closes the connection, trading a new TLS handshake later for not waiting on the rest of the generation.
+        """
+        parts: List[str] = []
+        scanner = JsonEndScanner()
+        complete = False
+        usage = None
+        async for line in response.content:
+            if not line.startswith(b"data:"):
+                continue
+            data = line[5:].strip()
+            if data == b"[DONE]":
+                continue
+            try:
+                event = json.loads(data)
+                # The usage chunk comes last and carries an empty choices list
+                usage = event.get("usage") or usage
+                delta = event["choices"][0]["delta"].get("content")
+            except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+                continue
+            if not delta:
+                continue
+            if complete:
+                break
+            parts.append(delta)
+            complete = scanner.feed(delta)
+        return "".join(parts), usage
+
 llm_service = LLMService()
@@ -1,37 +1,109 @@
 import asyncio
 import aiohttp
 import hashlib
-from qdrant_client import QdrantClient
-from qdrant_client.http.models import PointStruct, VectorParams, Distance, FieldCondition, MatchValue
+import itertools
+import time
+from datetime import datetime
+from functools import lru_cache
+import numpy as np
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.http.models import (
+    PointStruct, VectorParams, Distance, Filter, FieldCondition, MatchValue, PayloadSchemaType,
+    IsEmptyCondition, PayloadField, OrderBy, Direction, SetPayload, SetPayloadOperation,
+    ScalarQuantization, ScalarQuantizationConfig, ScalarType, BinaryQuantization, BinaryQuantizationConfig,
+    HnswConfigDiff, SearchParams, QuantizationSearchParams
+)
 from app.core.config import get_settings
 from app.utils.logger import app_logger
-from typing import List, Dict, Optional
+from app.utils.http import json_dumps, read_json
+from app.utils.backoff import NON_RETRYABLE_STATUSES, backoff_delay
+from app.utils.cache import LRUCache
+from app.utils.semantic_cache import SemanticCache
+from app.utils.single_flight import single_flight
+from typing import Any, Callable, List, Dict, Optional
 from app.models.schemas import Customer
 
+# Monotonic ordering key for conversation turns, seeded from wall-clock microseconds so it keeps increasing across restarts.
+# next() on itertools.count is atomic under the GIL and needs no clock syscall per turn.
+_turn_seq = itertools.count(time.time_ns() // 1000)
+
+# Payload fields read when rendering conversation history; the rest of each stored turn stays on the server
+_HISTORY_PAYLOAD_FIELDS = ["user_text", "operator_response", "timestamp", "turn_seq"]
+
+
+@lru_cache(maxsize=4096)
+def _phone_number_filter(phone_number: str) -> Filter:
+    """
+    Build the typed Qdrant filter matching a customer's phone_number payload field, served by its keyword index.
+    Cached per phone number because every history, customer and cleanup lookup for an active customer repeats it.
+    Callers must treat the returned filter as read-only.
+    """
+    return Filter(must=[FieldCondition(key="phone_number", match=MatchValue(value=phone_number))])
+
 class VectorDBService:
     """Manages interactions with Qdrant vector database for storing and retrieving knowledge base data, customer profiles, conversation history, and queue state."""
     def __init__(self):
         self.settings = get_settings()
-        self.client = QdrantClient(
+        # gRPC is used for data-plane calls (bulk uploads, search, scroll); filters must be typed models in this mode
+        # The async client runs calls on the event loop, multiplexed over one channel, instead of one worker thread per call
+        self.client = AsyncQdrantClient(
             url=self.settings.QDRANT_URL,
             api_key=self.settings.QDRANT_API_KEY,
-            timeout=10.0
+            timeout=10.0,
+            prefer_grpc=self.settings.QDRANT_PREFER_GRPC,
+            grpc_port=self.settings.QDRANT_GRPC_PORT
         )
         self.collection_name = self.settings.KNOWLEDGE_COLLECTION_NAME
         self.history_collection_name = "conversation_history"
         self.customers_collection_name = "customers"
         self.queue_collection_name = "queue_state"
+        self.intent_cache_collection_name = "intent_cache"
         self.embedding_model = self.settings.EMBEDDING_MODEL
+        self.quantization = self.settings.KNOWLEDGE_QUANTIZATION.lower()
+        # Binary codes are coarser than int8, so they need a larger candidate set for rescoring to recover the exact ranking
+        self.search_oversampling = 3.0 if self.quantization == "binary" else 2.0
         self.vector_size = None  # Set dynamically after first embedding generation
         self.timeout = aiohttp.ClientTimeout(total=self.settings.REQUEST_TIMEOUT)
+        # Hot-path settings bound to plain attributes once instead of read through the settings model per request
+        self.max_retries = self.settings.MAX_RETRIES
+        self._embedding_url = self.settings.MWS_EMBEDDING_URL
+        self._batch_window = self.settings.EMBEDDING_BATCH_WINDOW_MS / 1000
+        self._batch_size = self.settings.EMBEDDING_BATCH_SIZE
+        self.session: Optional[aiohttp.ClientSession] = None  # Shared app-wide session, attached in the app lifespan
+        self._headers = {
+            "Authorization": f"Bearer {self.settings.MWS_API_KEY}",
+            "Content-Type": "application/json",
+        }
+        # Embeddings keyed by a BLAKE2b digest of the text; in-flight requests are shared so concurrent duplicates embed once
+        self.embedding_cache = LRUCache(maxsize=self.settings.EMBEDDING_CACHE_SIZE, ttl=self.settings.EMBEDDING_CACHE_TTL)
+        self._pending_embeddings: Dict[bytes, asyncio.Task] = {}
+        # Micro-batcher state: texts queued within one batching window are embedded with a single API request
+        self._embedding_batch: List[tuple] = []
+        self._embedding_flush_handle: Optional[asyncio.TimerHandle] = None
+        self._embedding_batch_tasks: set = set()
+        # Knowledge search results for near-duplicate queries, one cache per (top_k, payload_fields) combination
+        self.query_caches: Dict[tuple, SemanticCache] = {}
+        # Caches of answers derived from knowledge search (e.g. the Knowledge Agent's), dropped together with the search results
+        self.knowledge_dependent_caches: List[Any] = []
+        # Customer profiles by phone number, refreshed on upsert and dropped on delete; concurrent lookups share one scroll
+        self.customer_cache = LRUCache(maxsize=self.settings.CUSTOMER_CACHE_SIZE, ttl=self.settings.CUSTOMER_CACHE_TTL)
+        self._pending_customers: Dict[str, asyncio.Task] = {}
+        # Callbacks dropping per-customer state derived from history (e.g. rolling summaries) once that history is deleted
+        self.customer_reset_hooks: List[Callable[[str], None]] = []
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Return the shared HTTP session, creating a private one when used outside the application lifespan."""
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(timeout=self.timeout, json_serialize=json_dumps)
+        return self.session
 
     async def ensure_collection(self):
         """
-        Ensures the existence of collections for knowledge base, conversation history, customer profiles, and queue state in Qdrant.
+        Ensures the existence of collections for knowledge base, conversation history, customer profiles, queue state and the intent cache in Qdrant.
         Dynamically sets vector size based on embedding model and creates payload indexes on phone_number for efficient filtering.
         """
         try:
-            collections = await asyncio.to_thread(self.client.get_collections)
+            collections = await self.client.get_collections()
             collection_names = [c.name for c in collections.collections]
 
             # Handle knowledge base collection for storing domain-specific information
@@ -39,203 +111,389 @@ class VectorDBService:
                 if self.vector_size is None:
                     app_logger.info("Vector size not set, generating a sample embedding to determine dimension...")
                     sample_embedding = await self.get_embedding("тест")
-                    if sample_embedding:
+                    if sample_embedding is not None:
                         self.vector_size = len(sample_embedding)
                         app_logger.info(f"Determined vector size: {self.vector_size}")
                     else:
                         app_logger.error("Failed to generate sample embedding, defaulting to 1024")
                         self.vector_size = 1024  # Fallback vector size if embedding fails
 
-                await asyncio.to_thread(
-                    self.client.create_collection,
-                    collection_name=self.collection_name,
-                    vectors_config=VectorParams(size=self.vector_size, distance=Distance.COSINE)
-                )
-                app_logger.info(f"Created collection {self.collection_name} in Qdrant with vector size {self.vector_size}")
+                await self.create_knowledge_collection()
             else:
-                app_logger.debug(f"Collection {self.collection_name} already exists")
+                app_logger.debug("Collection {} already exists", self.collection_name)
                 if self.vector_size is None:
-                    collection_info = await asyncio.to_thread(
-                        self.client.get_collection,
+                    collection_info = await self.client.get_collection(
                         collection_name=self.collection_name
                     )
                     self.vector_size = collection_info.config.params.vectors.size
                     app_logger.info(f"Retrieved vector size from existing collection: {self.vector_size}")
 
-            # Handle conversation history collection with index for efficient lookups by phone_number and timestamp
-            if self.history_collection_name not in collection_names:
-                await asyncio.to_thread(
-                    self.client.create_collection,
-                    collection_name=self.history_collection_name,
-                    vectors_config=VectorParams(size=self.vector_size, distance=Distance.COSINE)
-                )
-                await asyncio.to_thread(
-                    self.client.create_payload_index,
-                    collection_name=self.history_collection_name,
-                    field_name="phone_number",
-                    field_type="keyword"
-                )
-                await asyncio.to_thread(
-                    self.client.create_payload_index,
-                    collection_name=self.history_collection_name,
-                    field_name="timestamp",
-                    field_type="keyword"
-                )
-                app_logger.info(f"Created collection {self.history_collection_name} with indexes on phone_number and timestamp")
-            else:
-                app_logger.debug(f"Collection {self.history_collection_name} already exists")
-                # Ensure indexes exist for performance optimization
-                indexes = await asyncio.to_thread(
-                    self.client.get_collection,
-                    collection_name=self.history_collection_name
-                )
-                index_fields = [idx.field_name for idx in indexes.payload_schema.values()] if indexes.payload_schema else []
-                if "phone_number" not in index_fields:
-                    await asyncio.to_thread(
-                        self.client.create_payload_index,
-                        collection_name=self.history_collection_name,
-                        field_name="phone_number",
-                        field_type="keyword"
-                    )
-                    app_logger.info(f"Added index on phone_number for {self.history_collection_name}")
-                if "timestamp" not in index_fields:
-                    await asyncio.to_thread(
-                        self.client.create_payload_index,
-                        collection_name=self.history_collection_name,
-                        field_name="timestamp",
-                        field_type="keyword"
-                    )
-                    app_logger.info(f"Added index on timestamp for {self.history_collection_name}")
-
-            # Handle customers collection with index for fast retrieval by phone_number
-            if self.customers_collection_name not in collection_names:
-                await asyncio.to_thread(
-                    self.client.create_collection,
-                    collection_name=self.customers_collection_name,
-                    vectors_config=VectorParams(size=self.vector_size, distance=Distance.COSINE)
-                )
-                await asyncio.to_thread(
-                    self.client.create_payload_index,
-                    collection_name=self.customers_collection_name,
-                    field_name="phone_number",
-                    field_type="keyword"
-                )
-                app_logger.info(f"Created collection {self.customers_collection_name} with index on phone_number")
-            else:
-                app_logger.debug(f"Collection {self.customers_collection_name} already exists")
-                indexes = await asyncio.to_thread(
-                    self.client.get_collection,
-                    collection_name=self.customers_collection_name
-                )
-                index_fields = [idx.field_name for idx in indexes.payload_schema.values()] if indexes.payload_schema else []
-                if "phone_number" not in index_fields:
-                    await asyncio.to_thread(
-                        self.client.create_payload_index,
-                        collection_name=self.customers_collection_name,
-                        field_name="phone_number",
-                        field_type="keyword"
-                    )
-                    app_logger.info(f"Added index on phone_number for {self.customers_collection_name}")
-
-            # Handle queue state collection for persisting customer queue and active conversation
-            if self.queue_collection_name not in collection_names:
-                await asyncio.to_thread(
-                    self.client.create_collection,
-                    collection_name=self.queue_collection_name,
-                    vectors_config=VectorParams(size=self.vector_size, distance=Distance.COSINE)
-                )
-                app_logger.info(f"Created collection {self.queue_collection_name} for queue state persistence")
-            else:
-                app_logger.debug(f"Collection {self.queue_collection_name} already exists")
+            # History, customers and queue state are only ever looked up by payload filters, never by vector similarity,
+            # so their (placeholder or unused) vectors are kept on disk rather than in RAM.
+            # The remaining collections only depend on the vector size resolved above, so they are set up concurrently.
+            setups = {
+                self.history_collection_name: self._ensure_filtered_collection(
+                    self.history_collection_name, collection_names,
+                    {"phone_number": PayloadSchemaType.KEYWORD, "timestamp": PayloadSchemaType.KEYWORD, "turn_seq": PayloadSchemaType.INTEGER}
+                ),
+                self.customers_collection_name: self._ensure_filtered_collection(
+                    self.customers_collection_name, collection_names, {"phone_number": PayloadSchemaType.KEYWORD}
+                ),
+                self.queue_collection_name: self._ensure_filtered_collection(
+                    self.queue_collection_name, collection_names, {}
+                ),
+                # The intent cache is searched by vector similarity, so its vectors stay in RAM
+                self.intent_cache_collection_name: self._ensure_filtered_collection(
+                    self.intent_cache_collection_name, collection_names,
+                    {"ctx": PayloadSchemaType.KEYWORD, "confidence": PayloadSchemaType.FLOAT, "stored_at": PayloadSchemaType.INTEGER},
+                    on_disk=False
+                ),
+            }
+            results = await asyncio.gather(*setups.values(), return_exceptions=True)
+            for name, result in zip(setups, results):
+                if isinstance(result, Exception):
+                    app_logger.error(f"Error creating or updating collection {name} in Qdrant: {result}")
+                elif name == self.history_collection_name and "turn_seq" in result:
+                    await self._backfill_turn_seq()
         except Exception as e:
             app_logger.error(f"Error creating or retrieving collections in Qdrant: {e}")
 
-    async def get_embedding(self, text: str) -> Optional[List[float]]:
+    async def _ensure_filtered_collection(
+        self,
+        collection_name: str,
+        collection_names: List[str],
+        indexes: Dict[str, PayloadSchemaType],
+        on_disk: bool = True
+    ) -> List[str]:
+        """
+        Create collection_name with the given payload indexes if it does not exist, or add the indexes an existing collection lacks.
+        Index creations are independent server-side operations, so they are issued concurrently.
+        Returns the fields whose index was added to an already existing collection, which may need their payload backfilled.
+        """
+        if collection_name not in collection_names:
+            await self.client.create_collection(
+                collection_name=collection_name,
+                vectors_config=VectorParams(size=self.vector_size, distance=Distance.COSINE, on_disk=on_disk)
+            )
+            missing = list(indexes)
+            created = True
+        else:
+            app_logger.debug("Collection {} already exists", collection_name)
+            if not indexes:
+                return []
+            collection_info = await self.client.get_collection(collection_name=collection_name)
+            index_fields = collection_info.payload_schema or {}
+            missing = [field for field in indexes if field not in index_fields]
+            created = False
+
+        await asyncio.gather(*(
+            self.client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field,
+                field_schema=indexes[field]
+            )
+            for field in missing
+        ))
+        if created:
+            app_logger.info(f"Created collection {collection_name}" + (f" with indexes on {', '.join(missing)}" if missing else ""))
+            return []
+        for field in missing:
+            app_logger.info(f"Added index on {field} for {collection_name}")
+        return missing
+
+    async def _backfill_turn_seq(self, batch_size: int = 256) -> None:
+        """
+        Assign turn_seq to history entries stored before it existed, derived from their ISO timestamp in epoch microseconds.
+        This matches the clock the live sequence is seeded from, so old and new turns interleave correctly,
+        and lets history be ordered by Qdrant, which leaves out points that lack the order_by key.
+        """
+        missing_seq = Filter(must=[IsEmptyCondition(is_empty=PayloadField(key="turn_seq"))])
+        updated = 0
+        while True:
+            points, _ = await self.client.scroll(
+                collection_name=self.history_collection_name,
+                scroll_filter=missing_seq,
+                limit=batch_size,
+                with_payload=["timestamp"],
+                with_vectors=False
+            )
+            if not points:
+                break
+            operations = []
+            for point in points:
+                try:
+                    turn_seq = int(datetime.fromisoformat(point.payload.get("timestamp", "")).timestamp() * 1_000_000)
+                except (TypeError, ValueError):
+                    turn_seq = 0
+                operations.append(SetPayloadOperation(set_payload=SetPayload(payload={"turn_seq": turn_seq}, points=[point.id])))
+            await self.client.batch_update_points(
+                collection_name=self.history_collection_name,
+                update_operations=operations,
+                wait=True
+            )
+            updated += len(operations)
+        app_logger.info(f"Backfilled turn_seq for {updated} history entries in {self.history_collection_name}")
+
+    async def create_knowledge_collection(self):
+        """
+        Create the knowledge base collection with quantized vectors kept in RAM, as selected by KNOWLEDGE_QUANTIZATION.
+        "scalar" stores int8 vectors (a quarter of float32) scored with SIMD int8 kernels.
+        "binary" stores one bit per dimension (1/32 of float32) scored with popcount and moves the original vectors to disk.
+        Searches rescore an oversampled candidate set against the original vectors to preserve ranking quality.
+        """
+        vector_size = self.vector_size if self.vector_size else 1024
+        if self.quantization == "binary":
+            vectors_config = VectorParams(size=vector_size, distance=Distance.COSINE, on_disk=True)
+            quantization_config = BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+        else:
+            vectors_config = VectorParams(size=vector_size, distance=Distance.COSINE)
+            quantization_config = ScalarQuantization(
+                scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+            )
+        await self.client.create_collection(
+            collection_name=self.collection_name,
+            vectors_config=vectors_config,
+            quantization_config=quantization_config,
+            hnsw_config=HnswConfigDiff(m=16, ef_construct=128, on_disk=False)
+        )
+        app_logger.info(f"Created collection {self.collection_name} in Qdrant with vector size {vector_size} and {self.quantization} quantization")
+        # Cached search results refer to the previous contents of the collection
+        self.clear_knowledge_caches()
+
+    def clear_knowledge_caches(self) -> None:
+        """
+        Drop every cached knowledge search result and the registered caches derived from them.
+        Called whenever the knowledge collection is recreated or reindexed, so no answer outlives the documents it came from.
+        """
+        self.query_caches.clear()
+        for cache in self.knowledge_dependent_caches:
+            cache.clear()
+
+    def reset_customer_state(self, phone_number: str) -> None:
+        """
+        Run the registered reset hooks for a customer whose conversation history was deleted.
+        Keeps state derived from the old history from reaching a reassigned number's new owner.
+        """
+        for hook in self.customer_reset_hooks:
+            hook(phone_number)
+
+    async def get_embedding(self, text: str) -> Optional[np.ndarray]:
+        """
+        Return the embedding for text as a float32 numpy vector, served from the in-process embedding cache when possible.
+        Concurrent calls for the same text await a single MWS API request instead of issuing one each.
+        Failed requests are not cached, so the next call retries the API.
+        """
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        embedding = self.embedding_cache.get(key)
+        if embedding is not None:
+            return embedding
+
+        return await single_flight(
+            self._pending_embeddings, key, lambda: self._embed_batched(text),
+            on_result=lambda result: self.embedding_cache.set(key, result)
+        )
+
+    async def _embed_batched(self, text: str) -> Optional[np.ndarray]:
+        """
+        Queue text for the embedding micro-batcher and wait for its embedding.
+        Texts queued within EMBEDDING_BATCH_WINDOW_MS of each other, up to EMBEDDING_BATCH_SIZE, share one MWS API request.
+        A window of 0 disables batching and embeds the text with its own request.
+        """
+        window = self._batch_window
+        if window <= 0:
+            return await self._request_embedding(text)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._embedding_batch.append((text, future))
+        if len(self._embedding_batch) >= self._batch_size:
+            self._flush_embedding_batch()
+        elif self._embedding_flush_handle is None:
+            self._embedding_flush_handle = loop.call_later(window, self._flush_embedding_batch)
+        return await future
+
+    def _flush_embedding_batch(self) -> None:
+        """Send all queued texts to the embedding API as one batch in a background task."""
+        if self._embedding_flush_handle is not None:
+            self._embedding_flush_handle.cancel()
+            self._embedding_flush_handle = None
+        batch, self._embedding_batch = self._embedding_batch, []
+        if not batch:
+            return
+        task = asyncio.create_task(self._run_embedding_batch(batch))
+        self._embedding_batch_tasks.add(task)
+        task.add_done_callback(self._embedding_batch_tasks.discard)
+
+    async def _run_embedding_batch(self, batch: List[tuple]) -> None:
+        """
+        Embed a queued batch and resolve each waiting future with its embedding, or None if its text could not be embedded.
+        If the batch request fails, every text is retried with its own request, so one bad text only fails its own caller.
+        """
+        texts = [text for text, _ in batch]
+        embeddings = None
+        if len(texts) > 1:
+            app_logger.debug("Embedding micro-batch of {} queued texts", len(texts))
+            try:
+                embeddings = await self.get_embeddings_batch(texts)
+            except Exception as e:
+                app_logger.warning(f"Embedding micro-batch of {len(texts)} texts failed: {e}")
+            if embeddings is None:
+                app_logger.debug("Embedding the {} texts of a failed micro-batch one by one", len(texts))
+        if embeddings is None:
+            results = await asyncio.gather(*(self._request_embedding(text) for text in texts), return_exceptions=True)
+            embeddings = [None if isinstance(result, BaseException) else result for result in results]
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+    async def _request_embedding(self, text: str) -> Optional[np.ndarray]:
         """Generate embedding for text using MWS API with validation to ensure proper vector size."""
         retries = 0
-        while retries < self.settings.MAX_RETRIES:
+        while retries < self.max_retries:
+            retry_after = None
             try:
-                app_logger.debug(f"Generating embedding for text: {text[:50]}... using model {self.embedding_model}")
-                async with aiohttp.ClientSession(timeout=self.timeout) as session:
-                    response = await session.post(
-                        url=self.settings.MWS_EMBEDDING_URL,
-                        headers={
-                            "Authorization": f"Bearer {self.settings.MWS_API_KEY}",
-                            "Content-Type": "application/json",
-                        },
-                        json={
-                            "model": self.embedding_model,
-                            "input": text
-                        }
-                    )
+                app_logger.debug("Generating embedding for text: {:.50}... using model {}", text, self.embedding_model)
+                async with self._get_session().post(
+                    url=self._embedding_url,
+                    headers=self._headers,
+                    json={
+                        "model": self.embedding_model,
+                        "input": text
+                    }
+                ) as response:
                     if response.status == 200:
-                        data = await response.json()
-                        if not isinstance(data, dict) or "data" not in data or not data["data"]:
-                            app_logger.error("MWS Embedding API response invalid or missing 'data' field")
-                            retries += 1
-                            await asyncio.sleep(2 ** retries)
-                            continue
-                        if "data" not in data or not isinstance(data["data"], list) or len(data["data"]) == 0:
-                            app_logger.error("MWS Embedding API response missing 'data' field or invalid format")
-                            retries += 1
-                            await asyncio.sleep(2 ** retries)
-                            continue
-                        if "embedding" not in data["data"][0] or not isinstance(data["data"][0]["embedding"], list):
+                        data = await read_json(response)
+                        items = data.get("data") if isinstance(data, dict) else None
+                        raw_embedding = items[0].get("embedding") if isinstance(items, list) and items and isinstance(items[0], dict) else None
+                        # A single C-level conversion both checks that every value is numeric and builds the vector
+                        try:
+                            embedding = np.asarray(raw_embedding, dtype=np.float32) if isinstance(raw_embedding, list) else None
+                        except (TypeError, ValueError):
+                            embedding = None
+                        if embedding is None or embedding.ndim != 1 or embedding.size == 0:
                             app_logger.error("MWS Embedding API response missing 'embedding' field or invalid format")
-                            retries += 1
-                            await asyncio.sleep(2 ** retries)
-                            continue
-                        embedding = data["data"][0]["embedding"]
-                        if not all(isinstance(x, (int, float)) for x in embedding):
-                            app_logger.error("MWS Embedding API returned invalid embedding values, not all numbers")
-                            retries += 1
-                            await asyncio.sleep(2 ** retries)
-                            continue
-                        if self.vector_size is None:
-                            self.vector_size = len(embedding)
-                            app_logger.info(f"Set vector size to {self.vector_size} from first embedding")
-                        elif len(embedding) != self.vector_size:
-                            app_logger.error(f"Embedding size {len(embedding)} mismatches expected {self.vector_size}")
-                            retries += 1
-                            await asyncio.sleep(2 ** retries)
-                            continue
-                        app_logger.debug(f"Successfully generated embedding for text: {text[:50]}... (length: {len(embedding)})")
-                        return embedding
+                        elif self.vector_size is not None and embedding.size != self.vector_size:
+                            app_logger.error(f"Embedding size {embedding.size} mismatches expected {self.vector_size}")
+                        else:
+                            if self.vector_size is None:
+                                self.vector_size = embedding.size
+                                app_logger.info(f"Set vector size to {self.vector_size} from first embedding")
+                            app_logger.debug("Successfully generated embedding for text: {:.50}... (length: {})", text, embedding.size)
+                            return embedding
+                    elif response.status in NON_RETRYABLE_STATUSES:
+                        app_logger.error(f"MWS Embedding API unrecoverable error {response.status} for text: {text[:50]}")
+                        return None
                     else:
                         app_logger.warning(f"MWS Embedding API failed with status {response.status}")
-                        retries += 1
-                        await asyncio.sleep(2 ** retries)
+                        retry_after = response.headers.get("Retry-After")
             except Exception as e:
                 app_logger.error(f"MWS Embedding API error for text '{text[:50]}...': {e}")
-                retries += 1
-                await asyncio.sleep(2 ** retries)
+            retries += 1
+            if retries < self.max_retries:
+                delay = backoff_delay(retries, retry_after)
+                if delay is None:
+                    app_logger.error("MWS Embedding API asked to retry the embedding request after {}s, longer than the retry backoff allows; giving up", retry_after)
+                    return None
+                await asyncio.sleep(delay)
         app_logger.error(f"Max retries reached for embedding generation for text: {text[:30]}...")
         return None
 
+    async def get_embeddings_batch(self, texts: List[str]) -> Optional[np.ndarray]:
+        """
+        Generate embeddings for a list of texts with a single request to the MWS embeddings API.
+        The OpenAI-compatible endpoint accepts an array as 'input', which collapses N round-trips into one for bulk indexing.
+        Returns a float32 matrix with one embedding row per input text, in input order, or None if the batch fails after retries.
+        """
+        retries = 0
+        while retries < self.max_retries:
+            retry_after = None
+            try:
+                app_logger.debug("Generating embeddings for batch of {} texts using model {}", len(texts), self.embedding_model)
+                async with self._get_session().post(
+                    url=self._embedding_url,
+                    headers=self._headers,
+                    json={
+                        "model": self.embedding_model,
+                        "input": texts
+                    }
+                ) as response:
+                    if response.status == 200:
+                        data = await read_json(response)
+                        items = data.get("data") if isinstance(data, dict) else None
+                        if not items or len(items) != len(texts):
+                            app_logger.error(f"MWS Embedding API returned {len(items) if items else 0} embeddings for batch of {len(texts)} texts")
+                        else:
+                            # Results carry their input position; order by it rather than trusting response ordering
+                            embeddings = np.asarray(
+                                [item["embedding"] for item in sorted(items, key=lambda item: item.get("index", 0))],
+                                dtype=np.float32
+                            )
+                            if self.vector_size is None:
+                                self.vector_size = embeddings.shape[1]
+                                app_logger.info(f"Set vector size to {self.vector_size} from first embedding")
+                            app_logger.debug("Successfully generated {} embeddings in one batch", len(embeddings))
+                            return embeddings
+                    elif response.status in NON_RETRYABLE_STATUSES:
+                        app_logger.error(f"MWS Embedding API unrecoverable error {response.status} for batch of {len(texts)} texts")
+                        return None
+                    else:
+                        app_logger.warning(f"MWS Embedding API failed with status {response.status} for batch of {len(texts)} texts")
+                        retry_after = response.headers.get("Retry-After")
+            except Exception as e:
+                app_logger.error(f"MWS Embedding API error for batch of {len(texts)} texts: {e}")
+            retries += 1
+            if retries < self.max_retries:
+                delay = backoff_delay(retries, retry_after)
+                if delay is None:
+                    app_logger.error("MWS Embedding API asked to retry the batch embedding request after {}s, longer than the retry backoff allows; giving up", retry_after)
+                    return None
+                await asyncio.sleep(delay)
+        app_logger.error(f"Max retries reached for batch embedding generation of {len(texts)} texts")
+        return None
+
     def generate_point_id(self, query_text: str, content_text: str = "") -> str:
         """Generate a unique ID for Qdrant points using a hash of query and content text for uniqueness."""
         combined = query_text + content_text
         return hashlib.md5(combined.encode('utf-8')).hexdigest()
 
-    async def query_vector_db(self, query_text: str, top_k: int = 3) -> List[Dict]:
+    async def query_vector_db(self, query_text: str, top_k: int = 3, payload_fields: Optional[List[str]] = None) -> List[Dict]:
         """
         Query the vector DB for relevant documents based on text similarity for knowledge retrieval.
         Returns a list of matched documents with content and relevance scores for the Knowledge Agent.
-        Optimized to retrieve only necessary payload fields.
+        Optimized to retrieve only necessary payload fields: when payload_fields is given, only those keys are loaded and sent back by Qdrant.
         """
         try:
-            app_logger.debug(f"Querying Vector DB for: {query_text[:30]}...")
+            app_logger.debug("Querying Vector DB for: {:.30}...", query_text)
+            cache_key = (top_k, tuple(payload_fields) if payload_fields else None)
             query_vector = await self.get_embedding(query_text)
             if query_vector is None:
                 app_logger.error("Failed to generate embedding for query text")
                 return []
 
-            search_result = await asyncio.to_thread(
-                self.client.search,
+            # Near-duplicate queries (e.g. differing only in word form) are answered from the semantic cache without a Qdrant search
+            query_cache = self.query_caches.get(cache_key)
+            if query_cache is None:
+                query_cache = self.query_caches[cache_key] = SemanticCache(
+                    maxsize=self.settings.QUERY_CACHE_SIZE,
+                    threshold=self.settings.QUERY_CACHE_SIMILARITY_THRESHOLD
+                )
+            cached = query_cache.get(query_vector)
+            if cached is not None:
+                app_logger.debug("Serving {} cached documents for query: {:.30}...", len(cached), query_text)
+                return cached
+
+            search_result = await self.client.search(
                 collection_name=self.collection_name,
                 query_vector=query_vector,
                 limit=top_k,
-                with_payload=True
+                with_payload=payload_fields if payload_fields else True,
+                with_vectors=False,
+                # Search on quantized vectors, then rescore an oversampled candidate set with the original vectors
+                search_params=SearchParams(
+                    hnsw_ef=64,
+                    exact=False,
+                    quantization=QuantizationSearchParams(rescore=True, oversampling=self.search_oversampling)
+                )
             )
             results = [
                 {
@@ -247,7 +505,9 @@ class VectorDBService:
                 }
                 for hit in search_result
             ]
-            app_logger.debug(f"Retrieved {len(results)} documents from Vector DB for query: {query_text[:30]}...")
+            app_logger.debug("Retrieved {} documents from Vector DB for query: {:.30}...", len(results), query_text)
+            if results:
+                query_cache.set(query_vector, results)
             return results
         except Exception as e:
             app_logger.error(f"Error querying Vector DB for query '{query_text[:30]}...': {e}")
@@ -264,6 +524,9 @@ class VectorDBService:
             app_logger.error("No phone number provided for storing conversation turn")
             return None
 
+        # Take the ordering key before the first await so turns keep their arrival order even when stored concurrently
+        turn_seq = next(_turn_seq)
+
         try:
             # Strictly enforce customer existence before storing history
             customer = await self.retrieve_customer(phone_number)
@@ -271,27 +534,31 @@ class VectorDBService:
                 app_logger.error(f"Cannot store turn: No customer found with phone number {phone_number}")
                 return None
 
-            app_logger.debug(f"Storing conversation turn for customer {phone_number}")
+            app_logger.debug("Storing conversation turn for customer {}", phone_number)
             content = f"User: {user_text}\nOperator: {operator_response}" if operator_response else f"User: {user_text}"
             embedding = await self.get_embedding(content)
             if embedding is None:
                 app_logger.error(f"Failed to generate embedding for turn for customer {phone_number}")
                 return None
 
-            point_id = hashlib.md5(f"{phone_number}_{timestamp}_{user_text}_{operator_response}".encode('utf-8')).hexdigest()
+            # Hash the id parts straight into BLAKE2b instead of formatting an intermediate string; 16 bytes give a UUID-shaped hex id
+            id_hash = hashlib.blake2b(digest_size=16)
+            for part in (phone_number, timestamp, user_text, operator_response):
+                id_hash.update(part.encode('utf-8'))
+                id_hash.update(b"\x00")
+            point_id = id_hash.hexdigest()
             point = PointStruct(
                 id=point_id,
-                vector=embedding,
+                vector=embedding.tolist(),
                 payload={
                     "phone_number": phone_number,
                     "user_text": user_text,
                     "operator_response": operator_response,
                     "timestamp": timestamp,
-                    "content": content
+                    "turn_seq": turn_seq
                 }
             )
-            await asyncio.to_thread(
-                self.client.upsert,
+            await self.client.upsert(
                 collection_name=self.history_collection_name,
                 points=[point]
             )
@@ -321,17 +588,16 @@ class VectorDBService:
                 app_logger.error(f"Cannot update turn: No customer found with phone number {phone_number}")
                 return False
 
-            search_result = await asyncio.to_thread(
-                self.client.scroll,
+            search_result = await self.client.scroll(
                 collection_name=self.history_collection_name,
-                scroll_filter={
-                    "must": [
-                        {"key": "phone_number", "match": {"value": phone_number}},
-                        {"key": "timestamp", "match": {"value": timestamp}}
+                scroll_filter=Filter(
+                    must=[
+                        FieldCondition(key="phone_number", match=MatchValue(value=phone_number)),
+                        FieldCondition(key="timestamp", match=MatchValue(value=timestamp))
                     ]
-                },
+                ),
                 limit=1,
-                with_payload=True,
+                with_payload=["user_text", "operator_response", "turn_seq"],
                 with_vectors=False  # Changed to False since vector is not used; new embedding will be generated
             )
             if not search_result[0]:
@@ -353,17 +619,16 @@ class VectorDBService:
 
             updated_point = PointStruct(
                 id=point.id,
-                vector=embedding,
+                vector=embedding.tolist(),
                 payload={
                     "phone_number": phone_number,
                     "user_text": user_text,
                     "operator_response": operator_response,
                     "timestamp": timestamp,
-                    "content": content
+                    "turn_seq": point.payload.get("turn_seq", 0)
                 }
             )
-            await asyncio.to_thread(
-                self.client.upsert,
+            await self.client.upsert(
                 collection_name=self.history_collection_name,
                 points=[updated_point]
             )
@@ -373,42 +638,51 @@ class VectorDBService:
             app_logger.error(f"Error updating conversation turn for customer {phone_number} at timestamp {timestamp}: {e}")
             return False
 
+    async def _fetch_history_points(self, phone_number: str, limit: int) -> list:
+        """
+        Fetch a customer's latest history points in chronological order, or an empty list if no customer profile exists.
+        Qdrant picks the most recent turns through the integer turn_seq index, newest first; they are then reversed.
+        Only the payload fields rendered into history are loaded, and no vectors.
+        """
+        # Validate customer existence before retrieval
+        customer = await self.retrieve_customer(phone_number)
+        if not customer:
+            app_logger.error(f"Cannot retrieve history: No customer found with phone number {phone_number}")
+            return []
+
+        app_logger.debug("Retrieving conversation history for customer {}", phone_number)
+        search_result = await self.client.scroll(
+            collection_name=self.history_collection_name,
+            scroll_filter=_phone_number_filter(phone_number),
+            limit=limit,
+            order_by=OrderBy(key="turn_seq", direction=Direction.DESC),
+            with_payload=_HISTORY_PAYLOAD_FIELDS,  # Only the fields rendered into history entries
+            with_vectors=False  # Optimization: Avoid retrieving vectors as they are not needed for history display
+        )
+        return search_result[0][::-1]
+
     async def retrieve_conversation_history(self, phone_number: str, limit: int = 10) -> List[Dict]:
         """
-        Retrieve conversation history for a customer by phone_number, limited to recent turns.
-        Validates customer existence and uses indexed field for performance. Sorts by timestamp for chronological order.
+        Retrieve conversation history for a customer by phone_number, limited to recent turns, in chronological order.
+        Validates customer existence and uses indexed field for performance.
         Returns an empty list if no customer profile exists.
         Assumes phone number is normalized to format 89XXXXXXXXX via model validation.
-        Optimized to avoid retrieving unnecessary vector data.
         Assigns sequence numbers for frontend ordering.
-        Splits turns into separate user and assistant entries.
+        Splits turns into separate user and assistant entries, which keep the stored turn's turn_seq.
         """
         if not phone_number:
             app_logger.error("No phone number provided for retrieving conversation history")
             return []
 
         try:
-            # Validate customer existence before retrieval
-            customer = await self.retrieve_customer(phone_number)
-            if not customer:
-                app_logger.error(f"Cannot retrieve history: No customer found with phone number {phone_number}")
-                return []
-
-            app_logger.debug(f"Retrieving conversation history for customer {phone_number}")
-            search_result = await asyncio.to_thread(
-                self.client.scroll,
-                collection_name=self.history_collection_name,
-                scroll_filter={"must": [{"key": "phone_number", "match": {"value": phone_number}}]},
-                limit=limit,
-                with_payload=True,
-                with_vectors=False  # Optimization: Avoid retrieving vectors as they are not needed for history display
-            )
+            points = await self._fetch_history_points(phone_number, limit)
             history = []
-            for point in search_result[0]:
+            for point in points:
                 user_text = point.payload.get("user_text", "").strip()
                 operator_response = point.payload.get("operator_response", "").strip()
                 timestamp = point.payload.get("timestamp", "")
-                phone = point.payload.get("phone_number", "")
+                turn_seq = point.payload.get("turn_seq", 0)
+                phone = phone_number  # Every point matched the phone_number filter, so it is not fetched
 
                 # Split into two entries if both user_text and operator_response are present
                 if user_text:
@@ -418,7 +692,8 @@ class VectorDBService:
                         "operator_response": "",
                         "timestamp": timestamp,
                         "role": "user",
-                        "sequence_number": 0
+                        "sequence_number": 0,
+                        "turn_seq": turn_seq
                     })
                 if operator_response:
                     history.append({
@@ -427,22 +702,23 @@ class VectorDBService:
                         "operator_response": operator_response,
                         "timestamp": timestamp,
                         "role": "assistant",
-                        "sequence_number": 0
+                        "sequence_number": 0,
+                        "turn_seq": turn_seq
                     })
                 # If neither is present, log for debugging
                 if not user_text and not operator_response:
-                    app_logger.debug(f"Empty history entry for customer {phone_number} at timestamp {timestamp}: Neither user_text nor operator_response present")
+                    app_logger.debug("Empty history entry for customer {} at timestamp {}: Neither user_text nor operator_response present", phone_number, timestamp)
                     history.append({
                         "phone_number": phone,
                         "user_text": "",
                         "operator_response": "",
                         "timestamp": timestamp,
                         "role": "unknown",
-                        "sequence_number": 0
+                        "sequence_number": 0,
+                        "turn_seq": turn_seq
                     })
 
-            # Sort by timestamp and assign sequence numbers for frontend ordering
-            history.sort(key=lambda x: x.get("timestamp", "0"), reverse=False)
+            # Assign sequence numbers for frontend ordering
             for index, entry in enumerate(history):
                 entry["sequence_number"] = index + 1
 
@@ -452,6 +728,56 @@ class VectorDBService:
             app_logger.error(f"Error retrieving conversation history for customer {phone_number}: {e}")
             return []
 
+    async def retrieve_conversation_columns(self, phone_number: str, limit: int = 10) -> Dict[str, List[str]]:
+        """
+        Retrieve the same entries as retrieve_conversation_history as parallel 'roles', 'contents' and 'timestamps' lists,
+        for callers that only scan roles and texts and have no use for the full entry structure.
+        Returns empty lists if no customer profile exists.
+        """
+        columns: Dict[str, List[str]] = {"roles": [], "contents": [], "timestamps": []}
+        if not phone_number:
+            app_logger.error("No phone number provided for retrieving conversation history")
+            return columns
+
+        try:
+            points = await self._fetch_history_points(phone_number, limit)
+        except Exception as e:
+            app_logger.error(f"Error retrieving conversation history for customer {phone_number}: {e}")
+            return columns
+        roles, contents, timestamps = columns["roles"], columns["contents"], columns["timestamps"]
+        for point in points:
+            user_text = point.payload.get("user_text", "").strip()
+            operator_response = point.payload.get("operator_response", "").strip()
+            timestamp = point.payload.get("timestamp", "")
+            if user_text:
+                roles.append("user")
+                contents.append(user_text)
+                timestamps.append(timestamp)
+            if operator_response:
+                roles.append("assistant")
+                contents.append(operator_response)
+                timestamps.append(timestamp)
+            if not user_text and not operator_response:
+                roles.append("unknown")
+                contents.append("")
+                timestamps.append(timestamp)
+        app_logger.info("Retrieved {} conversation turns for customer {}", len(roles), phone_number)
+        return columns
+
+    @staticmethod
+    def latest_unanswered_index(columns: Dict[str, List[str]]) -> Optional[int]:
+        """
+        Return the index of the most recent user entry in a columnar history that has no assistant entry
+        at the same timestamp, or None if every user message has been answered.
+        Answered timestamps are collected into a set first, so the scan is linear in the history length.
+        """
+        roles, contents, timestamps = columns["roles"], columns["contents"], columns["timestamps"]
+        answered = {ts for role, ts in zip(roles, timestamps) if role == "assistant"}
+        for index in range(len(roles) - 1, -1, -1):
+            if roles[index] == "user" and contents[index].strip() and timestamps[index] not in answered:
+                return index
+        return None
+
     async def get_latest_unanswered_turn(self, phone_number: str, limit: int = 50) -> Optional[Dict]:
         """
         Retrieve the most recent unanswered conversation turn for a customer.
@@ -462,13 +788,19 @@ class VectorDBService:
             return None
 
         try:
-            history = await self.retrieve_conversation_history(phone_number, limit)
-            for entry in reversed(history):
-                if entry["role"] == "user" and entry["user_text"].strip() and not any(
-                    e["timestamp"] == entry["timestamp"] and e["role"] == "assistant" for e in history
-                ):
-                    app_logger.info(f"Found latest unanswered turn for customer {phone_number} at timestamp {entry['timestamp']}")
-                    return entry
+            columns = await self.retrieve_conversation_columns(phone_number, limit)
+            index = self.latest_unanswered_index(columns)
+            if index is not None:
+                timestamp = columns["timestamps"][index]
+                app_logger.info(f"Found latest unanswered turn for customer {phone_number} at timestamp {timestamp}")
+                return {
+                    "phone_number": phone_number,
+                    "user_text": columns["contents"][index],
+                    "operator_response": "",
+                    "timestamp": timestamp,
+                    "role": "user",
+                    "sequence_number": index + 1
+                }
             app_logger.info(f"No unanswered turns found for customer {phone_number}")
             return None
         except Exception as e:
@@ -483,55 +815,91 @@ class VectorDBService:
         Assumes phone number is normalized to format 89XXXXXXXXX via model validation.
         """
         try:
-            app_logger.debug(f"Upserting customer profile for {customer.phone_number}")
-            # Use a dummy vector instead of generating an embedding since retrieval is payload-based
-            dummy_vector = [0.0] * self.vector_size if self.vector_size else [0.0] * 1024
+            app_logger.debug("Upserting customer profile for {}", customer.phone_number)
             point_id = self.generate_point_id(customer.phone_number)
-            # Use a dummy zero vector since Qdrant requires vectors for collections
-            dummy_vector = [0.0] * self.vector_size if self.vector_size else [0.0] * 1024
+            # Use a dummy zero vector instead of generating an embedding since retrieval is payload-based
+            dummy_vector = [0.0] * (self.vector_size if self.vector_size else 1024)
             point = PointStruct(
                 id=point_id,
                 vector=dummy_vector,  # Dummy vector as semantic search is not used for customers
                 payload=customer.dict()
             )
-            await asyncio.to_thread(
-                self.client.upsert,
+            await self.client.upsert(
                 collection_name=self.customers_collection_name,
                 points=[point]
             )
-            app_logger.info(f"Successfully upserted customer profile for {customer.phone_number} with dummy vector")
+            # A lookup still in flight may have read the old profile; dropping it keeps that result out of the cache
+            self._pending_customers.pop(customer.phone_number, None)
+            self.customer_cache.set(customer.phone_number, customer)
+            app_logger.info("Successfully upserted customer profile for {} with dummy vector", customer.phone_number)
             return True
         except Exception as e:
             app_logger.error(f"Error upserting customer profile for {customer.phone_number}: {e}")
             return False
 
+    async def replace_customer(self, customer: Customer) -> bool:
+        """
+        Replace an existing customer profile and drop all of its conversation history, e.g. for a reassigned number.
+        The profile point ID is derived from the phone number, so the upsert overwrites the old profile in place and
+        needs no separate delete; history is removed server-side by the indexed phone_number filter instead of scroll + delete.
+        Both requests are independent and run concurrently, so the update costs one Qdrant round-trip instead of several.
+        Returns True if both succeeded, False otherwise.
+        """
+        try:
+            upserted, _ = await asyncio.gather(
+                self.upsert_customer(customer),
+                self.client.delete(
+                    collection_name=self.history_collection_name,
+                    points_selector=_phone_number_filter(customer.phone_number)
+                )
+            )
+            app_logger.info("Deleted old history for customer {}", customer.phone_number)
+            return upserted
+        except Exception as e:
+            app_logger.error(f"Error replacing customer profile for {customer.phone_number}: {e}")
+            return False
+        finally:
+            # Also after a failed delete, since part of the history may already be gone
+            self.reset_customer_state(customer.phone_number)
+
     async def retrieve_customer(self, phone_number: str) -> Optional[Customer]:
         """
         Retrieve a customer profile by phone_number using indexed field for fast lookup.
         Returns Customer object if found, None otherwise.
         Assumes phone number is normalized to format 89XXXXXXXXX via model validation.
-        Optimized to avoid retrieving unnecessary vector data.
+        Found profiles are served from the in-process customer cache for CUSTOMER_CACHE_TTL seconds, and concurrent
+        lookups of the same number await a single Qdrant request. Callers must treat the returned profile as read-only.
         """
         if not phone_number:
             app_logger.error("No phone number provided for retrieving customer profile")
             return None
 
+        customer = self.customer_cache.get(phone_number)
+        if customer is not None:
+            return customer
+
+        return await single_flight(
+            self._pending_customers, phone_number, lambda: self._fetch_customer(phone_number),
+            on_result=lambda customer: self.customer_cache.set(phone_number, customer)
+        )
+
+    async def _fetch_customer(self, phone_number: str) -> Optional[Customer]:
+        """Read a customer profile from Qdrant, optimized to avoid retrieving unnecessary vector data."""
         try:
-            app_logger.debug(f"Retrieving customer profile for {phone_number}")
-            search_result = await asyncio.to_thread(
-                self.client.scroll,
+            app_logger.debug("Retrieving customer profile for {}", phone_number)
+            search_result = await self.client.scroll(
                 collection_name=self.customers_collection_name,
-                scroll_filter={"must": [{"key": "phone_number", "match": {"value": phone_number}}]},
+                scroll_filter=_phone_number_filter(phone_number),
                 limit=1,
                 with_payload=True,
                 with_vectors=False  # Optimization: Avoid retrieving vectors as they are not needed for customer data
             )
             if search_result[0]:
                 customer_data = search_result[0][0].payload
-                app_logger.info(f"Retrieved customer profile for {phone_number}")
+                app_logger.info("Retrieved customer profile for {}", phone_number)
                 return Customer(**customer_data)
             else:
-                app_logger.info(f"No customer found with phone number {phone_number}")
+                app_logger.info("No customer found with phone number {}", phone_number)
                 return None
         except Exception as e:
             app_logger.error(f"Error retrieving customer profile for {phone_number}: {e}")
@@ -547,21 +915,19 @@ class VectorDBService:
             app_logger.debug("Saving queue state to Qdrant")
             # Clear existing queue state data to avoid duplication or outdated entries
             try:
-                await asyncio.to_thread(
-                    self.client.delete_collection,
+                await self.client.delete_collection(
                     collection_name=self.queue_collection_name
                 )
-                app_logger.debug(f"Deleted existing collection {self.queue_collection_name} for fresh state save")
+                app_logger.debug("Deleted existing collection {} for fresh state save", self.queue_collection_name)
             except Exception as e:
                 app_logger.warning(f"Could not delete existing collection {self.queue_collection_name}: {str(e)}. Proceeding to recreate.")
             
             # Recreate the collection
-            await asyncio.to_thread(
-                self.client.create_collection,
+            await self.client.create_collection(
                 collection_name=self.queue_collection_name,
                 vectors_config=VectorParams(size=self.vector_size if self.vector_size else 1024, distance=Distance.COSINE)
             )
-            app_logger.debug(f"Recreated collection {self.queue_collection_name} for queue state")
+            app_logger.debug("Recreated collection {} for queue state", self.queue_collection_name)
 
             # Use a dummy vector since this is not for similarity search
             dummy_vector = [0.0] * (self.vector_size if self.vector_size else 1024)
@@ -574,8 +940,7 @@ class VectorDBService:
                     "active_conversation": active_conversation if active_conversation else ""
                 }
             )
-            await asyncio.to_thread(
-                self.client.upsert,
+            await self.client.upsert(
                 collection_name=self.queue_collection_name,
                 points=[point]
             )
@@ -593,8 +958,7 @@ class VectorDBService:
         """
         try:
             app_logger.debug("Retrieving queue state from Qdrant")
-            search_result = await asyncio.to_thread(
-                self.client.scroll,
+            search_result = await self.client.scroll(
                 collection_name=self.queue_collection_name,
                 limit=1,
                 with_payload=True,
@@ -620,8 +984,7 @@ class VectorDBService:
             # If collection doesn't exist or other error, ensure it's created for future saves
             if "not found" in str(e).lower():
                 app_logger.info(f"Creating queue_state collection as it does not exist")
-                await asyncio.to_thread(
-                    self.client.create_collection,
+                await self.client.create_collection(
                     collection_name=self.queue_collection_name,
                     vectors_config=VectorParams(size=self.vector_size if self.vector_size else 1024, distance=Distance.COSINE)
                 )
@@ -643,8 +1006,7 @@ class VectorDBService:
             offset = None
             batch_size = 1000
             while True:
-                result = await asyncio.to_thread(
-                    self.client.scroll,
+                result = await self.client.scroll(
                     collection_name=self.history_collection_name,
                     limit=batch_size,
                     offset=offset,
@@ -666,17 +1028,16 @@ class VectorDBService:
                 if not phone_number:
                     points_to_delete.append(point.id)
                     deleted_count += 1
-                    app_logger.debug(f"Marked for deletion: History entry with no phone_number (ID: {point.id})")
+                    app_logger.debug("Marked for deletion: History entry with no phone_number (ID: {})", point.id)
                     continue
                 customer = await self.retrieve_customer(phone_number)
                 if not customer:
                     points_to_delete.append(point.id)
                     deleted_count += 1
-                    app_logger.debug(f"Marked for deletion: Orphaned history entry for non-existent customer {phone_number} (ID: {point.id})")
+                    app_logger.debug("Marked for deletion: Orphaned history entry for non-existent customer {} (ID: {})", phone_number, point.id)
 
             if points_to_delete:
-                await asyncio.to_thread(
-                    self.client.delete,
+                await self.client.delete(
                     collection_name=self.history_collection_name,
                     points_selector=points_to_delete
                 )
@@ -713,22 +1074,22 @@ class VectorDBService:
             history_deleted = True  # Default to true if no history to delete
 
             # Delete customer profile
-            customer_search = await asyncio.to_thread(
-                self.client.scroll,
+            customer_search = await self.client.scroll(
                 collection_name=self.customers_collection_name,
-                scroll_filter={"must": [{"key": "phone_number", "match": {"value": phone_number}}]},
+                scroll_filter=_phone_number_filter(phone_number),
                 limit=1,
                 with_payload=False,  # Optimization: Minimal data retrieval
                 with_vectors=False
             )
             if customer_search[0]:
                 customer_id = customer_search[0][0].id
-                await asyncio.to_thread(
-                    self.client.delete,
+                await self.client.delete(
                     collection_name=self.customers_collection_name,
                     points_selector=[customer_id]
                 )
                 customer_deleted = True
+                self.customer_cache.pop(phone_number)
+                self._pending_customers.pop(phone_number, None)  # Keeps a lookup still in flight from re-caching the profile
                 app_logger.info(f"Deleted customer profile for {phone_number}")
             else:
                 app_logger.error(f"Failed to find customer profile for deletion for {phone_number}")
@@ -739,10 +1100,9 @@ class VectorDBService:
             offset = None
             batch_size = 1000
             while True:
-                result = await asyncio.to_thread(
-                    self.client.scroll,
+                result = await self.client.scroll(
                     collection_name=self.history_collection_name,
-                    scroll_filter={"must": [{"key": "phone_number", "match": {"value": phone_number}}]},
+                    scroll_filter=_phone_number_filter(phone_number),
                     limit=batch_size,
                     offset=offset,
                     with_payload=False,  # Optimization: Minimal data retrieval
@@ -755,15 +1115,18 @@ class VectorDBService:
                 offset = next_offset
 
             if history_points:
-                await asyncio.to_thread(
-                    self.client.delete,
-                    collection_name=self.history_collection_name,
-                    points_selector=history_points
-                )
+                try:
+                    await self.client.delete(
+                        collection_name=self.history_collection_name,
+                        points_selector=history_points
+                    )
+                finally:
+                    self.reset_customer_state(phone_number)
                 history_deleted = True
                 app_logger.info(f"Deleted {len(history_points)} history entries for customer {phone_number}")
             else:
                 app_logger.info(f"No history entries found for customer {phone_number}")
+                self.reset_customer_state(phone_number)
                 history_deleted = True
 
             if not customer_deleted:
@@ -0,0 +1,29 @@
+import random
+from typing import Optional
+from app.core.config import get_settings
+
+# Client errors that will fail the same way on every attempt, so retrying only adds latency
+NON_RETRYABLE_STATUSES = frozenset({400, 401, 403, 404, 422})
+
+_SETTINGS = get_settings()
+_JITTER = 0.25  # Max random seconds added to each delay so concurrent retries do not fire in lockstep
+
+
+def backoff_delay(attempt: int, retry_after: Optional[str] = None) -> Optional[float]:
+    """
+    Return the seconds to wait before retry number attempt (1-based) of a failed MWS API call.
+    Grows exponentially from RETRY_BACKOFF_BASE, capped at RETRY_BACKOFF_MAX, plus a small random jitter.
+    A numeric Retry-After header from a 429/503 response takes precedence and is honoured as sent. Returns None when it
+    exceeds RETRY_BACKOFF_MAX: retrying sooner than the server asked would only be rejected again and use up the remaining
+    attempts, so the caller should give up instead of blocking the request for that long.
+    """
+    delay = min(_SETTINGS.RETRY_BACKOFF_BASE * 2 ** (attempt - 1), _SETTINGS.RETRY_BACKOFF_MAX)
+    if retry_after:
+        try:
+            delay = max(float(retry_after), 0.0)
+        except ValueError:
+            pass  # HTTP-date form; fall back to the computed delay
+        else:
+            if delay > _SETTINGS.RETRY_BACKOFF_MAX:
+                return None
+    return delay + random.uniform(0, _JITTER)
@@ -0,0 +1,47 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+
+class LRUCache:
+    """
+    Minimal in-process LRU cache used by agents and services to avoid repeated network round-trips.
+    Backed by an OrderedDict so lookups, inserts and evictions are O(1).
+    Entries optionally expire ttl seconds after being set; expired entries are dropped lazily on lookup.
+    Not thread-safe by design: all callers run on the single asyncio event loop.
+    """
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for key (marking it as recently used) or None on a miss or an expired entry."""
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            return None
+        expires_at, value = self._data[key]
+        if self.ttl is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Insert or refresh a value, evicting the least recently used entry when the cache is full."""
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else 0.0
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        """Drop the entry for key, if any."""
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop all cached entries."""
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
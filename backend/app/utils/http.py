@@ -0,0 +1,15 @@
+import json
+from functools import partial
+from typing import Any
+import aiohttp
+
+# Request bodies carry Russian prompts; emitting UTF-8 instead of \uXXXX escapes cuts Cyrillic text to a third of the bytes
+json_dumps = partial(json.dumps, ensure_ascii=False, separators=(",", ":"))
+
+
+async def read_json(response: aiohttp.ClientResponse) -> Any:
+    """
+    Parse a JSON response body straight from its raw bytes.
+    Skips aiohttp's charset detection and intermediate str decode; json.loads detects UTF-8/16/32 from the bytes itself.
+    """
+    return json.loads(await response.read())
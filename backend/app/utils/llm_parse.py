@@ -0,0 +1,106 @@
+import json
+import re
+from itertools import islice
+from typing import Any, Iterator, Optional
+
+_DECODER = json.JSONDecoder()
+_JSON_START_RE = re.compile(r"[\[{]")
+_CLOSING_BRACKETS = {"[": "]", "{": "}"}
+_MAX_DECODE_ATTEMPTS = 8  # Bracket positions tried before giving up, so bracket-heavy prose cannot make parsing quadratic
+
+
+def parse_llm_json(response: str) -> Any:
+    """
+    Parse the first JSON object or array in an LLM response.
+    Decodes in place from the first '{' or '[', so markdown fences and any text around the JSON are skipped
+    without building cleaned-up copies of the response.
+    When that bracket does not start valid JSON (e.g. a stray '[' in leading prose or a broken outer object),
+    decoding is retried from the following brackets, which recovers the first well-formed value without another LLM call.
+    Raises json.JSONDecodeError when the response contains no valid JSON value, like json.loads.
+    """
+    first_error = None
+    for match in islice(_JSON_START_RE.finditer(response), _MAX_DECODE_ATTEMPTS):
+        try:
+            value, _ = _DECODER.raw_decode(response, match.start())
+            return value
+        except json.JSONDecodeError as e:
+            if first_error is None:
+                first_error = e
+    if first_error is not None:
+        raise first_error
+    raise json.JSONDecodeError("No JSON object or array in LLM response", response, 0)
+
+
+def iter_json_scalars(value: Any) -> Iterator[Any]:
+    """
+    Yield the strings, numbers, booleans and nulls of a decoded JSON value depth-first, in document order.
+    Lets agents recover their fields by value type when the model answered with valid JSON under unexpected key names or nesting.
+    """
+    if isinstance(value, dict):
+        value = value.values()
+    elif not isinstance(value, list):
+        yield value
+        return
+    for item in value:
+        yield from iter_json_scalars(item)
+
+
+def first_unit_score(value: Any, default: float) -> float:
+    """Return the first number in [0, 1] found in a decoded JSON value, or default when there is none."""
+    for scalar in iter_json_scalars(value):
+        if isinstance(scalar, (int, float)) and not isinstance(scalar, bool) and 0.0 <= scalar <= 1.0:
+            return float(scalar)
+    return default
+
+
+def extract_llm_json(response: str) -> Optional[str]:
+    """
+    Return the span of an LLM response from the first '{' or '[' to the last matching closing bracket, or None if there is none.
+    Strips markdown fences and surrounding text so the span can be decoded and validated in one pass by TypeAdapter.validate_json.
+    The span is not checked to be valid JSON; validation reports that.
+    """
+    match = _JSON_START_RE.search(response)
+    if match is None:
+        return None
+    end = response.rfind(_CLOSING_BRACKETS[match.group(0)])
+    if end < match.start():
+        return None
+    return response[match.start():end + 1]
+
+
+class JsonEndScanner:
+    """
+    Incremental scanner that reports when the first top-level JSON object or array in streamed text is complete.
+    Tracks bracket depth outside of string literals only, so braces inside JSON strings or escaped quotes do not end it early.
+    Text before the first '{' or '[' (e.g. a markdown fence) is skipped, matching parse_llm_json.
+    """
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.done = False
+
+    def feed(self, text: str) -> bool:
+        """Consume the next chunk of streamed text and return True once the first JSON value has been closed."""
+        if self.done:
+            return True
+        for char in text:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                if self.depth:
+                    self.in_string = True
+            elif char in "[{":
+                self.depth += 1
+            elif char in "]}":
+                if self.depth:
+                    self.depth -= 1
+                    if self.depth == 0:
+                        self.done = True
+                        return True
+        return False
@@ -1,14 +1,21 @@
 from loguru import logger
 import sys
+from app.core.config import get_settings
 
 # Configure logger with detailed formatting for debugging
+# The sink level comes from LOG_LEVEL so that debug records, and their lazy "{}" arguments, are discarded before formatting in production
+_LOG_LEVEL = get_settings().LOG_LEVEL.upper()
 logger.remove()
 logger.add(
     sys.stdout,
     format="{time:YYYY-MM-DD HH:mm:ss} | {level} | {module}:{function}:{line} - {message}",
-    level="DEBUG"
+    level=_LOG_LEVEL
 )
 
+# loguru has no isEnabledFor; the single sink's level is fixed here, so whether debug records are kept is known once.
+# Guards debug-only work that lazy arguments cannot skip, such as loops emitting one record per item.
+DEBUG_ENABLED = logger.level(_LOG_LEVEL).no <= logger.level("DEBUG").no
+
 # Custom logger instance for the application
 app_logger = logger
 
@@ -16,21 +23,21 @@ app_logger = logger
 def log_customer_creation(phone_number: str, success: bool, message: str = ""):
     """Log the status of customer creation or update operation."""
     status = "SUCCESS" if success else "FAILURE"
-    app_logger.info(f"Customer Creation | Phone: {phone_number} | Status: {status} | {message}")
+    app_logger.info("Customer Creation | Phone: {} | Status: {} | {}", phone_number, status, message)
 
 def log_customer_retrieval(phone_number: str, found: bool):
     """Log the status of customer retrieval operation."""
     status = "FOUND" if found else "NOT FOUND"
-    app_logger.info(f"Customer Retrieval | Phone: {phone_number} | Status: {status}")
+    app_logger.info("Customer Retrieval | Phone: {} | Status: {}", phone_number, status)
 
 def log_history_storage(phone_number: str, success: bool, message: str = ""):
     """Log the status of conversation history storage operation."""
     status = "SUCCESS" if success else "FAILURE"
-    app_logger.info(f"History Storage | Phone: {phone_number} | Status: {status} | {message}")
+    app_logger.info("History Storage | Phone: {} | Status: {} | {}", phone_number, status, message)
 
 def log_history_retrieval(phone_number: str, count: int):
     """Log the number of conversation history entries retrieved."""
-    app_logger.info(f"History Retrieval | Phone: {phone_number} | Entries Retrieved: {count}")
+    app_logger.info("History Retrieval | Phone: {} | Entries Retrieved: {}", phone_number, count)
 
 def log_message_processing(phone_number: str, status: str, message: str = ""):
     """Log the status of message processing operation."""
@@ -0,0 +1,21 @@
+import re
+from typing import Optional
+
+PHONE_NUMBER_ERROR = "Phone number must be 11 digits starting with '89' (format: 89XXXXXXXXX)."
+
+_NON_DIGITS_RE = re.compile(r"[^0-9]+")
+
+
+def normalize_phone_number(value: str) -> Optional[str]:
+    """
+    Reduce a phone number to its digits and return it if it is in format 89XXXXXXXXX, else None.
+    Shared by the request models and the path-parameter routes so every entry point accepts and normalizes numbers the same way.
+    Already-normalized input, the common case, is accepted by C-level string checks alone; anything else is
+    stripped of separators with one compiled regex pass instead of a per-character filter.
+    """
+    if len(value) == 11 and value.isascii() and value.isdigit() and value.startswith("89"):
+        return value
+    digits = _NON_DIGITS_RE.sub("", value)
+    if len(digits) != 11 or not digits.startswith("89"):
+        return None
+    return digits
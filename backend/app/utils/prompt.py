@@ -0,0 +1,72 @@
+from typing import List, Optional, Tuple
+from app.core.config import get_settings
+from app.models.schemas import HistoryEntry
+from app.utils.logger import app_logger
+
+MAX_TEXT_CHARS = 2000  # Upper bound on a message being analyzed when it is inlined into an agent prompt
+MAX_TURN_CHARS = 400  # Upper bound on each history message inlined into an agent prompt as context
+
+_SETTINGS = get_settings()
+_HISTORY_TOKEN_BUDGET = _SETTINGS.HISTORY_TOKEN_BUDGET
+_HISTORY_MAX_TURNS = _SETTINGS.HISTORY_MAX_TURNS
+
+
+def clip(text: str, limit: int) -> str:
+    """
+    Return text cut to at most limit characters so a single oversized message cannot blow up prompt size and LLM prefill.
+    Logs at debug level when clipping fires, so operators can tell that context was shortened.
+    """
+    if len(text) <= limit:
+        return text
+    app_logger.debug("Prompt text clipped from {} to {} characters: {:.50}...", len(text), limit, text)
+    return text[:limit]
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheaply estimate the number of LLM tokens in text without a tokenizer.
+    Counts about four ASCII characters per token and two per non-ASCII (e.g. Cyrillic) character, which BPE vocabularies
+    split much finer; the ASCII count comes from one C-level encode pass instead of a per-character loop.
+    """
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return ascii_chars // 4 + (len(text) - ascii_chars) // 2 + 1
+
+
+def recent_turns(history: Optional[List[HistoryEntry]], max_turns: int = _HISTORY_MAX_TURNS) -> List[Tuple[str, str]]:
+    """
+    Return the (client, operator) texts of the latest history turns, oldest first, clipped for inlining into a prompt.
+    Walks back from the newest turn and stops at max_turns or once the estimated size would exceed HISTORY_TOKEN_BUDGET,
+    so many short turns still fit while a few long ones cannot crowd the prompt; the newest turn is always kept.
+    Missing texts are replaced by the placeholders the agent prompts use.
+    """
+    turns: List[Tuple[str, str]] = []
+    total = 0
+    for turn in reversed(history[-max_turns:] if history else []):
+        user_text = clip(turn.user_text, MAX_TURN_CHARS) if turn.user_text else "Не указано"
+        op_response = clip(turn.operator_response, MAX_TURN_CHARS) if turn.operator_response else "Ответ оператора отсутствует"
+        total += estimate_tokens(user_text) + estimate_tokens(op_response)
+        if turns and total > _HISTORY_TOKEN_BUDGET:
+            break
+        turns.append((user_text, op_response))
+    turns.reverse()
+    return turns
+
+
+def older_turns(history: Optional[List[HistoryEntry]]) -> List[HistoryEntry]:
+    """
+    Return the history turns that recent_turns leaves out of the prompt, oldest first.
+    Uses the same turn and token budget cutoff, so every turn is either inlined into the prompt or left for the rolling summary.
+    A cutoff that falls between the user and assistant entries of one stored turn is moved past the assistant entry,
+    so the rolling summary always receives whole exchanges.
+    """
+    if not history:
+        return []
+    cutoff = len(history) - len(recent_turns(history))
+    if 0 < cutoff < len(history) and _is_reply_to(history[cutoff], history[cutoff - 1]):
+        cutoff += 1
+    return history[:cutoff]
+
+
+def _is_reply_to(entry: HistoryEntry, previous: HistoryEntry) -> bool:
+    """Tell whether entry is the assistant half of the stored turn whose user half is previous."""
+    return entry.role == "assistant" and previous.role == "user" and entry.turn_seq == previous.turn_seq
@@ -0,0 +1,60 @@
+from typing import Any, List, Optional
+import numpy as np
+
+
+class SemanticCache:
+    """
+    In-process similarity cache mapping embeddings to previously computed results.
+    Keeps up to maxsize L2-normalized vectors in one contiguous float32 matrix, so a lookup is a single
+    matrix-vector product against every cached entry; the oldest entry is overwritten once the cache is full.
+    Not thread-safe by design: all callers run on the single asyncio event loop.
+    """
+    def __init__(self, maxsize: int, threshold: float):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self._vectors: Optional[np.ndarray] = None  # Allocated on first insert, once the embedding dimension is known
+        self._values: List[Any] = [None] * maxsize
+        self._count = 0
+        self._next = 0
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        """Return vector as a unit-length float32 array so dot products are cosine similarities."""
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def get(self, vector: np.ndarray) -> Optional[Any]:
+        """Return the value of the most similar cached vector if its cosine similarity reaches the threshold, else None."""
+        if self._count == 0:
+            return None
+        query = self._normalize(vector)
+        if query.shape[0] != self._vectors.shape[1]:
+            return None
+        similarities = self._vectors[:self._count] @ query
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        return self._values[best]
+
+    def set(self, vector: np.ndarray, value: Any) -> None:
+        """Cache value under vector, overwriting the oldest entry when the cache is full."""
+        normalized = self._normalize(vector)
+        if self._vectors is None or self._vectors.shape[1] != normalized.shape[0]:
+            self._vectors = np.zeros((self.maxsize, normalized.shape[0]), dtype=np.float32)
+            self._values = [None] * self.maxsize
+            self._count = 0
+            self._next = 0
+        self._vectors[self._next] = normalized
+        self._values[self._next] = value
+        self._next = (self._next + 1) % self.maxsize
+        self._count = min(self._count + 1, self.maxsize)
+
+    def clear(self) -> None:
+        """Drop all cached entries."""
+        self._values = [None] * self.maxsize
+        self._count = 0
+        self._next = 0
+
+    def __len__(self) -> int:
+        return self._count
@@ -0,0 +1,40 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Coroutine, Dict, Hashable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+def single_flight(
+    inflight: Dict[Hashable, asyncio.Task],
+    key: Hashable,
+    factory: Callable[[], Coroutine[Any, Any, T]],
+    on_result: Optional[Callable[[T], None]] = None
+) -> Awaitable[T]:
+    """
+    Return an awaitable for the result of factory(), shared by every concurrent caller passing the same key.
+    The first caller starts factory() as its own task, registered in inflight until it finishes; later callers await that task.
+    Each caller awaits it through asyncio.shield, so a cancelled caller does not abort the request for the others sharing it.
+    on_result, if given, receives a successful non-None result once, e.g. to store it in a cache.
+    Removing the key from inflight while the task runs invalidates it: later callers start a fresh task and on_result is skipped,
+    so a result read before e.g. a delete is never cached after it.
+    """
+    task = inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(factory())
+        inflight[key] = task
+        task.add_done_callback(lambda done: _release(inflight, key, done, on_result))
+    return asyncio.shield(task)
+
+
+def _release(
+    inflight: Dict[Hashable, asyncio.Task],
+    key: Hashable,
+    task: asyncio.Task,
+    on_result: Optional[Callable[[Any], None]]
+) -> None:
+    """Unregister a finished task and hand on its result, unless its key was invalidated or taken over by a newer task meanwhile."""
+    if inflight.get(key) is not task:
+        return
+    del inflight[key]
+    if on_result is not None and not task.cancelled() and task.exception() is None and task.result() is not None:
+        on_result(task.result())
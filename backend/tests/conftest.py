@@ -0,0 +1,18 @@
+import os
+
+# Settings without defaults must be present before app modules call get_settings(); no test reaches these services
+for _name, _value in {
+    "MWS_API_KEY": "test-key",
+    "MWS_BASE_URL": "http://mws.test",
+    "QDRANT_URL": "http://qdrant.test:6333",
+    "KNOWLEDGE_COLLECTION_NAME": "knowledge_test",
+    "EMBEDDING_MODEL": "embedding-test",
+    "INTENT_MODEL": "llm-test",
+    "EMOTION_MODEL": "llm-test",
+    "KNOWLEDGE_MODEL": "llm-test",
+    "ACTION_MODEL": "llm-test",
+    "SUMMARY_MODEL": "llm-test",
+    "QA_MODEL": "llm-test",
+    "LOG_LEVEL": "WARNING",
+}.items():
+    os.environ.setdefault(_name, _value)
@@ -0,0 +1,32 @@
+import pytest
+
+from app.utils import backoff
+from app.utils.backoff import backoff_delay
+
+
+@pytest.fixture(autouse=True)
+def no_jitter(monkeypatch):
+    monkeypatch.setattr(backoff.random, "uniform", lambda low, high: 0.0)
+
+
+def test_backoff_grows_exponentially_up_to_cap(monkeypatch):
+    monkeypatch.setattr(backoff._SETTINGS, "RETRY_BACKOFF_BASE", 0.1)
+    monkeypatch.setattr(backoff._SETTINGS, "RETRY_BACKOFF_MAX", 0.5)
+    assert [backoff_delay(attempt) for attempt in (1, 2, 3, 4)] == pytest.approx([0.1, 0.2, 0.4, 0.5])
+
+
+def test_backoff_honours_retry_after_within_cap(monkeypatch):
+    monkeypatch.setattr(backoff._SETTINGS, "RETRY_BACKOFF_MAX", 5.0)
+    assert backoff_delay(1, "3") == pytest.approx(3.0)
+    assert backoff_delay(1, "-1") == pytest.approx(0.0)
+
+
+def test_backoff_gives_up_when_retry_after_exceeds_cap(monkeypatch):
+    monkeypatch.setattr(backoff._SETTINGS, "RETRY_BACKOFF_MAX", 5.0)
+    assert backoff_delay(1, "30") is None
+
+
+def test_backoff_ignores_http_date_retry_after(monkeypatch):
+    monkeypatch.setattr(backoff._SETTINGS, "RETRY_BACKOFF_BASE", 0.1)
+    monkeypatch.setattr(backoff._SETTINGS, "RETRY_BACKOFF_MAX", 5.0)
+    assert backoff_delay(2, "Wed, 21 Oct 2026 07:28:00 GMT") == pytest.approx(0.2)
@@ -0,0 +1,79 @@
+import numpy as np
+
+from app.utils import cache as cache_module
+from app.utils.cache import LRUCache
+from app.utils.semantic_cache import SemanticCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recently used entry
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_lru_cache_expires_entries_after_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    cache = LRUCache(maxsize=4, ttl=10.0)
+    cache.set("a", 1)
+
+    now[0] = 109.0
+    assert cache.get("a") == 1
+    now[0] = 110.0
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_lru_cache_pop_and_clear():
+    cache = LRUCache(maxsize=4)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.pop("a")
+    cache.pop("missing")
+    assert cache.get("a") is None
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_semantic_cache_applies_similarity_threshold():
+    cache = SemanticCache(maxsize=4, threshold=0.95)
+    cache.set(np.array([1.0, 0.0, 0.0]), "first")
+
+    assert cache.get(np.array([2.0, 0.1, 0.0])) == "first"  # Scale does not matter, cosine ~0.999
+    assert cache.get(np.array([1.0, 1.0, 0.0])) is None  # Cosine ~0.707
+    assert cache.get(np.array([1.0, 0.0])) is None  # Different embedding dimension
+
+
+def test_semantic_cache_returns_most_similar_entry():
+    cache = SemanticCache(maxsize=4, threshold=0.5)
+    cache.set(np.array([1.0, 0.0]), "x")
+    cache.set(np.array([0.0, 1.0]), "y")
+
+    assert cache.get(np.array([0.2, 1.0])) == "y"
+
+
+def test_semantic_cache_overwrites_oldest_entry_when_full():
+    cache = SemanticCache(maxsize=2, threshold=0.99)
+    cache.set(np.array([1.0, 0.0, 0.0]), "a")
+    cache.set(np.array([0.0, 1.0, 0.0]), "b")
+    cache.set(np.array([0.0, 0.0, 1.0]), "c")
+
+    assert len(cache) == 2
+    assert cache.get(np.array([1.0, 0.0, 0.0])) is None
+    assert cache.get(np.array([0.0, 1.0, 0.0])) == "b"
+    assert cache.get(np.array([0.0, 0.0, 1.0])) == "c"
+
+
+def test_semantic_cache_clear():
+    cache = SemanticCache(maxsize=2, threshold=0.9)
+    cache.set(np.array([1.0, 0.0]), "a")
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.get(np.array([1.0, 0.0])) is None
@@ -0,0 +1,105 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.models.schemas import AgentResponse
+from app.services import intent_cache as intent_cache_module
+from app.services.intent_cache import IntentCache, vector_db_service
+
+
+def _hits(*labels):
+    return [SimpleNamespace(score=score, payload={"intent": intent}) for intent, score in labels]
+
+
+@pytest.fixture
+def cache():
+    intent_cache = IntentCache()
+    intent_cache.knn_neighbors = 5
+    intent_cache.knn_min_votes = 3
+    intent_cache.knn_min_confidence = 0.75
+    return intent_cache
+
+
+def _search_returning(monkeypatch, hits):
+    calls = []
+
+    async def search(**kwargs):
+        calls.append(kwargs)
+        return hits
+
+    monkeypatch.setattr(vector_db_service.client, "search", search)
+    return calls
+
+
+@pytest.mark.asyncio
+async def test_vote_returns_weighted_majority_and_fills_exact_tier(cache, monkeypatch):
+    calls = _search_returning(monkeypatch, _hits(("billing", 0.95), ("billing", 0.9), ("billing", 0.9), ("tariff", 0.86)))
+
+    response = await cache.vote("вопрос по счёту", "ctx", np.ones(4, dtype=np.float32))
+
+    assert response.result == {"intent": "billing", "confidence": 0.76}
+    assert cache.exact_cache.get(cache._exact_key("вопрос по счёту", "ctx")) is response
+    # Labels the LLM was unsure about are excluded from the vote
+    assert calls[0]["query_filter"].must[0].key == "confidence"
+    assert calls[0]["query_filter"].must[0].range.gte == cache.knn_min_label_confidence
+
+
+@pytest.mark.asyncio
+async def test_vote_abstains_on_too_few_neighbors(cache, monkeypatch):
+    _search_returning(monkeypatch, _hits(("billing", 0.95), ("billing", 0.9)))
+
+    assert await cache.vote("вопрос", "ctx", np.ones(4, dtype=np.float32)) is None
+
+
+@pytest.mark.asyncio
+async def test_vote_abstains_on_split_labels(cache, monkeypatch):
+    _search_returning(monkeypatch, _hits(("billing", 0.9), ("tariff", 0.9), ("roaming", 0.9)))
+
+    assert await cache.vote("а по этому же?", "ctx", np.ones(4, dtype=np.float32)) is None
+    assert len(cache.exact_cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_vote_abstains_without_embedding_or_on_search_error(cache, monkeypatch):
+    assert await cache.vote("вопрос", "ctx", None) is None
+
+    async def search(**kwargs):
+        raise RuntimeError("Qdrant unavailable")
+
+    monkeypatch.setattr(vector_db_service.client, "search", search)
+    assert await cache.vote("вопрос", "ctx", np.ones(4, dtype=np.float32)) is None
+
+
+@pytest.mark.asyncio
+async def test_store_keeps_label_and_storage_time_but_not_message_text(cache, monkeypatch):
+    upserts = []
+
+    async def upsert(**kwargs):
+        upserts.append(kwargs)
+
+    monkeypatch.setattr(vector_db_service.client, "upsert", upsert)
+    response = AgentResponse(agent_name="IntentAgent", result={"intent": "billing", "confidence": 0.9}, confidence=0.9)
+
+    await cache.store("мой номер 89123456789", "ctx", response, np.ones(4, dtype=np.float32))
+
+    payload = upserts[0]["points"][0].payload
+    assert set(payload) == {"ctx", "intent", "confidence", "stored_at"}
+
+
+@pytest.mark.asyncio
+async def test_purge_expired_deletes_entries_older_than_ttl(cache, monkeypatch):
+    deletes = []
+
+    async def delete(**kwargs):
+        deletes.append(kwargs)
+
+    monkeypatch.setattr(vector_db_service.client, "delete", delete)
+    monkeypatch.setattr(intent_cache_module.time, "time", lambda: 1000.0)
+    cache.ttl = 100
+
+    await cache.purge_expired()
+
+    expired, unstamped = deletes[0]["points_selector"].should
+    assert expired.key == "stored_at" and expired.range.lt == 900
+    assert unstamped.is_empty.key == "stored_at"
@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+from app.utils.llm_parse import JsonEndScanner, extract_llm_json, first_unit_score, iter_json_scalars, parse_llm_json
+
+
+def test_parse_llm_json_skips_markdown_fence_and_prose():
+    response = 'Вот ответ:\n```json\n{"intent": "billing", "confidence": 0.9}\n```\nГотово.'
+    assert parse_llm_json(response) == {"intent": "billing", "confidence": 0.9}
+
+
+def test_parse_llm_json_retries_after_stray_bracket():
+    response = 'Категории [см. ниже] {"intent": "tariff", "confidence": 0.8}'
+    assert parse_llm_json(response) == {"intent": "tariff", "confidence": 0.8}
+
+
+def test_parse_llm_json_parses_arrays():
+    assert parse_llm_json('```\n[{"a": 1}, {"b": 2}]\n```') == [{"a": 1}, {"b": 2}]
+
+
+@pytest.mark.parametrize("response", ["нет JSON", "", "{broken", "[ { ]"])
+def test_parse_llm_json_raises_without_valid_json(response):
+    with pytest.raises(json.JSONDecodeError):
+        parse_llm_json(response)
+
+
+def test_iter_json_scalars_yields_leaves_in_document_order():
+    value = {"outer": {"label": "billing", "scores": [0.4, True]}, "note": None}
+    assert list(iter_json_scalars(value)) == ["billing", 0.4, True, None]
+
+
+def test_first_unit_score_ignores_booleans_and_out_of_range_numbers():
+    assert first_unit_score({"a": True, "b": 7, "c": {"d": 0.65}}, default=0.1) == 0.65
+    assert first_unit_score({"a": "x", "b": 2}, default=0.1) == 0.1
+
+
+def test_extract_llm_json_returns_span_between_outer_brackets():
+    assert extract_llm_json('```json\n{"a": {"b": 1}}\n```') == '{"a": {"b": 1}}'
+    assert extract_llm_json("no json here") is None
+    assert extract_llm_json("} then {") is None
+
+
+def test_json_end_scanner_detects_end_across_chunks():
+    scanner = JsonEndScanner()
+    chunks = ['```json\n{"feedback": "ok', '", "items": [1, ', '2]', '}', ' trailing']
+    completed = [scanner.feed(chunk) for chunk in chunks]
+    assert completed == [False, False, False, True, True]
+
+
+def test_json_end_scanner_ignores_brackets_inside_strings():
+    scanner = JsonEndScanner()
+    assert not scanner.feed('{"text": "скобка } и \\" кавычка {"')
+    assert scanner.feed("}")
+
+
+def test_json_end_scanner_skips_quotes_before_json():
+    scanner = JsonEndScanner()
+    assert not scanner.feed('Ответ "в кавычках": ')
+    assert scanner.feed('{"a": "}"}')
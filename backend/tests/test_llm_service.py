@@ -0,0 +1,35 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.llm_service import LLMService
+
+
+async def _lines(*events):
+    for event in events:
+        yield b"data: " + (event if isinstance(event, bytes) else json.dumps(event).encode("utf-8")) + b"\n"
+
+
+def _delta(content):
+    return {"choices": [{"delta": {"content": content}}]}
+
+
+@pytest.mark.asyncio
+async def test_read_until_json_returns_content_and_final_usage():
+    usage = {"prompt_tokens": 120, "prompt_tokens_details": {"cached_tokens": 96}}
+    response = SimpleNamespace(content=_lines(
+        _delta('{"intent": '), _delta('"billing"}'), {"choices": [{"delta": {}, "finish_reason": "stop"}]},
+        {"choices": [], "usage": usage}, b"[DONE]"
+    ))
+
+    assert await LLMService._read_until_json(response) == ('{"intent": "billing"}', usage)
+
+
+@pytest.mark.asyncio
+async def test_read_until_json_stops_at_content_past_the_json():
+    response = SimpleNamespace(content=_lines(
+        _delta('{"a": 1}'), _delta(" Пояснение"), {"choices": [], "usage": {"prompt_tokens": 5}}
+    ))
+
+    assert await LLMService._read_until_json(response) == ('{"a": 1}', None)
@@ -0,0 +1,34 @@
+import pytest
+from pydantic import ValidationError
+
+from app.models.schemas import Customer, UserMessageInput
+from app.utils.phone import normalize_phone_number
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("89123456789", "89123456789"),
+    ("8 (912) 345-67-89", "89123456789"),
+    ("8-912-345-67-89", "89123456789"),
+    ("79123456789", None),
+    ("8912345678", None),
+    ("891234567890", None),
+    ("", None),
+])
+def test_normalize_phone_number(value, expected):
+    assert normalize_phone_number(value) == expected
+
+
+def test_normalize_phone_number_rejects_non_ascii_digits():
+    assert normalize_phone_number("８９１２３４５６７８９") is None
+
+
+def test_phone_number_type_normalizes_model_fields():
+    message = UserMessageInput(phone_number="8 912 345 67 89", user_text="Привет")
+    assert message.phone_number == "89123456789"
+    assert Customer(phone_number="89123456789").phone_number == "89123456789"
+
+
+@pytest.mark.parametrize("value", ["79123456789", "12345", 89123456789])
+def test_phone_number_type_rejects_invalid_values(value):
+    with pytest.raises(ValidationError):
+        UserMessageInput(phone_number=value, user_text="Привет")
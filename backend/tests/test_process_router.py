@@ -0,0 +1,48 @@
+import pytest
+from fastapi import HTTPException
+
+from app.api.routers import process
+from app.models.schemas import UserMessageInput
+
+
+@pytest.mark.asyncio
+async def test_process_reports_failed_history_write(monkeypatch):
+    async def retrieve_customer(phone_number):
+        return object()
+
+    async def store_conversation_turn(**kwargs):
+        return None
+
+    monkeypatch.setattr(process.vector_db_service, "retrieve_customer", retrieve_customer)
+    monkeypatch.setattr(process.vector_db_service, "store_conversation_turn", store_conversation_turn)
+
+    with pytest.raises(HTTPException) as exc_info:
+        await process.handle_process_message(UserMessageInput(phone_number="89123456789", user_text="Не работает интернет"))
+
+    assert exc_info.value.status_code == 500
+    assert "89123456789" not in process.customer_queue
+
+
+@pytest.mark.asyncio
+async def test_process_returns_after_history_write_lands(monkeypatch):
+    stored = []
+
+    async def retrieve_customer(phone_number):
+        return object()
+
+    async def store_conversation_turn(**kwargs):
+        stored.append(kwargs)
+        return kwargs["timestamp"]
+
+    async def save_queue_state(queue, active_conversation):
+        return True
+
+    monkeypatch.setattr(process.vector_db_service, "retrieve_customer", retrieve_customer)
+    monkeypatch.setattr(process.vector_db_service, "store_conversation_turn", store_conversation_turn)
+    monkeypatch.setattr(process.vector_db_service, "save_queue_state", save_queue_state)
+    monkeypatch.setattr(process, "customer_queue", type(process.customer_queue)())
+
+    response = await process.handle_process_message(UserMessageInput(phone_number="89123456789", user_text="Не работает интернет"))
+
+    assert response.status == "success"
+    assert [entry["timestamp"] for entry in stored] == [response.timestamp]
@@ -0,0 +1,57 @@
+from app.models.schemas import HistoryEntry
+from app.utils import prompt
+from app.utils.prompt import estimate_tokens, older_turns, recent_turns
+
+
+def _turn(user_text: str, operator_response: str = "", timestamp: str = "") -> HistoryEntry:
+    return HistoryEntry(phone_number="89123456789", user_text=user_text, operator_response=operator_response, timestamp=timestamp)
+
+
+def test_estimate_tokens_weights_non_ascii_characters_higher():
+    assert estimate_tokens("") == 1
+    assert estimate_tokens("abcdefgh") == 3
+    assert estimate_tokens("абвгдежз") == 5
+    assert estimate_tokens("ab вг") == 2
+
+
+def test_recent_turns_keeps_latest_turns_in_order_with_placeholders():
+    history = [_turn("раз", "один"), _turn("два"), _turn("", "три")]
+    assert recent_turns(history) == [
+        ("раз", "один"),
+        ("два", "Ответ оператора отсутствует"),
+        ("Не указано", "три"),
+    ]
+    assert recent_turns(None) == []
+
+
+def test_recent_turns_respects_max_turns():
+    history = [_turn(f"сообщение {i}") for i in range(6)]
+    assert [user for user, _ in recent_turns(history, max_turns=2)] == ["сообщение 4", "сообщение 5"]
+
+
+def test_recent_turns_stops_at_token_budget_but_keeps_newest(monkeypatch):
+    monkeypatch.setattr(prompt, "_HISTORY_TOKEN_BUDGET", 30)
+    history = [_turn("a" * 100, "x"), _turn("b" * 40, "x"), _turn("c" * 40, "x")]
+    assert [user[0] for user, _ in recent_turns(history)] == ["b", "c"]
+
+    monkeypatch.setattr(prompt, "_HISTORY_TOKEN_BUDGET", 1)
+    assert [user[0] for user, _ in recent_turns(history)] == ["c"]
+
+
+def test_older_turns_complements_recent_turns(monkeypatch):
+    monkeypatch.setattr(prompt, "_HISTORY_TOKEN_BUDGET", 30)
+    history = [_turn("a" * 100, "x", "1"), _turn("b" * 40, "x", "2"), _turn("c" * 40, "x", "3")]
+    assert [turn.timestamp for turn in older_turns(history)] == ["1"]
+    assert len(older_turns(history)) + len(recent_turns(history)) == len(history)
+    assert older_turns([]) == []
+
+
+def test_older_turns_never_splits_a_user_and_assistant_pair(monkeypatch):
+    monkeypatch.setattr(prompt, "_HISTORY_TOKEN_BUDGET", 45)
+    history = [
+        HistoryEntry(phone_number="89123456789", user_text="a" * 100, role="user", turn_seq=1),
+        HistoryEntry(phone_number="89123456789", operator_response="b" * 40, role="assistant", turn_seq=1),
+        HistoryEntry(phone_number="89123456789", user_text="c" * 40, role="user", turn_seq=2),
+    ]
+    assert len(recent_turns(history)) == 2
+    assert older_turns(history) == history[:2]
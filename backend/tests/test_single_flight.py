@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from app.utils.single_flight import single_flight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_callers_share_one_call_and_cancellation_is_isolated():
+    inflight = {}
+    calls = []
+    results = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 42
+
+    first = asyncio.ensure_future(single_flight(inflight, "key", work, results.append))
+    second = asyncio.ensure_future(single_flight(inflight, "key", work, results.append))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    assert await second == 42
+    assert calls == [1]
+    assert results == [42]
+    assert inflight == {}
+
+
+@pytest.mark.asyncio
+async def test_failed_call_is_not_handed_on_and_is_released():
+    inflight = {}
+    results = []
+
+    async def work():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        await single_flight(inflight, "key", work, results.append)
+
+    assert results == []
+    assert inflight == {}
+
+
+@pytest.mark.asyncio
+async def test_invalidated_call_is_not_handed_on():
+    inflight = {}
+    results = []
+    release = asyncio.Event()
+
+    async def work():
+        await release.wait()
+        return "stale"
+
+    pending = asyncio.ensure_future(single_flight(inflight, "key", work, results.append))
+    await asyncio.sleep(0)
+    inflight.pop("key")  # e.g. the record was deleted while it was being read
+    release.set()
+
+    assert await pending == "stale"
+    assert results == []
+    assert inflight == {}
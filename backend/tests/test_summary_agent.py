@@ -0,0 +1,34 @@
+import pytest
+
+from app.agents import summary_agent
+from app.models.schemas import HistoryEntry
+
+
+def _entry(turn_seq: int, **texts) -> HistoryEntry:
+    return HistoryEntry(phone_number="89123456789", turn_seq=turn_seq, **texts)
+
+
+@pytest.mark.asyncio
+async def test_rolling_summary_tracks_coverage_by_turn_seq(monkeypatch):
+    prompts = []
+
+    async def fake_call_llm(prompt, **kwargs):
+        prompts.append(prompt)
+        return f"summary {len(prompts)}"
+
+    monkeypatch.setattr(summary_agent.llm_service, "call_llm", fake_call_llm)
+    summary_agent.forget_rolling_summary("89123456789")
+    # Listed out of storage order and with empty timestamps; the first stored turn has turn_seq 0
+    older = [_entry(5, user_text="b"), _entry(0, user_text="a"), _entry(0, operator_response="a0")]
+
+    assert summary_agent.rolling_summary("89123456789", older) is None
+    await summary_agent._ROLLING_UPDATES["89123456789"]
+    assert "a0" in prompts[0]
+
+    assert summary_agent.rolling_summary("89123456789", older) == "summary 1"
+    assert "89123456789" not in summary_agent._ROLLING_UPDATES  # Everything up to turn_seq 5 is covered
+
+    summary_agent.rolling_summary("89123456789", older + [_entry(6, user_text="c")])
+    await summary_agent._ROLLING_UPDATES["89123456789"]
+    assert "Клиент: c" in prompts[1] and "Клиент: b" not in prompts[1]
+    summary_agent.forget_rolling_summary("89123456789")
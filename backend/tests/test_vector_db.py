@@ -0,0 +1,107 @@
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.services.vector_db import VectorDBService, vector_db_service
+
+
+def test_latest_unanswered_index_finds_newest_unanswered_user_entry():
+    columns = {
+        "roles": ["user", "assistant", "user", "user"],
+        "contents": ["привет", "здравствуйте", "вопрос", "  "],
+        "timestamps": ["t1", "t1", "t2", "t3"],
+    }
+    assert VectorDBService.latest_unanswered_index(columns) == 2
+
+
+def test_latest_unanswered_index_returns_none_when_all_answered():
+    columns = {
+        "roles": ["user", "assistant"],
+        "contents": ["привет", "здравствуйте"],
+        "timestamps": ["t1", "t1"],
+    }
+    assert VectorDBService.latest_unanswered_index(columns) is None
+    assert VectorDBService.latest_unanswered_index({"roles": [], "contents": [], "timestamps": []}) is None
+
+
+@pytest.fixture
+def batcher(monkeypatch):
+    """The shared service with a fresh micro-batch queue and a wide window, so tests decide when batches flush."""
+    monkeypatch.setattr(vector_db_service, "_batch_window", 60.0)
+    monkeypatch.setattr(vector_db_service, "_batch_size", 3)
+    monkeypatch.setattr(vector_db_service, "_embedding_batch", [])
+    monkeypatch.setattr(vector_db_service, "_embedding_flush_handle", None)
+    return vector_db_service
+
+
+@pytest.mark.asyncio
+async def test_micro_batcher_fans_out_one_request_to_each_caller(batcher, monkeypatch):
+    requests = []
+
+    async def get_embeddings_batch(texts):
+        requests.append(list(texts))
+        return np.array([[float(i), 1.0] for i in range(len(texts))], dtype=np.float32)
+
+    monkeypatch.setattr(batcher, "get_embeddings_batch", get_embeddings_batch)
+
+    results = await asyncio.gather(*(batcher._embed_batched(text) for text in ["a", "b", "c"]))
+
+    assert requests == [["a", "b", "c"]]
+    assert [result.tolist() for result in results] == [[0.0, 1.0], [1.0, 1.0], [2.0, 1.0]]
+
+
+@pytest.mark.asyncio
+async def test_micro_batcher_retries_texts_one_by_one_when_the_batch_fails(batcher, monkeypatch):
+    async def get_embeddings_batch(texts):
+        raise RuntimeError("MWS rejected the batch")
+
+    async def request_embedding(text):
+        if text == "b":
+            raise RuntimeError("MWS rejected the text")
+        return None if text == "c" else np.array([1.0], dtype=np.float32)
+
+    monkeypatch.setattr(batcher, "get_embeddings_batch", get_embeddings_batch)
+    monkeypatch.setattr(batcher, "_request_embedding", request_embedding)
+
+    results = await asyncio.gather(*(batcher._embed_batched(text) for text in ["a", "b", "c"]))
+
+    assert results[0].tolist() == [1.0]
+    assert results[1:] == [None, None]
+
+
+@pytest.mark.asyncio
+async def test_micro_batcher_sends_single_text_through_single_request(batcher, monkeypatch):
+    monkeypatch.setattr(batcher, "_batch_window", 0.001)
+
+    async def request_embedding(text):
+        return np.array([3.0], dtype=np.float32)
+
+    monkeypatch.setattr(batcher, "_request_embedding", request_embedding)
+
+    result = await batcher._embed_batched("одно сообщение")
+
+    assert result.tolist() == [3.0]
+
+
+@pytest.mark.asyncio
+async def test_history_views_split_turns_into_matching_entries(monkeypatch):
+    points = [
+        SimpleNamespace(payload={"user_text": "привет", "operator_response": "здравствуйте", "timestamp": "t1"}),
+        SimpleNamespace(payload={"user_text": "вопрос", "operator_response": "", "timestamp": "t2"}),
+    ]
+
+    async def fetch_history_points(phone_number, limit):
+        return points
+
+    monkeypatch.setattr(vector_db_service, "_fetch_history_points", fetch_history_points)
+
+    history = await vector_db_service.retrieve_conversation_history("89123456789")
+    columns = await vector_db_service.retrieve_conversation_columns("89123456789")
+
+    assert [entry["role"] for entry in history] == columns["roles"] == ["user", "assistant", "user"]
+    assert [entry["sequence_number"] for entry in history] == [1, 2, 3]
+    assert columns["contents"] == ["привет", "здравствуйте", "вопрос"]
+    assert columns["timestamps"] == ["t1", "t1", "t2"]
+    assert VectorDBService.latest_unanswered_index(columns) == 2